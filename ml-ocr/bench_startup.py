@@ -0,0 +1,96 @@
+"""
+Import-time benchmark for the CLI entry point.
+
+Spawns fresh interpreters that `import main`, reports the median wall time and the
+slowest imports (via -X importtime), and fails if startup exceeds the target or if
+a heavy backend got imported eagerly.
+
+Usage:
+  python bench_startup.py --target-ms 50 --runs 7
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Modules that must only load once the stage needing them runs
+HEAVY_MODULES = ["cv2", "numpy", "pytesseract", "fitz", "openai", "requests", "tiktoken"]
+
+HERE = Path(__file__).parent.resolve()
+
+CHECK_SNIPPET = (
+    "import sys, main; "
+    f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+)
+
+
+def time_import(runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=HERE, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def baseline(runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], cwd=HERE, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def slowest_imports(top: int) -> list:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                          cwd=HERE, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI startup (import-time) benchmark")
+    parser.add_argument("--target-ms", type=float, default=50.0,
+                        help="Max allowed median startup over a bare interpreter")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    interp_ms = baseline(args.runs)
+    timings = time_import(args.runs)
+    median_ms = statistics.median(timings)
+    overhead_ms = median_ms - interp_ms
+
+    print(f"Interpreter baseline: {interp_ms:7.1f} ms")
+    print(f"import main (median): {median_ms:7.1f} ms  (+{overhead_ms:.1f} ms, target {args.target_ms:.0f} ms)")
+    print("\nSlowest imports (cumulative):")
+    for cumulative_us, name in slowest_imports(args.top):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    proc = subprocess.run([sys.executable, "-c", CHECK_SNIPPET], cwd=HERE,
+                          capture_output=True, text=True, check=True)
+    eager = [m for m in proc.stdout.strip().split(",") if m]
+
+    failed = False
+    if eager:
+        print(f"\nFAIL: heavy modules imported at startup: {', '.join(eager)}")
+        failed = True
+    if overhead_ms > args.target_ms:
+        print(f"\nFAIL: startup overhead {overhead_ms:.1f} ms exceeds target {args.target_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("\nOK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Bulk mode: run the pipeline over whole directory trees (e.g. organized/<table>/).
+
+- Documents are processed in parallel and each gets its own JSON result file.
+- Progress is appended to a JSONL manifest; re-running skips documents already
+  done with the same size and mtime, so a crashed run resumes where it stopped.
+  With --persist/--store a document is only recorded once its batch has been
+  committed there, so a crash never leaves it "done" but missing.
+- Work can be ordered (newest first, smallest first, ...).
+- Exact and near-duplicate documents can reuse an earlier result (--dedup).
+- Results can also go to a columnar Parquet store for analytics (--store).
+- Aggregate throughput is reported while running and at the end.
+
+Worker threads are used rather than processes: Tesseract runs as a subprocess
+and OpenCV releases the GIL, and threads share one LLM concurrency limiter.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
+
+from extract_text import SUPPORTED_IMAGE_EXTS
+from pipeline import run_pipeline
+
+logger = logging.getLogger(__name__)
+
+DOC_EXTS = SUPPORTED_IMAGE_EXTS | {'.pdf'}
+
+ORDERS = {
+    "newest": (lambda d: d["mtime"], True),
+    "oldest": (lambda d: d["mtime"], False),
+    "smallest": (lambda d: d["size"], False),
+    "largest": (lambda d: d["size"], True),
+    "name": (lambda d: d["path"], False),
+}
+
+
+def discover(roots: List[str]) -> List[Dict[str, Any]]:
+    """Every supported document under the given files/directories, with size and mtime."""
+    docs = []
+    for root in roots:
+        if os.path.isfile(root):
+            st = os.stat(root)
+            docs.append({"path": os.path.abspath(root), "root": os.path.dirname(os.path.abspath(root)),
+                         "size": st.st_size, "mtime": st.st_mtime})
+            continue
+        root_abs = os.path.abspath(root)
+        for dirpath, _, filenames in os.walk(root_abs):
+            for name in filenames:
+                if Path(name).suffix.lower() not in DOC_EXTS:
+                    continue
+                full = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                docs.append({"path": full, "root": root_abs, "size": st.st_size, "mtime": st.st_mtime})
+    return docs
+
+
+class Manifest:
+    """Append-only JSONL progress log; the last record per path wins."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from a crash
+                    self.records[rec["path"]] = rec
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def is_done(self, doc: Dict[str, Any]) -> bool:
+        rec = self.records.get(doc["path"])
+        return bool(rec and rec["status"] == "done"
+                    and rec.get("size") == doc["size"] and rec.get("mtime") == doc["mtime"])
+
+    def record(self, rec: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records[rec["path"]] = rec
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class Throughput:
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.bytes = 0
+        self.stage_totals: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, ok: bool, size: int, timings: Dict[str, float]) -> None:
+        with self._lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.bytes += size
+            for stage, secs in timings.items():
+                self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + secs
+
+    def report(self) -> str:
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            finished = self.done + self.failed
+            rate = finished / elapsed
+            eta = (self.total - finished) / rate if rate else float("inf")
+            stages = ", ".join(f"{k}={v / max(finished, 1):.2f}s"
+                               for k, v in self.stage_totals.items())
+            return (f"{finished}/{self.total} docs ({self.failed} failed) in {elapsed:.1f}s | "
+                    f"{rate:.2f} docs/s, {self.bytes / elapsed / 1e6:.2f} MB/s | ETA {eta:.0f}s | "
+                    f"avg per doc: {stages}")
+
+
+class _Durable:
+    """
+    Calls done(rec) once every batched sink holding the document (Postgres,
+    the result store) has committed it and _process has finished with rec.
+    A sink that couldn't write the document marks it failed.
+    """
+
+    def __init__(self, rec: Dict[str, Any], done: Optional[Callable[[Dict[str, Any]], None]]):
+        self.rec = rec
+        self.done = done
+        self.errors: List[str] = []
+        self._open = 1      # _process itself
+        self._lock = threading.Lock()
+
+    def hold(self) -> Callable[[Optional[str]], None]:
+        """An on_commit callback for one sink write."""
+        with self._lock:
+            self._open += 1
+        return self.ack
+
+    def ack(self, error: Optional[str] = None) -> None:
+        with self._lock:
+            if error:
+                self.errors.append(error)
+            self._open -= 1
+            if self._open:
+                return
+        if self.errors:
+            self.rec.update(status="failed", error="; ".join(self.errors))
+        if self.done is not None:
+            self.done(self.rec)
+
+
+def _output_path(doc: Dict[str, Any], out_dir: str) -> str:
+    rel = os.path.relpath(doc["path"], doc["root"])
+    return os.path.join(out_dir, os.path.basename(doc["root"]), rel + ".json")
+
+
+def _reuse(match: Dict[str, Any], doc: Dict[str, Any]) -> Dict[str, Any]:
+    with open(match["result_path"], "r", encoding="utf-8") as f:
+        result = json.load(f)
+    result.update(path=doc["path"], duplicate_of=match["duplicate_of"], match=match["match"],
+                  timings={})
+    return result
+
+
+def _process(doc: Dict[str, Any], out_dir: str, use_llm: bool, writer=None,
+             index=None, dedup=None, ocr_engine: Optional[str] = None,
+             ocr_pool=None, store=None,
+             done: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Process one document into its JSON result and every sink. done(rec) is
+    called once the record is final and durable: right away without batched
+    sinks, else when the writer / store batch holding it commits (possibly
+    from another worker's thread, or at close()).
+    """
+    started = time.perf_counter()
+    rec = {"path": doc["path"], "size": doc["size"], "mtime": doc["mtime"]}
+    durable = _Durable(rec, done)
+    try:
+        match = dedup.lookup(doc["path"]) if dedup is not None else None
+        lookup_secs = round(time.perf_counter() - started, 3)
+        if match and match["match"] in ("exact", "near"):
+            result = _reuse(match, doc)
+            rec["duplicate_of"] = match["duplicate_of"]
+        else:
+            result = run_pipeline(doc["path"], use_llm=use_llm, ocr_engine=ocr_engine,
+                                  ocr_pool=ocr_pool)
+        if match:
+            result["timings"]["dedup"] = lookup_secs
+        if writer is not None:
+            writer.add(result, on_commit=durable.hold())
+        if index is not None:
+            index.add(result, size=doc["size"], mtime=doc["mtime"])
+        if store is not None:
+            store.add(result, on_commit=durable.hold())
+            # Word boxes live in the store; they would multiply the size of the JSON result
+            for page in result.get("page_info", []):
+                page.pop("words", None)
+        out_path = _output_path(doc, out_dir)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        tmp = out_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, out_path)
+        if match:
+            dedup.add(doc["path"], out_path, match["signature"])
+        rec.update(status="done", output=out_path, timings=result["timings"])
+    except Exception as e:
+        logger.exception(f"Failed: {doc['path']}")
+        rec.update(status="failed", error=f"{type(e).__name__}: {e}", timings={})
+        if writer is not None:
+            writer.add({"path": doc["path"]}, error=rec["error"], on_commit=durable.hold())
+        if store is not None:
+            store.add({"path": doc["path"]}, error=rec["error"], on_commit=durable.hold())
+    rec["elapsed"] = round(time.perf_counter() - started, 3)
+    durable.ack()
+    return rec
+
+
+def run_bulk(
+    roots: List[str],
+    out_dir: str,
+    workers: int = 4,
+    order: str = "newest",
+    manifest_path: Optional[str] = None,
+    use_llm: bool = True,
+    report_every: int = 25,
+    persist_root: Optional[str] = None,
+    persist: bool = False,
+    index_path: Optional[str] = None,
+    dedup: bool = False,
+    ocr_engine: Optional[str] = None,
+    ocr_processes: int = 0,
+    store_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    persist: also upsert results into Postgres (persist.py); paths are stored
+    relative to persist_root so they match rfq_documents.path.
+    index_path: also add each result to this full-text index (search_index.py).
+    dedup: reuse the result of an exact or near-duplicate document processed
+    earlier (dedup.py, index kept in <out_dir>/dedup.db) instead of running OCR.
+    Duplicates processed at the same moment by two workers are both OCR'd.
+    ocr_engine: OCR engine for every document (ocr_engines.py); None = default.
+    ocr_processes: OCR pages in this many worker processes fed through shared
+    memory (page_store.py); the worker threads then render and run the rest.
+    Workers OCR one page at a time, so OCR_CONFIG["batch_size"] doesn't apply.
+    store_path: also write results, with word boxes, to this Parquet store
+    (result_store.py).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(manifest_path or os.path.join(out_dir, "manifest.jsonl"))
+    writer = None
+    if persist:
+        from persist import ResultWriter
+        writer = ResultWriter(root=persist_root)
+    index = None
+    if index_path:
+        from search_index import SearchIndex
+        index = SearchIndex(index_path)
+    dedup_index = None
+    if dedup:
+        from dedup import DedupIndex
+        dedup_index = DedupIndex(os.path.join(out_dir, "dedup.db"), ocr_engine=ocr_engine)
+    store = None
+    if store_path:
+        from ocr_engines import OCR_CONFIG
+        from result_store import ResultStore
+        store = ResultStore(store_path)
+        OCR_CONFIG["word_boxes"] = True     # Before the OCR pool starts, so its workers see it
+    ocr_pool = None
+    if ocr_processes:
+        from page_store import PageOCRPool
+        ocr_pool = PageOCRPool(ocr_processes)
+
+    docs = discover(roots)
+    key, reverse = ORDERS[order]
+    docs.sort(key=key, reverse=reverse)
+    todo = [d for d in docs if not manifest.is_done(d)]
+    logger.info(f"Found {len(docs)} documents, {len(docs) - len(todo)} already done, "
+                f"{len(todo)} to process with {workers} workers ({order} first)")
+
+    stats = Throughput(len(todo))
+
+    def finish(rec: Dict[str, Any]) -> None:
+        manifest.record(rec)
+        stats.add(rec["status"] == "done", rec["size"], rec["timings"])
+        if (stats.done + stats.failed) % report_every == 0:
+            logger.info(stats.report())
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as pool:
+            # Submit in priority order; the pool's FIFO queue preserves it
+            futures = [pool.submit(_process, d, out_dir, use_llm, writer, index,
+                                   dedup_index, ocr_engine, ocr_pool, store, finish) for d in todo]
+            for future in as_completed(futures):
+                future.result()
+    finally:
+        try:
+            # Last batches: their documents are recorded as these commit
+            if writer is not None:
+                writer.close()
+            if store is not None:
+                store.close()
+        finally:
+            manifest.close()
+            if index is not None:
+                index.close()
+            if dedup_index is not None:
+                dedup_index.close()
+            if ocr_pool is not None:
+                ocr_pool.close()
+
+    logger.info(f"Bulk run finished: {stats.report()}")
+    return {"total": len(docs), "skipped": len(docs) - len(todo),
+            "done": stats.done, "failed": stats.failed}
@@ -0,0 +1,235 @@
+"""
+Adaptive (AIMD) concurrency limiting for LLM backends.
+
+Each backend gets one shared limiter. The in-flight limit grows by ~1 per
+window of successful calls and is cut multiplicatively on 429/503s, errors, or
+when latency climbs well above the best latency seen recently (the server is
+queueing). Callers wait in FIFO order, and an optional tokens-per-minute
+bucket holds requests back until the budget has refilled.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here (no signature changes needed)
+LIMITER_CONFIG = {
+    "openai": {
+        "initial_limit": 8,
+        "min_limit": 1,
+        "max_limit": 64,
+        "tokens_per_minute": 200000,  # Match the account's TPM limit
+    },
+    "local": {
+        "initial_limit": 2,
+        "min_limit": 1,
+        "max_limit": 16,
+        "tokens_per_minute": None,    # A local server has no token quota
+    },
+    "default": {
+        "initial_limit": 4,
+        "min_limit": 1,
+        "max_limit": 32,
+        "tokens_per_minute": None,
+    },
+}
+
+AIMD = {
+    "backoff": 0.5,             # Multiplicative decrease factor
+    "latency_tolerance": 2.0,   # Latency above best * tolerance counts as congestion
+    "latency_window": 100,      # Recent latencies considered for the baseline
+    "decrease_cooldown": 1.0,   # Seconds; one cut per congestion episode
+}
+
+OVERLOAD_STATUS = (429, 503)
+
+
+def is_overload(exc: BaseException) -> bool:
+    """True for rate-limit / overload responses from either the OpenAI SDK or requests."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status in OVERLOAD_STATUS
+
+
+class TokenBucket:
+    """Tokens-per-minute budget, refilled continuously, bursting up to one minute's worth."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.level = self.capacity
+        self._stamp = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait_time(self, tokens: int) -> float:
+        self._refill()
+        # A request bigger than the whole bucket goes through once the bucket is full
+        needed = min(float(tokens), self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def take(self, tokens: int) -> None:
+        self._refill()
+        self.level -= tokens
+
+    def refund(self, tokens: int) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + tokens)
+
+
+class Permit:
+    """Handed out by AdaptiveLimiter.slot(); set tokens_used once actual usage is known."""
+
+    def __init__(self, reserved_tokens: int):
+        self.reserved_tokens = reserved_tokens
+        self.tokens_used: Optional[int] = None
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, initial_limit: int = 4, min_limit: int = 1,
+                 max_limit: int = 32, tokens_per_minute: Optional[int] = None):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._latencies = deque(maxlen=AIMD["latency_window"])
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> Permit:
+        """Block in FIFO order until a slot (and, if configured, token budget) is free."""
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    wait_for = None
+                    if self._queue[0] is ticket and self._in_flight < self.limit:
+                        wait_for = self._bucket.wait_time(tokens) if self._bucket else 0.0
+                        if wait_for <= 0:
+                            break
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(f"Timed out waiting for '{self.name}' LLM slot")
+                        wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                    self._cond.wait(wait_for)
+                self._queue.popleft()
+                self._in_flight += 1
+                if self._bucket:
+                    self._bucket.take(tokens)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                raise
+            finally:
+                self._cond.notify_all()
+        return Permit(tokens)
+
+    def release(self, permit: Permit, outcome: str, latency: float) -> None:
+        """outcome: "ok", "overload", "error" or "cancelled" (no signal either way)."""
+        with self._cond:
+            self._in_flight -= 1
+            if self._bucket and permit.tokens_used is not None:
+                self._bucket.refund(permit.reserved_tokens - permit.tokens_used)
+            if outcome == "ok":
+                # Compare latency per 1k tokens so long documents don't read as congestion
+                if permit.tokens_used:
+                    latency = latency * 1000.0 / permit.tokens_used
+                self._on_success(latency)
+            elif outcome in ("overload", "error"):
+                self._decrease(outcome)
+            self._cond.notify_all()
+
+    def _on_success(self, latency: float) -> None:
+        self._latencies.append(latency)
+        best = min(self._latencies)
+        if len(self._latencies) >= 5 and latency > best * AIMD["latency_tolerance"]:
+            self._decrease("latency")
+            return
+        # Additive increase: about +1 once a full window of calls has succeeded
+        self._limit = min(float(self.max_limit), self._limit + 1.0 / max(self._limit, 1.0))
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < AIMD["decrease_cooldown"]:
+            return
+        self._last_decrease = now
+        before = self.limit
+        self._limit = max(float(self.min_limit), self._limit * AIMD["backoff"])
+        logger.info(f"[{self.name}] concurrency {before} -> {self.limit} ({reason})")
+
+    @contextmanager
+    def slot(self, tokens: int = 0, timeout: Optional[float] = None,
+             neutral: Tuple[type, ...] = ()):
+        """
+        with limiter.slot(tokens=estimate) as permit:
+            ...call the backend...
+            permit.tokens_used = actual
+
+        Exceptions in `neutral` (e.g. a cancelled hedge) release the slot without
+        counting as a failure.
+        """
+        permit = self.acquire(tokens, timeout)
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            yield permit
+        except BaseException as e:
+            if is_overload(e):
+                outcome = "overload"
+            elif neutral and isinstance(e, neutral):
+                outcome = "cancelled"
+            else:
+                outcome = "error"
+            raise
+        finally:
+            self.release(permit, outcome, time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "tokens_available": int(self._bucket.level) if self._bucket else None,
+            }
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> AdaptiveLimiter:
+    """Process-wide limiter per backend, so every caller shares the same backpressure."""
+    with _limiters_lock:
+        if name not in _limiters:
+            cfg = LIMITER_CONFIG.get(name, LIMITER_CONFIG["default"])
+            _limiters[name] = AdaptiveLimiter(name, **cfg)
+        return _limiters[name]
+
+
+def limiter_snapshots() -> List[Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [lim.snapshot() for lim in limiters]
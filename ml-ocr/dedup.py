@@ -0,0 +1,401 @@
+"""
+Duplicate detection before OCR, so identical or rescanned uploads reuse an
+earlier result instead of paying for OCR and the LLM again.
+
+The file organizers copy the same upload under several names (`_id{id}`,
+`_rfq{rfq_id}_id{row_id}` suffixes) and vendors re-upload rescans, so two
+signatures are kept per document:
+
+- sha256 of the file bytes: exact copies, whatever they are called.
+- a 256-bit difference hash (dHash) per page, rendered at low resolution:
+  rescans, recompressed or re-exported copies. Candidates are found through
+  8-bit bands of the first page's hash (a page within 31 bits is guaranteed
+  to share a band), then every page is compared.
+- a MinHash of the PDF text layer, when there is one, and a digest of the
+  numbers in it. Page thumbnails can't tell two letters on the same template
+  apart, and neither can text similarity when only the tender ID, dates or
+  amounts differ, so text-layer documents must match on thumbnails, text
+  similarity and every number.
+
+Scans have no text layer, so a thumbnail match there is only a candidate: the
+page with the most text in the earlier result is OCR'd in the new document and
+must read the same (close overall, every number and identifier equal) before
+the result is reused. Without that check (`scan`) such matches are reported as
+"near_unverified" and never reused.
+
+  python dedup.py scan organized/          # report duplicate groups
+"""
+import argparse
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+from extract_text import SUPPORTED_IMAGE_EXTS, _load_fitz, ocr_image, render_page, resolve_path
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here
+DEDUP = {
+    "hash_zoom": 0.5,           # Render scale for page hashes (~36 DPI, plenty for a 17x16 thumbnail)
+    "max_distance": 12,         # Max differing bits (of 256) per page to call two pages the same
+    "min_text_similarity": 0.9, # Min estimated Jaccard of word 5-grams when both have a text layer
+    "min_text_chars": 200,      # Less text layer than this counts as a scan
+    "minhash_perms": 64,
+    "max_pages": 50,            # Pages hashed per document; longer documents compare on these
+    "min_ocr_agreement": 0.97,  # Min similarity of the OCR'd check page to the earlier result's
+    "min_verify_chars": 50,     # A check page with less text than this can't confirm a scan match
+    "max_changed_words": 0,     # Words in only one reading with no look-alike in the other (names)
+    "chunk_size": 1024 * 1024,  # Bytes per read while hashing file content
+}
+
+HASH_SIDE = 16
+BANDS = HASH_SIDE * HASH_SIDE // 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER,
+    page_hashes TEXT,
+    minhash TEXT,
+    numbers TEXT,
+    result_path TEXT,
+    added_at REAL
+);
+CREATE INDEX IF NOT EXISTS docs_sha256_idx ON docs (sha256);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_idx ON bands (band, value);
+"""
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DEDUP["chunk_size"]), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dhash(gray) -> int:
+    """256-bit difference hash: is each pixel brighter than its right neighbour (17x16 thumbnail)."""
+    import cv2
+    import numpy as np
+
+    small = cv2.resize(gray, (HASH_SIDE + 1, HASH_SIDE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def page_signals(path: str):
+    """(dHash per page, text layer) for the first DEDUP['max_pages'] pages; images have no text."""
+    import cv2
+    import numpy as np
+
+    p = resolve_path(path)
+    ext = p.suffix.lower()
+    if ext in SUPPORTED_IMAGE_EXTS:
+        gray = cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError(f"Failed to read image file via OpenCV: {p}")
+        return [dhash(gray)], ""
+    if ext != ".pdf":
+        raise ValueError(f"Unsupported file extension: {ext}")
+
+    fitz = _load_fitz()
+    mat = fitz.Matrix(DEDUP["hash_zoom"], DEDUP["hash_zoom"])
+    hashes, texts = [], []
+    with fitz.open(str(p)) as doc:
+        for page_num in range(min(doc.page_count, DEDUP["max_pages"])):
+            page = doc.load_page(page_num)
+            pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+            gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+            hashes.append(dhash(gray))
+            texts.append(page.get_text())
+    return hashes, "\n".join(texts)
+
+
+def _perm_params():
+    import numpy as np
+
+    rng = np.random.default_rng(0x5EED)  # Fixed: signatures must stay comparable across runs
+    a = rng.integers(1, 2 ** 63, DEDUP["minhash_perms"], dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2 ** 63, DEDUP["minhash_perms"], dtype=np.uint64)
+    return a, b
+
+
+def text_minhash(text: str) -> Optional[List[int]]:
+    """MinHash over word 5-grams, or None when there is too little text to judge."""
+    import numpy as np
+
+    words = re.findall(r"\w+", text.lower())
+    if len(text.strip()) < DEDUP["min_text_chars"] or len(words) < 5:
+        return None
+    shingles = {" ".join(words[i:i + 5]) for i in range(len(words) - 4)}
+    x = np.array([int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+                  for s in shingles], dtype=np.uint64)
+    a, b = _perm_params()
+    # Odd multipliers make x*a+b (mod 2**64) a permutation; overflow is the modulo
+    with np.errstate(over="ignore"):
+        mins = (np.outer(x, a) + b).min(axis=0)
+    return [int(v) for v in mins]
+
+
+def text_similarity(a: List[int], b: List[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / max(len(a), 1)
+
+
+def _bands(h: int) -> List[int]:
+    return [(h >> (8 * i)) & 0xFF for i in range(BANDS)]
+
+
+def _distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def same_pages(a: List[int], b: List[int], max_distance: Optional[int] = None) -> bool:
+    limit = DEDUP["max_distance"] if max_distance is None else max_distance
+    return len(a) == len(b) and bool(a) and all(_distance(x, y) <= limit for x, y in zip(a, b))
+
+
+def is_near_duplicate(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """
+    Thumbnails match and, when both have a text layer, so do the text and
+    every number in it; thumbnail-only matches still need verify_scan.
+    """
+    if not same_pages(a["page_hashes"], b["page_hashes"]):
+        return False
+    if a.get("minhash") and b.get("minhash"):
+        # Entries indexed before numbers were kept have no digest: not comparable
+        return (bool(a.get("numbers")) and a.get("numbers") == b.get("numbers")
+                and text_similarity(a["minhash"], b["minhash"]) >= DEDUP["min_text_similarity"])
+    return True
+
+
+def needs_verify(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """A near match decided on thumbnails alone, which same-template letters also pass."""
+    return not (a.get("minhash") and b.get("minhash"))
+
+
+def _numbers(text: str) -> List[str]:
+    return sorted(re.findall(r"\w*\d\w*", text.lower()))
+
+
+def numbers_digest(text: str) -> str:
+    """sha256 of every number and identifier in text, order-independent."""
+    return hashlib.sha256("\n".join(_numbers(text)).encode("utf-8")).hexdigest()
+
+
+def _changed_words(a: str, b: str) -> int:
+    """Words of a missing from b that aren't a misreading of one of b's (and vice versa)."""
+    wa = Counter(re.findall(r"[^\W\d_]{3,}", a.lower()))
+    wb = Counter(re.findall(r"[^\W\d_]{3,}", b.lower()))
+    changed = 0
+    for only, other in ((wa - wb, list(wb - wa)), (wb - wa, list(wa - wb))):
+        changed += sum(n for w, n in only.items()
+                       if not difflib.get_close_matches(w, other, n=1, cutoff=0.75))
+    return changed
+
+
+def same_text(a: str, b: str) -> bool:
+    """
+    Whether two readings of a page say the same: nearly equal, identical numbers
+    and IDs, and every other differing word explained by an OCR misread.
+    """
+    from ocr_engines import agreement
+
+    return (_numbers(a) == _numbers(b) and agreement(a, b) >= DEDUP["min_ocr_agreement"]
+            and _changed_words(a, b) <= DEDUP["max_changed_words"])
+
+
+def _render(path: str, page_num: int):
+    import cv2
+    from ocr_engines import OCR_CONFIG
+
+    p = resolve_path(path)
+    if p.suffix.lower() in SUPPORTED_IMAGE_EXTS:
+        img = cv2.imread(str(p))
+        if img is None:
+            raise ValueError(f"Failed to read image file via OpenCV: {p}")
+        return img
+    fitz = _load_fitz()
+    with fitz.open(str(p)) as doc:
+        return render_page(doc.load_page(page_num), OCR_CONFIG["zoom"])
+
+
+def verify_scan(path: str, result_path: str, engine: Optional[str] = None) -> bool:
+    """
+    OCR the page of path that has the most text in the earlier result and
+    compare the two readings. Costs one page of OCR instead of the document's.
+    """
+    with open(result_path, "r", encoding="utf-8") as f:
+        pages = json.load(f).get("pages") or []
+    pages = pages[:DEDUP["max_pages"]]
+    if not pages:
+        return False
+    page_num = max(range(len(pages)), key=lambda i: len(pages[i].strip()))
+    if len(pages[page_num].strip()) < DEDUP["min_verify_chars"]:
+        return False
+    return same_text(ocr_image(_render(path, page_num), engine), pages[page_num])
+
+
+class DedupIndex:
+    """
+    index = DedupIndex("results/dedup.db")
+    match = index.lookup(path)             # before OCR
+    if match["match"]: reuse match["result_path"]
+    else: run OCR, write the result, then
+    index.add(path, result_path, match["signature"])
+
+    lookup() returns the computed signature under "signature" even on a miss,
+    so add() doesn't hash the file twice. ocr_engine is used for the one-page
+    check of scan matches (verify_scan).
+    """
+
+    def __init__(self, db_path: str, ocr_engine: Optional[str] = None):
+        self.ocr_engine = ocr_engine
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(docs)")}
+        if "numbers" not in columns:
+            self.conn.execute("ALTER TABLE docs ADD COLUMN numbers TEXT")
+            self.conn.commit()
+        self._lock = threading.Lock()
+
+    def signature(self, path: str) -> Dict[str, Any]:
+        sig: Dict[str, Any] = {"sha256": file_sha256(path), "size": os.path.getsize(path)}
+        try:
+            sig["page_hashes"], text = page_signals(path)
+            sig["minhash"] = text_minhash(text)
+            sig["numbers"] = numbers_digest(text) if sig["minhash"] else None
+        except Exception as e:
+            # Exact matching still works for files we can't render
+            logger.warning(f"No page hashes for {path}: {e}")
+            sig.update(page_hashes=[], minhash=None, numbers=None)
+        return sig
+
+    def lookup(self, path: str, signature: Optional[Dict[str, Any]] = None,
+               verify: bool = True) -> Dict[str, Any]:
+        """
+        {"match": "exact"|"near"|"near_unverified"|None, "duplicate_of", "result_path",
+        "signature"}. Only entries whose result file still exists count as matches.
+        Thumbnail-only matches are checked with verify_scan; with verify=False
+        they come back as "near_unverified", which callers must not reuse.
+        """
+        sig = signature or self.signature(path)
+        out = {"match": None, "duplicate_of": None, "result_path": None, "signature": sig}
+        unverified = []
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, result_path FROM docs WHERE sha256 = ? AND path != ?",
+                (sig["sha256"], path)).fetchall()
+            for other, result_path in rows:
+                if result_path and os.path.exists(result_path):
+                    out.update(match="exact", duplicate_of=other, result_path=result_path)
+                    return out
+
+            hashes = sig["page_hashes"]
+            if not hashes:
+                return out
+            clauses = " OR ".join("(band = ? AND value = ?)" for _ in range(BANDS))
+            params = [x for i, v in enumerate(_bands(hashes[0])) for x in (i, v)]
+            candidates = {r[0] for r in self.conn.execute(
+                f"SELECT DISTINCT path FROM bands WHERE {clauses}", params)}
+            candidates.discard(path)
+            for other in sorted(candidates):
+                row = self.conn.execute(
+                    "SELECT page_hashes, minhash, numbers, result_path FROM docs WHERE path = ?",
+                    (other,)).fetchone()
+                if row is None or not row[3] or not os.path.exists(row[3]):
+                    continue
+                other_sig = {"page_hashes": [int(h, 16) for h in json.loads(row[0] or "[]")],
+                             "minhash": json.loads(row[1]) if row[1] else None,
+                             "numbers": row[2]}
+                if not is_near_duplicate(sig, other_sig):
+                    continue
+                if not needs_verify(sig, other_sig):
+                    out.update(match="near", duplicate_of=other, result_path=row[3])
+                    return out
+                unverified.append((other, row[3]))
+
+        # OCR outside the lock so other workers' lookups aren't held up
+        for other, result_path in unverified:
+            if not verify:
+                out.update(match="near_unverified", duplicate_of=other, result_path=result_path)
+                return out
+            try:
+                if verify_scan(path, result_path, self.ocr_engine):
+                    out.update(match="near", duplicate_of=other, result_path=result_path)
+                    return out
+            except Exception as e:
+                logger.warning(f"Could not verify {path} against {other}: {e}")
+            logger.info(f"{path} looks like {other} but reads differently; not reusing it")
+        return out
+
+    def add(self, path: str, result_path: Optional[str], signature: Dict[str, Any]) -> None:
+        hashes = signature.get("page_hashes") or []
+        with self._lock:
+            self.conn.execute("DELETE FROM bands WHERE path = ?", (path,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO docs (path, sha256, size, page_hashes, minhash, numbers, "
+                "result_path, added_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, signature["sha256"], signature.get("size"),
+                 json.dumps([f"{h:064x}" for h in hashes]),
+                 json.dumps(signature["minhash"]) if signature.get("minhash") else None,
+                 signature.get("numbers"), result_path, time.time()))
+            if hashes:
+                self.conn.executemany("INSERT INTO bands (band, value, path) VALUES (?, ?, ?)",
+                                      [(i, v, path) for i, v in enumerate(_bands(hashes[0]))])
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def scan(roots: List[str]) -> List[Dict[str, Any]]:
+    """Group the documents under roots into exact and near-duplicate sets (no OCR)."""
+    from bulk import discover
+
+    index = DedupIndex(":memory:")
+    groups: Dict[str, Dict[str, Any]] = {}
+    for doc in discover(roots):
+        found = index.lookup(doc["path"], verify=False)
+        if found["match"]:
+            group = groups.setdefault(found["duplicate_of"], {"original": found["duplicate_of"],
+                                                              "duplicates": []})
+            group["duplicates"].append({"path": doc["path"], "match": found["match"]})
+        else:
+            # result_path is only used for reuse; the file itself stands in for it here
+            index.add(doc["path"], doc["path"], found["signature"])
+    index.close()
+    return list(groups.values())
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Find exact and near-duplicate documents")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan_cmd = sub.add_parser("scan", help="Report duplicate groups under the given paths")
+    scan_cmd.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    groups = scan(args.paths)
+    print(json.dumps(groups, indent=2, ensure_ascii=False))
+    dupes = sum(len(g["duplicates"]) for g in groups)
+    logger.info(f"{len(groups)} documents have duplicates; {dupes} copies could skip OCR")
+
+
+if __name__ == "__main__":
+    main()
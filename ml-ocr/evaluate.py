@@ -0,0 +1,381 @@
+"""
+Accuracy vs speed/cost evaluation of OCR, cleanup and LLM settings on a labeled corpus.
+
+Corpus: a directory of documents, each with optional sidecar labels
+  invoice.pdf
+  invoice.txt     ground-truth text (for CER / WER)
+  invoice.json    expected fields, e.g. {"buyer": "AIIMS Delhi", "tender_id": "..."}
+
+Grid: JSON mapping setting -> list of values; every combination is run.
+  zoom        OCR render scale (OCR_CONFIG['zoom'])
+  lang        Tesseract languages (OCR_CONFIG['tesseract_lang'])
+  engine      OCR engine (ocr_engines.ENGINES)
+  preprocess  dict of pre_process.CONFIG overrides
+  llm_model   backend:model for the LLM stages, e.g. "openai:gpt-4o-mini" or
+              "local:llama3.1:8b"; that backend alone serves the run (no
+              fallback). null runs without the LLM
+
+Per configuration: CER and WER of the final text (and CER of the raw OCR),
+field accuracy, mean / p95 latency per document and LLM cost per document.
+Configurations that no other beats on every one of CER, field accuracy,
+latency and cost form the Pareto frontier. OCR output is reused across
+configurations that share zoom, lang and engine (its time is still counted).
+
+  python evaluate.py corpus/ --grid grid.json --out eval-report.json
+  python evaluate.py corpus/ --max-cer 0.05 --min-field-accuracy 0.9   # exit 1 if nothing qualifies
+"""
+import argparse
+import difflib
+import itertools
+import json
+import logging
+import os
+import re
+import statistics
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRID = {
+    "zoom": [1.5, 2.0],
+    "lang": ["eng", "eng+hin"],
+    "preprocess": [{}],
+    "llm_model": [None],
+}
+
+# USD per 1M tokens (input, cached input, output). Keep in line with the account's price sheet;
+# models not listed (self-hosted) cost nothing.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+
+FIELD_MATCH_RATIO = 0.9     # String fields count as correct at this similarity or above
+NUMBER_TOLERANCE = 0.01     # Relative tolerance for numeric fields
+
+
+# --- metrics ---
+
+def edit_distance(a: Sequence, b: Sequence) -> int:
+    """Levenshtein distance; one numpy pass per element of a, O(len(a) * len(b)) total."""
+    import numpy as np
+
+    if not a:
+        return len(b)
+    if not b:
+        return len(a)
+    # Characters or words -> small ints, so a row compares in one vector op
+    codes: Dict[Any, int] = {}
+    b_ids = np.array([codes.setdefault(t, len(codes)) for t in b])
+    a_ids = [codes.get(t, -1) for t in a]
+    n = len(b_ids)
+    offsets = np.arange(n + 1)
+    prev = offsets.copy()
+    for i, ca in enumerate(a_ids, start=1):
+        cur = np.empty(n + 1, dtype=prev.dtype)
+        cur[0] = i
+        # Deletion or substitution from the previous row...
+        cur[1:] = np.minimum(prev[1:] + 1, prev[:-1] + (b_ids != ca))
+        # ...then insertions along the row: cur[j] = min_k<=j (cur[k] + j - k)
+        cur = np.minimum.accumulate(cur - offsets) + offsets
+        prev = cur
+    return int(prev[-1])
+
+
+def _norm_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def cer(hypothesis: str, reference: str) -> float:
+    ref = _norm_text(reference)
+    return edit_distance(_norm_text(hypothesis), ref) / max(1, len(ref))
+
+
+def wer(hypothesis: str, reference: str) -> float:
+    ref = _norm_text(reference).lower().split()
+    return edit_distance(_norm_text(hypothesis).lower().split(), ref) / max(1, len(ref))
+
+
+def _norm_value(value: Any) -> str:
+    return re.sub(r"[^\w@.]+", " ", str(value).lower()).strip()
+
+
+def field_matches(expected: Any, actual: Any) -> bool:
+    if actual in (None, ""):
+        return expected in (None, "")
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        try:
+            actual = float(str(actual).replace(",", ""))
+        except ValueError:
+            return False
+        return abs(actual - expected) <= NUMBER_TOLERANCE * max(1.0, abs(expected))
+    e, a = _norm_value(expected), _norm_value(actual)
+    return e == a or difflib.SequenceMatcher(None, e, a).ratio() >= FIELD_MATCH_RATIO
+
+
+def llm_cost(calls: List[Dict[str, Any]]) -> float:
+    total = 0.0
+    for c in calls:
+        price = MODEL_PRICES.get(c["model"])
+        if price is None:
+            continue
+        fresh = max(0, c["prompt_tokens"] - c["cached_tokens"])
+        total += (fresh * price[0] + c["cached_tokens"] * price[1] + c["completion_tokens"] * price[2]) / 1e6
+    return total
+
+
+# --- corpus and grid ---
+
+def load_corpus(root: str) -> List[Dict[str, Any]]:
+    from bulk import DOC_EXTS
+
+    docs = []
+    for path in sorted(Path(root).rglob("*")):
+        if path.suffix.lower() not in DOC_EXTS:
+            continue
+        doc: Dict[str, Any] = {"path": str(path)}
+        gt = path.with_suffix(".txt")
+        if gt.exists():
+            doc["text"] = gt.read_text(encoding="utf-8")
+        fields = path.with_suffix(".json")
+        if fields.exists():
+            doc["fields"] = json.loads(fields.read_text(encoding="utf-8"))
+        if "text" in doc or "fields" in doc:
+            docs.append(doc)
+    return docs
+
+
+LLM_BACKENDS = ("openai", "local")
+
+
+def llm_backend(value: str) -> tuple:
+    """'openai:gpt-4o-mini' -> ('openai', 'gpt-4o-mini'); local model names may contain ':'."""
+    backend, _, model = value.partition(":")
+    if backend not in LLM_BACKENDS or not model:
+        raise ValueError(f"llm_model must be backend:model with backend one of {LLM_BACKENDS}, "
+                         f"got {value!r}")
+    return backend, model
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def config_name(config: Dict[str, Any]) -> str:
+    parts = []
+    for key, value in config.items():
+        if isinstance(value, dict):
+            value = ",".join(f"{k}={v}" for k, v in sorted(value.items())) or "default"
+        parts.append(f"{key}={value}")
+    return " ".join(parts)
+
+
+@contextmanager
+def applied(config: Dict[str, Any]) -> Iterator[bool]:
+    """Apply one grid point to the module configs; yields use_llm. Restores everything after."""
+    import llm_backends
+    from ocr_engines import OCR_CONFIG
+    from pre_process import CONFIG
+
+    saved_ocr, saved_pre, saved_router = dict(OCR_CONFIG), dict(CONFIG), dict(llm_backends.ROUTER_CONFIG)
+    try:
+        if "zoom" in config:
+            OCR_CONFIG["zoom"] = config["zoom"]
+        if "lang" in config:
+            OCR_CONFIG["tesseract_lang"] = config["lang"]
+        if "engine" in config:
+            OCR_CONFIG["engine"] = config["engine"]
+        CONFIG.update(config.get("preprocess") or {})
+        value = config.get("llm_model")
+        if value:
+            # Only the named backend, so the run measures that model and nothing it falls back to
+            backend, model = llm_backend(value)
+            llm_backends.ROUTER_CONFIG.update({"mode": "single", "order": [backend],
+                                               f"{backend}_model": model})
+            llm_backends._router = None     # Rebuilt with the new model on first use
+        yield bool(value)
+    finally:
+        OCR_CONFIG.update(saved_ocr)
+        CONFIG.clear()
+        CONFIG.update(saved_pre)
+        llm_backends.ROUTER_CONFIG.update(saved_router)
+        llm_backends._router = None
+
+
+# --- running ---
+
+def evaluate_doc(doc: Dict[str, Any], use_llm: bool, ocr_cache: Dict[str, Any], ocr_key: tuple) -> Dict[str, Any]:
+    from pipeline import run_pipeline
+    from token_budget import ledger
+
+    ledger.reset()
+    cached = ocr_cache.get((ocr_key, doc["path"]))
+    started = time.perf_counter()
+    result = run_pipeline(doc["path"], use_llm=use_llm, ocr_result=cached)
+    latency = time.perf_counter() - started
+    if cached is None:
+        ocr_cache[(ocr_key, doc["path"])] = {k: result[k] for k in ("pages", "page_info", "ocr_engine")}
+        ocr_cache[(ocr_key, doc["path"])]["seconds"] = result["timings"]["ocr"]
+    else:
+        latency += cached["seconds"] - result["timings"]["ocr"]
+
+    row: Dict[str, Any] = {"path": doc["path"], "latency": round(latency, 3),
+                           "cost": llm_cost(ledger.as_records())}
+    if "text" in doc:
+        row["cer"] = cer(result.get("cleaned_text", ""), doc["text"])
+        row["wer"] = wer(result.get("cleaned_text", ""), doc["text"])
+        row["cer_ocr"] = cer(result.get("raw_text", ""), doc["text"])
+    if "fields" in doc:
+        actual = result.get("fields") or {}
+        checks = {k: field_matches(v, actual.get(k)) for k, v in doc["fields"].items()}
+        row["fields_correct"] = sum(checks.values())
+        row["fields_total"] = len(checks)
+        row["field_errors"] = [k for k, ok in checks.items() if not ok]
+    return row
+
+
+def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def mean(key):
+        values = [r[key] for r in rows if key in r]
+        return round(statistics.mean(values), 4) if values else None
+
+    latencies = sorted(r["latency"] for r in rows)
+    total_fields = sum(r.get("fields_total", 0) for r in rows)
+    return {
+        "docs": len(rows),
+        "cer": mean("cer"),
+        "wer": mean("wer"),
+        "cer_ocr": mean("cer_ocr"),
+        "field_accuracy": round(sum(r.get("fields_correct", 0) for r in rows) / total_fields, 4)
+        if total_fields else None,
+        "latency_mean": round(statistics.mean(latencies), 3) if latencies else None,
+        "latency_p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+        "cost_per_doc": round(statistics.mean(r["cost"] for r in rows), 6) if rows else None,
+    }
+
+
+# Objective -> True if larger is better
+OBJECTIVES = {"cer": False, "field_accuracy": True, "latency_mean": False, "cost_per_doc": False}
+
+
+def pareto_front(summaries: List[Dict[str, Any]]) -> List[int]:
+    """Indexes of configurations not dominated on OBJECTIVES (missing metrics are ignored)."""
+    def value(s, key):
+        v = s[key]
+        return None if v is None else (v if OBJECTIVES[key] else -v)
+
+    front = []
+    for i, a in enumerate(summaries):
+        dominated = False
+        for j, b in enumerate(summaries):
+            if i == j:
+                continue
+            pairs = [(value(b, k), value(a, k)) for k in OBJECTIVES
+                     if value(a, k) is not None and value(b, k) is not None]
+            if pairs and all(vb >= va for vb, va in pairs) and any(vb > va for vb, va in pairs):
+                dominated = True
+                break
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def run_grid(docs: List[Dict[str, Any]], configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    ocr_cache: Dict[Any, Any] = {}
+    reports = []
+    for n, config in enumerate(configs, start=1):
+        name = config_name(config)
+        logger.info(f"[{n}/{len(configs)}] {name}")
+        rows = []
+        with applied(config) as use_llm:
+            ocr_key = (config.get("zoom"), config.get("lang"), config.get("engine"))
+            for doc in docs:
+                try:
+                    rows.append(evaluate_doc(doc, use_llm, ocr_cache, ocr_key))
+                except Exception as e:
+                    logger.exception(f"Failed: {doc['path']}")
+                    rows.append({"path": doc["path"], "error": f"{type(e).__name__}: {e}",
+                                 "latency": 0.0, "cost": 0.0})
+        ok = [r for r in rows if "error" not in r]
+        reports.append({"name": name, "config": config, "failed": len(rows) - len(ok),
+                        **summarize(ok), "documents": rows})
+    for i in pareto_front(reports):
+        reports[i]["pareto"] = True
+    return reports
+
+
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else "-"
+
+
+def print_table(reports: List[Dict[str, Any]]) -> None:
+    print(f"{'':2s}{'CER':>7s} {'WER':>7s} {'fields':>7s} {'lat s':>7s} {'p95 s':>7s} {'$/doc':>9s}  config")
+    for r in sorted(reports, key=lambda r: (r["latency_mean"] is None, r["latency_mean"])):
+        mark = "* " if r.get("pareto") else "  "
+        print(f"{mark}{_fmt(r['cer'], '7.4f')} {_fmt(r['wer'], '7.4f')} {_fmt(r['field_accuracy'], '7.3f')} "
+              f"{_fmt(r['latency_mean'], '7.2f')} {_fmt(r['latency_p95'], '7.2f')} "
+              f"{_fmt(r['cost_per_doc'], '9.5f')}  {r['name']}"
+              + (f"  ({r['failed']} failed)" if r["failed"] else ""))
+    print("* = Pareto frontier (CER, field accuracy, latency, cost)")
+
+
+def meets_bar(report: Dict[str, Any], max_cer: Optional[float], min_field_accuracy: Optional[float]) -> bool:
+    if report["failed"]:
+        return False
+    if max_cer is not None and (report["cer"] is None or report["cer"] > max_cer):
+        return False
+    if min_field_accuracy is not None and (report["field_accuracy"] is None
+                                           or report["field_accuracy"] < min_field_accuracy):
+        return False
+    return True
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Evaluate OCR/cleanup/LLM settings on a labeled corpus")
+    parser.add_argument("corpus", help="Directory of documents with .txt / .json labels")
+    parser.add_argument("--grid", help="JSON file: setting -> list of values (default: zoom x lang)")
+    parser.add_argument("--out", default="eval-report.json", help="Full report with per-document rows")
+    parser.add_argument("--max-cer", type=float, help="Accuracy bar: highest acceptable mean CER")
+    parser.add_argument("--min-field-accuracy", type=float, help="Accuracy bar: lowest acceptable field accuracy")
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            grid = json.load(f)
+    docs = load_corpus(args.corpus)
+    if not docs:
+        parser.error(f"No labeled documents under {args.corpus}")
+    configs = expand_grid(grid)
+    try:
+        for config in configs:
+            if config.get("llm_model"):
+                llm_backend(config["llm_model"])
+    except ValueError as e:
+        parser.error(str(e))
+    logger.info(f"{len(docs)} labeled documents x {len(configs)} configurations")
+
+    reports = run_grid(docs, configs)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=2)
+    print_table(reports)
+    print(f"Report: {os.path.abspath(args.out)}")
+
+    if args.max_cer is not None or args.min_field_accuracy is not None:
+        passing = [r for r in reports if meets_bar(r, args.max_cer, args.min_field_accuracy)]
+        if not passing:
+            print("No configuration meets the accuracy bar")
+            raise SystemExit(1)
+        best = min(passing, key=lambda r: (r["latency_mean"], r["cost_per_doc"]))
+        print(f"Fastest configuration meeting the bar: {best['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,81 @@
 from pathlib import Path
-import cv2
-import numpy as np
-import pytesseract
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
 
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
+# cv2, numpy, pytesseract and PyMuPDF are imported on first use so that
+# starting the CLI (or handling a text-layer PDF) doesn't pay for all of them.
 
 SUPPORTED_IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp'}
 
+# Pages whose embedded text layer has at least this many characters skip OCR
+MIN_TEXT_LAYER_CHARS = 50
+# ...unless the page is a scan (images cover this share of it) whose text
+# blocks cover less than MIN_TEXT_LAYER_COVERAGE: a stamp or Bates number
+SCAN_IMAGE_COVERAGE = 0.5
+MIN_TEXT_LAYER_COVERAGE = 0.1
+
+# An OCR engine name from ocr_engines.ENGINES (None = OCR_CONFIG default), or a
+# function (page_index, image) -> engine name to choose per page
+EngineChoice = Union[None, str, Callable[[int, object], Optional[str]]]
+
+def _load_fitz():
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        raise RuntimeError("PyMuPDF (pymupdf) is required to read PDFs. Install it: pip install pymupdf")
+    return fitz
+
 def resolve_path(rel_or_abs: str) -> Path:
     p = Path(rel_or_abs)
     if not p.is_absolute():
         p = Path(__file__).parent.resolve() / p
     return p
 
+def _pixmap_to_bgr(pix):
+    import cv2
+    import numpy as np
+
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    # print(f"Page {page_num + 1}: shape={img.shape}, channels={pix.n}")
+    if pix.n == 3:
+        return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    if pix.n == 4:
+        return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
+    if pix.n == 1:
+        # Grayscale: convert to 3-channel BGR (optional)
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    raise ValueError(f"Unsupported number of channels in PDF image: {pix.n}")
+
+def render_page(page, zoom: float = 2.0):
+    fitz = _load_fitz()
+    mat = fitz.Matrix(zoom, zoom)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    return _pixmap_to_bgr(pix)
+
+def usable_text_layer(page) -> Optional[str]:
+    """
+    The page's embedded text when it can stand in for OCR, else None. Scanners
+    and DMSes overlay a few words on scanned pages (Bates numbers, signature
+    stamps, "Scanned by" headers); those leave the body in the image, so on a
+    scan the text has to cover the page like a searchable PDF's OCR layer does.
+    """
+    layer = page.get_text().strip()
+    if len(layer) < MIN_TEXT_LAYER_CHARS:
+        return None
+    fitz = _load_fitz()
+    area = abs(page.rect) or 1.0
+    images = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    if images < SCAN_IMAGE_COVERAGE * area:
+        return layer
+    text = sum(abs(fitz.Rect(block[:4]) & page.rect)
+               for block in page.get_text("blocks") if block[6] == 0)
+    return layer if text >= MIN_TEXT_LAYER_COVERAGE * area else None
+
+def _text_layer_words(page, zoom: float) -> List[Dict[str, Any]]:
+    """A page's text layer words like OCR words, in the pixels of a render at zoom (no confidence)."""
+    return [{"text": w[4], "left": round(w[0] * zoom), "top": round(w[1] * zoom),
+             "width": round((w[2] - w[0]) * zoom), "height": round((w[3] - w[1]) * zoom), "conf": None}
+            for w in page.get_text("words")]
+
 def load_image(path_str: str):
     p = resolve_path(path_str)
     if not p.exists():
@@ -24,6 +84,8 @@ def load_image(path_str: str):
     ext = p.suffix.lower()
 
     if ext in SUPPORTED_IMAGE_EXTS:
+        import cv2
+
         print("Uploaded image of", ext , "type.")
         img = cv2.imread(str(p))
         if img is None:
@@ -31,55 +93,182 @@ def load_image(path_str: str):
         return img
 
     if ext == '.pdf':
-        if fitz is None:
-            raise RuntimeError("PyMuPDF (pymupdf) is required to read PDFs. Install it: pip install pymupdf")
+        fitz = _load_fitz()
         doc = fitz.open(str(p))
         if doc.page_count == 0:
             raise ValueError(f"PDF has no pages: {p}")
 
         images = []
         zoom = 2.0  # 2x scaling for ~300 DPI
-        mat = fitz.Matrix(zoom, zoom)
 
         for page_num in range(doc.page_count):
             print(f"Processing page {page_num + 1} of {doc.page_count}")
-            page = doc.load_page(page_num)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-            # print(f"Page {page_num + 1}: shape={img.shape}, channels={pix.n}")
-            if pix.n == 3:
-                bgr_img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-            elif pix.n == 4:
-                bgr_img = cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
-            elif pix.n == 1:
-                # Grayscale: convert to 3-channel BGR (optional)
-                bgr_img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-            else:
-                raise ValueError(f"Unsupported number of channels in PDF image: {pix.n}")
-            images.append(bgr_img)
+            images.append(render_page(doc.load_page(page_num), zoom))
         doc.close()
         return images
 
     raise ValueError(f"Unsupported file extension: {ext}")
 
-def extract_text_tesseract(image_or_pdf_path: str) -> str:
-    data = load_image(image_or_pdf_path)
-
-    def ocr_image(bgr_img: np.ndarray) -> str:
-        # Handle both color and grayscale inputs robustly
-        if bgr_img.ndim == 2:
-            gray = bgr_img
-        else:
-            gray = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY)
-        return pytesseract.image_to_string(gray, lang='eng+hin').strip()
-
-    # If a PDF was loaded, we receive a list of page images (BGR np.ndarrays)
-    if isinstance(data, list):
-        texts = []
-        for idx, page_img in enumerate(data, start=1):
-            print("Appending Index:", idx, "for display.")
-            texts.append(ocr_image(page_img))
-        return "\n\n".join(texts).strip()
+def load_pages(path_str: str) -> list:
+    """Page images of a document (a single image is one page)."""
+    img = load_image(path_str)
+    return img if isinstance(img, list) else [img]
+
+def ocr_image(bgr_img, engine: Optional[str] = None) -> str:
+    from ocr_engines import get_engine
+
+    return get_engine(engine).recognize([bgr_img])[0]
+
+def _pick_engine(engine: EngineChoice, page_index: int, img) -> Optional[str]:
+    return engine(page_index, img) if callable(engine) else engine
+
+def _ocr_pages(todo: List[int], render: Callable[[int], object], engine: EngineChoice,
+               pages: List[Dict[str, Any]], classify: bool) -> None:
+    """
+    OCR pages `todo` into pages[i], a batch per engine at a time. At most one
+    batch of rendered pages per engine is held in memory. With classify, each
+    rendered page is classified first (page_classify.py): blank pages skip OCR
+    and the class is passed on to the engine.
+    """
+    from ocr_engines import OCR_CONFIG, get_engine
+    from page_classify import classify_page
+
+    pending = {}  # engine name -> [(page index, image, class)]
+
+    def flush(name):
+        batch = pending.pop(name)
+        images, classes = [img for _, img, _ in batch], [c for _, _, c in batch]
+        if OCR_CONFIG["word_boxes"]:
+            for (i, _, _), (text, words) in zip(batch, get_engine(name).recognize_words(images, classes)):
+                pages[i].update(text=text, words=words)
+            return
+        for (i, _, _), text in zip(batch, get_engine(name).recognize(images, classes)):
+            pages[i]["text"] = text
+
+    for i in todo:
+        img = render(i)
+        page_class = None
+        if classify:
+            page_class, _ = classify_page(img)
+            pages[i]["page_class"] = page_class
+            if page_class == "blank":
+                pages[i].update(text="", source="blank")
+                continue
+        name = _pick_engine(engine, i, img)
+        pages[i].update(source="ocr", engine=name or get_engine(name).name)
+        pending.setdefault(name, []).append((i, img, page_class))
+        if len(pending[name]) >= get_engine(name).batch_size:
+            flush(name)
+    for name in list(pending):
+        flush(name)
+
+def _extract_pdf_pages(p: Path, use_text_layer: bool, engine: EngineChoice,
+                       classify: bool, ocr_pool=None) -> List[Dict[str, Any]]:
+    # The whole document as one batch, so an OCR pool overlaps all its pages
+    pages = []
+    for batch in iter_page_batches(str(p), None, use_text_layer, engine, classify, ocr_pool):
+        pages.extend({k: v for k, v in page.items() if k != "page"} for page in batch)
+    return pages
+
+def iter_page_batches(image_or_pdf_path: str, batch_size: Optional[int], use_text_layer: bool = True,
+                      engine: EngineChoice = None, classify: Optional[bool] = None,
+                      ocr_pool=None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    extract_page_details `batch_size` pages at a time (None: all in one
+    batch), so later stages can start on the first pages while the rest are
+    still being OCR'd. Each page dict also carries its 0-based index as
+    "page". The PDF stays open until the generator finishes; close() it when
+    stopping early.
+    """
+    from ocr_engines import OCR_CONFIG
+
+    if classify is None:
+        from page_classify import CLASSIFY_CONFIG
+        classify = CLASSIFY_CONFIG["enabled"]
+    p = resolve_path(image_or_pdf_path)
+    if p.suffix.lower() != '.pdf' or not p.exists():
+        yield [dict(page, page=0) for page in extract_page_details(image_or_pdf_path, use_text_layer,
+                                                                    engine, classify, ocr_pool)]
+        return
+
+    fitz = _load_fitz()
+    doc = fitz.open(str(p))
+
+    def render(page_num):
+        print(f"Processing page {page_num + 1} of {doc.page_count}")
+        return render_page(doc.load_page(page_num), OCR_CONFIG["zoom"])
+
+    def rendered(todo):
+        for page_num in todo:
+            print(f"Processing page {page_num + 1} of {doc.page_count}")
+            yield page_num, ocr_pool.ring.render(doc.load_page(page_num), OCR_CONFIG["zoom"])
+
+    try:
+        if doc.page_count == 0:
+            raise ValueError(f"PDF has no pages: {p}")
+        pages = [{"text": ""} for _ in range(doc.page_count)]
+        batch_size = batch_size or doc.page_count
+        for start in range(0, doc.page_count, batch_size):
+            batch = range(start, min(start + batch_size, doc.page_count))
+            todo = []
+            for page_num in batch:
+                if use_text_layer:
+                    page = doc.load_page(page_num)
+                    layer = usable_text_layer(page)
+                    if layer is not None:
+                        print(f"Page {page_num + 1} of {doc.page_count}: using text layer")
+                        pages[page_num].update(text=layer, source="text_layer")
+                        if OCR_CONFIG["word_boxes"]:
+                            pages[page_num]["words"] = _text_layer_words(page, OCR_CONFIG["zoom"])
+                        continue
+                todo.append(page_num)
+            if ocr_pool is not None:
+                ocr_pool.ocr_pages(rendered(todo), pages, engine, classify)
+            else:
+                _ocr_pages(todo, render, engine, pages, classify)
+            yield [dict(pages[i], page=i) for i in batch]
+    finally:
+        doc.close()
+
+def join_pages(pages: List[str]) -> str:
+    return "\n\n".join(pages).strip()
+
+def extract_page_details(image_or_pdf_path: str, use_text_layer: bool = True, engine: EngineChoice = None,
+                         classify: Optional[bool] = None, ocr_pool=None) -> List[Dict[str, Any]]:
+    """
+    Per page: text, source ("text_layer", "ocr" or "blank") and, for rendered
+    pages, page_class (when classified) and engine. With OCR_CONFIG['word_boxes']
+    also words (ocr_engines.OCREngine.recognize_words). classify defaults to
+    CLASSIFY_CONFIG['enabled']. With ocr_pool (page_store.PageOCRPool) pages
+    are OCR'd in its worker processes instead of this one.
+    """
+    if classify is None:
+        from page_classify import CLASSIFY_CONFIG
+        classify = CLASSIFY_CONFIG["enabled"]
+    p = resolve_path(image_or_pdf_path)
+    if p.suffix.lower() == '.pdf' and p.exists():
+        return _extract_pdf_pages(p, use_text_layer, engine, classify, ocr_pool)
 
     # Single image path: just OCR directly
-    return ocr_image(data)
+    img = load_image(image_or_pdf_path)
+    pages = [{"text": ""}]
+    if ocr_pool is not None:
+        ocr_pool.ocr_pages([(0, ocr_pool.ring.put(img))], pages, engine, classify)
+    else:
+        _ocr_pages([0], lambda _: img, engine, pages, classify)
+    return pages
+
+def extract_pages(image_or_pdf_path: str, use_text_layer: bool = True, engine: EngineChoice = None) -> List[str]:
+    """Text per page (one entry for an image); see extract_text_tesseract."""
+    return [page["text"] for page in extract_page_details(image_or_pdf_path, use_text_layer, engine)]
+
+def extract_text_tesseract(image_or_pdf_path: str, use_text_layer: bool = True, engine: EngineChoice = None) -> str:
+    """
+    OCR an image or PDF. PDF pages that already carry a usable text layer
+    (usable_text_layer) are read directly (no render, no OCR) unless
+    use_text_layer is False. Rendered pages are classified first; blank
+    ones are not OCR'd (page_classify.py).
+    engine picks the OCR engine for the whole document (a name) or per page
+    (a function of page index and image); Tesseract unless configured otherwise.
+    """
+    return join_pages(extract_pages(image_or_pdf_path, use_text_layer, engine))
@@ -0,0 +1,437 @@
+"""
+One-pass document migration: MySQL rows -> files under their final prefixed
+folders -> rfq_documents / rfq_response_documents rows in Postgres.
+
+Replaces running rfq-docs.py and rfq-response-docs.py followed by
+update-rfq-docpath-in-db.py and update-rfqresponse-docpath-in-db.py. Rows
+are streamed from MySQL; each file name is parsed, mapped to its new doc_type
+and path prefix, copied straight to DEST_BASE_DIR/<prefix>/, and its row is
+bulk-loaded with COPY. Nothing is re-scanned afterwards.
+
+Memory stays bounded: rows are fetched in batches, copies go through a
+bounded pool, rows are flushed to Postgres per batch, and missing files are
+streamed to a CSV. After each batch the last MySQL id is checkpointed (after
+its copies finished and its rows committed), so an interrupted run resumes
+from there. Rows already in Postgres for the same parent id, doc_type and
+original file name -- whether written by the old scripts (raw, cleaned or
+prefixed path) or by an earlier run -- are updated to the new doc_type and
+path instead of inserted again. Rows whose copy failed are still loaded; the
+failures are listed at the end. Rows Postgres won't take (a path longer than
+the column allows, ...) are rejected one by one and listed too.
+
+  python migrate-docs.py                       # both sources
+  python migrate-docs.py --sources responses   # only rfq_responses
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+
+import mysql.connector
+import psycopg2
+
+from organizer import (CopyPlanner, Manifest, ParallelCopier, SourceIndex, parse_file_list,
+                       prefetch_rows)
+from reconcile import SUGGESTION_FIELDS, ReconcileIndex, find_or_suggest, suggestion_fields
+
+# --- Configuration ---
+SOURCE_DIR = r"C:\Users\gyan_\Downloads\uploads\rfqdocs"
+DEST_BASE_DIR = r"C:\Users\gyan_\Downloads\uploads\organized"
+
+MYSQL_CONFIG = {
+    "host": "localhost",
+    "port": 3306,
+    "user": "root",
+    "password": "gyan",
+    "database": "mydb"
+}
+
+PG_CONFIG = {
+    "host": "localhost",
+    "port": 5432,
+    "user": "postgres",
+    "password": "gyan",
+    "database": "tms_local"
+}
+
+# RFQ documents: MySQL table → old doc_type
+RFQ_TABLES = {
+    "rfq_boqs": "boq",
+    "rfq_technicals": "technical",
+    "rfq_scopes": "scope",
+    "rfq_miis": "mii",
+    "rfq_mafs": "maf"
+}
+
+# Same maps as update-rfq-docpath-in-db.py
+RFQ_DOC_TYPE_MAP = {
+    "mii": "MII_FORMAT",
+    "scope": "SCOPE_OF_WORK",
+    "maf": "MAF_FORMAT",
+    "boq": "DETAILED_BOQ",
+    "technical": "TECH_SPECS"
+}
+
+RFQ_PATH_PREFIX_MAP = {
+    "SCOPE_OF_WORK": "rfq-scope-of-work",
+    "TECH_SPECS": "rfq-tech-specs",
+    "DETAILED_BOQ": "rfq-detailed-boq",
+    "MAF_FORMAT": "rfq-maf-format",
+    "MII_FORMAT": "rfq-mii-format"
+}
+
+# RFQ response documents: rfq_responses column → old doc_type
+RESPONSE_COLUMNS = {
+    "quotation_document": "quotation",
+    "technical_documents": "technical",
+    "maf_document": "maf",
+    "mii_document": "mii"
+}
+
+# Same maps as update-rfqresponse-docpath-in-db.py
+RESPONSE_DOC_TYPE_MAP = {
+    "quotation": "QUOTATION",
+    "technical": "TECHNICAL",
+    "maf": "MAF_FORMAT",
+    "mii": "MII_FORMAT"
+}
+
+RESPONSE_PATH_PREFIX_MAP = {
+    "QUOTATION": "rfq-response-quotation",
+    "TECHNICAL": "rfq-response-technical",
+    "MAF_FORMAT": "rfq-response-maf",
+    "MII_FORMAT": "rfq-response-mii"
+}
+
+MISSING_CSV_FIELDS = ["source", "id", "parent_id", "file_name", "raw_value"] + SUGGESTION_FIELDS
+
+
+class Checkpoint:
+    """Last fully migrated MySQL id per source, in a small JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.last_ids = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.last_ids = json.load(f)
+
+    def get(self, source):
+        return self.last_ids.get(source, 0)
+
+    def save(self, source, last_id):
+        self.last_ids[source] = last_id
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.last_ids, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def _csv_field(value):
+    # Unquoted empty is NULL in COPY's CSV format; every real value is quoted
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+# File name of an existing row's path in any format the old scripts left it
+# in: raw ('["123_a.pdf"]'), cleaned ('123_a.pdf') or prefixed ('rfq-x/123_a.pdf')
+EXISTING_NAME_SQL = r"""regexp_replace(btrim(d.path, E' \t[]"\''), '^.*[/\\]', '')"""
+
+# An existing row for the same document as staging row s
+SAME_DOCUMENT_SQL = f"""
+    d.{{parent}} = s.parent_id
+    AND lower(d.doc_type) IN (lower(s.doc_type), lower(s.old_doc_type))
+    AND (d.path = s.path
+         OR d.metadata->>'original_name' = s.original_name
+         OR {EXISTING_NAME_SQL} = s.original_name)
+"""
+
+
+class DocumentLoader:
+    """
+    Buffers document rows and loads them per batch: COPY into a temp table,
+    then UPDATE the rows that already exist and INSERT the rest, in one
+    transaction. A batch Postgres refuses is rolled back and retried row by
+    row, so one bad row is rejected (see .rejected) instead of the batch.
+    """
+
+    def __init__(self, conn, table, parent_column):
+        self.conn = conn
+        self.table = table
+        self.parent_column = parent_column
+        self.rows = []
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = []
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS _{table}_staging "
+                        f"(parent_id bigint, doc_type text, old_doc_type text, original_name text, "
+                        f"path text, metadata jsonb) ON COMMIT DELETE ROWS")
+            cur.execute("SELECT column_name, character_maximum_length FROM information_schema.columns "
+                        "WHERE table_schema = current_schema() AND table_name = %s "
+                        "AND character_maximum_length IS NOT NULL", (table,))
+            self.max_lengths = dict(cur.fetchall())
+        conn.commit()
+
+    def add(self, parent_id, doc_type, old_doc_type, path, metadata):
+        for column, value in (("doc_type", doc_type), ("path", path)):
+            limit = self.max_lengths.get(column)
+            if limit is not None and len(value) > limit:
+                self._reject(parent_id, path, metadata,
+                             f"{column} is {len(value)} characters, {self.table}.{column} allows {limit}")
+                return
+        self.rows.append((parent_id, doc_type, old_doc_type, metadata["original_name"], path,
+                          json.dumps(metadata, ensure_ascii=False)))
+
+    def _reject(self, parent_id, path, metadata, error):
+        self.rejected.append({"table": self.table, "parent_id": parent_id, "path": path,
+                              "source_id": metadata.get("source_id"), "error": error})
+
+    def _load(self, cur, rows):
+        buf = io.StringIO()
+        for row in rows:
+            buf.write(",".join(_csv_field(v) for v in row) + "\n")
+        buf.seek(0)
+        cur.copy_expert(f"COPY _{self.table}_staging FROM STDIN WITH (FORMAT csv)", buf)
+        same = SAME_DOCUMENT_SQL.format(parent=self.parent_column)
+        # One staging row per document, then rewrite existing rows in place
+        cur.execute(f"""
+            UPDATE {self.table} d
+            SET doc_type = s.doc_type, path = s.path,
+                metadata = COALESCE(d.metadata, '{{}}'::jsonb) || s.metadata
+            FROM (SELECT DISTINCT ON (parent_id, doc_type, original_name) *
+                  FROM _{self.table}_staging) s
+            WHERE {same}
+        """)
+        self.updated += cur.rowcount
+        # ...and insert only the real misses
+        cur.execute(f"""
+            INSERT INTO {self.table} ({self.parent_column}, doc_type, path, metadata)
+            SELECT DISTINCT ON (s.parent_id, s.doc_type, s.original_name)
+                   s.parent_id, s.doc_type, s.path, s.metadata
+            FROM _{self.table}_staging s
+            WHERE NOT EXISTS (SELECT 1 FROM {self.table} d WHERE {same})
+        """)
+        self.inserted += cur.rowcount
+        cur.execute(f"TRUNCATE _{self.table}_staging")
+
+    def flush(self):
+        """Load and commit the buffered rows; a failed batch is retried row by row."""
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+        counts = (self.inserted, self.updated)
+        try:
+            with self.conn.cursor() as cur:
+                self._load(cur, rows)
+            self.conn.commit()
+            return
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            self.inserted, self.updated = counts
+            print(f"  Batch of {len(rows)} {self.table} rows failed ({e.__class__.__name__}); "
+                  f"retrying row by row")
+        with self.conn.cursor() as cur:
+            for row in rows:
+                cur.execute("SAVEPOINT migrate_row")
+                before = (self.inserted, self.updated)
+                try:
+                    self._load(cur, [row])
+                except psycopg2.Error as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT migrate_row")
+                    self.inserted, self.updated = before
+                    self._reject(row[0], row[4], json.loads(row[5]), str(e).strip())
+        self.conn.commit()
+
+
+def rfq_table_source(table):
+    """(name, query, row -> documents) for one of the per-type RFQ document tables."""
+    old_type = RFQ_TABLES[table]
+
+    def documents(row):
+        row_id, rfq_id, file_path = row
+        if file_path:
+            # file_path might be a full path or relative path or just a filename
+            yield (rfq_id, old_type, os.path.basename(file_path), file_path,
+                   lambda name_part, ext: f"{name_part}_id{row_id}{ext}")
+
+    query = (f"SELECT `id`, `rfq_id`, `file_path` FROM `{table}` "
+             f"WHERE `id` > %s AND `file_path` IS NOT NULL ORDER BY `id`")
+    return table, query, documents
+
+
+def responses_source():
+    """(name, query, row -> documents) for rfq_responses' document columns."""
+    columns = list(RESPONSE_COLUMNS)
+
+    def documents(row):
+        row_id, rfq_id = row[0], row[1]
+        for col_name, raw_value in zip(columns, row[2:]):
+            for file_name in parse_file_list(raw_value):
+                yield (row_id, RESPONSE_COLUMNS[col_name], file_name, raw_value,
+                       lambda name_part, ext: f"{name_part}_rfq{rfq_id}_id{row_id}{ext}")
+
+    select = ", ".join(f"`{c}`" for c in columns)
+    query = f"SELECT `id`, `rfq_id`, {select} FROM `rfq_responses` WHERE `id` > %s ORDER BY `id`"
+    return "rfq_responses", query, documents
+
+
+def migrate_source(name, query, documents, doc_type_map, prefix_map, *, mysql_conn, loader,
+                   source, reconciler, accept_score, planner, copier, checkpoint, missing,
+                   batch_size, report_every):
+    last_id = checkpoint.get(name)
+    print(f"\n{'=' * 70}")
+    print(f"Migrating {name} (from id > {last_id})")
+    print("=" * 70)
+
+    cursor = mysql_conn.cursor()  # Unbuffered tuple cursor: rows stream off the socket
+    cursor.execute(query, (last_id,))
+    rows = 0
+    not_found = 0
+    started = time.perf_counter()
+
+    def commit_batch():
+        # Files first, then rows, then the checkpoint: a crash in between
+        # only repeats work, it never skips a row.
+        copier.drain()
+        loader.flush()
+        checkpoint.save(name, last_id)
+
+    try:
+        for row in prefetch_rows(cursor, batch_size):
+            row_id = row[0]
+            for parent_id, old_type, file_name, raw_value, rename in documents(row):
+                new_type = doc_type_map[old_type]
+                prefix = prefix_map[new_type]
+                source_file, suggestion = find_or_suggest(source, reconciler, file_name, accept_score)
+                if source_file is None:
+                    not_found += 1
+                    missing.writerow({"source": name, "id": row_id, "parent_id": parent_id,
+                                      "file_name": file_name, "raw_value": repr(raw_value),
+                                      **suggestion_fields(suggestion)})
+                    continue
+                dest = planner.plan(source_file, os.path.join(DEST_BASE_DIR, prefix), file_name,
+                                    rename, key=f"{name}/{row_id}/{file_name}")
+                metadata = {"source_table": name, "source_id": row_id, "original_name": file_name}
+                if suggestion is not None:
+                    metadata.update(matched_file=source_file.name, match_score=suggestion.score)
+                loader.add(parent_id, new_type, old_type, f"{prefix}/{os.path.basename(dest)}", metadata)
+
+            last_id = row_id
+            rows += 1
+            if rows % batch_size == 0:
+                commit_batch()
+            if rows % report_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  ... {rows} rows in {elapsed:.0f}s ({rows / elapsed:.0f} rows/s), "
+                      f"{loader.inserted} inserted, {loader.updated} updated, "
+                      f"{len(loader.rejected)} rejected, {not_found} not found")
+        commit_batch()
+    finally:
+        cursor.close()
+
+    print(f"  {name}: {rows} rows, {not_found} files not found, "
+          f"{time.perf_counter() - started:.1f}s")
+    return rows, not_found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate RFQ documents from MySQL to files + Postgres in one pass")
+    parser.add_argument("--sources", default="rfq,responses",
+                        help="Comma-separated: rfq (per-type RFQ tables), responses (rfq_responses)")
+    parser.add_argument("--workers", type=int, default=16, help="Parallel copies")
+    parser.add_argument("--link", nargs="?", const="hard", choices=["hard", "reflink"],
+                        help="Hardlink (default) or reflink instead of copying when possible")
+    parser.add_argument("--accept-score", type=float,
+                        help="Use fuzzy matches scoring at least this (0-1); otherwise they are "
+                             "only suggested in missing.csv")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per fetch / COPY / checkpoint")
+    parser.add_argument("--report-every", type=int, default=20000, help="Progress line every N rows")
+    parser.add_argument("--state-dir", default=os.path.join(DEST_BASE_DIR, ".migrate-docs"),
+                        help="Checkpoint, copy manifest and missing-file CSV")
+    args = parser.parse_args()
+    sources = {s.strip() for s in args.sources.split(",") if s.strip()}
+
+    os.makedirs(args.state_dir, exist_ok=True)
+    source = SourceIndex(SOURCE_DIR)
+    reconciler = ReconcileIndex.from_source(source)
+    print(f"Files in source folder: {len(source)}")
+
+    checkpoint = Checkpoint(os.path.join(args.state_dir, "checkpoint.json"))
+    manifest = Manifest(os.path.join(args.state_dir, "manifest.jsonl"))
+    copier = ParallelCopier(args.workers, args.link, manifest)
+    planner = CopyPlanner(manifest, on_task=copier.submit)
+
+    missing_path = os.path.join(args.state_dir, "missing.csv")
+    new_csv = not os.path.exists(missing_path)
+    missing_file = open(missing_path, "a", newline="", encoding="utf-8")
+    missing = csv.DictWriter(missing_file, fieldnames=MISSING_CSV_FIELDS)
+    if new_csv:
+        missing.writeheader()
+
+    mysql_conn = mysql.connector.connect(**MYSQL_CONFIG)
+    pg_conn = psycopg2.connect(**PG_CONFIG)
+
+    total_rows = 0
+    total_missing = 0
+    loaders = []
+    started = time.perf_counter()
+    try:
+        if "rfq" in sources:
+            loader = DocumentLoader(pg_conn, "rfq_documents", "rfq_id")
+            loaders.append(loader)
+            for table in RFQ_TABLES:
+                rows, nf = migrate_source(
+                    *rfq_table_source(table), RFQ_DOC_TYPE_MAP, RFQ_PATH_PREFIX_MAP,
+                    mysql_conn=mysql_conn, loader=loader, source=source, reconciler=reconciler,
+                    accept_score=args.accept_score, planner=planner,
+                    copier=copier, checkpoint=checkpoint, missing=missing,
+                    batch_size=args.batch_size, report_every=args.report_every)
+                total_rows += rows
+                total_missing += nf
+
+        if "responses" in sources:
+            loader = DocumentLoader(pg_conn, "rfq_response_documents", "rfq_response_id")
+            loaders.append(loader)
+            rows, nf = migrate_source(
+                *responses_source(), RESPONSE_DOC_TYPE_MAP, RESPONSE_PATH_PREFIX_MAP,
+                mysql_conn=mysql_conn, loader=loader, source=source, reconciler=reconciler,
+                accept_score=args.accept_score, planner=planner,
+                copier=copier, checkpoint=checkpoint, missing=missing,
+                batch_size=args.batch_size, report_every=args.report_every)
+            total_rows += rows
+            total_missing += nf
+    finally:
+        result = copier.close()
+        manifest.close()
+        missing_file.close()
+        mysql_conn.close()
+        pg_conn.close()
+
+    # --- Summary ---
+    print(f"\n{'=' * 70}")
+    print("SUMMARY")
+    print("=" * 70)
+    print(f"Rows read from MySQL:        {total_rows}")
+    print(f"Document rows inserted:      {sum(l.inserted for l in loaders)}")
+    print(f"Existing rows updated:       {sum(l.updated for l in loaders)}")
+    print(f"Rows rejected by Postgres:   {sum(len(l.rejected) for l in loaders)}")
+    print(f"Files copied:                {result['copied'] + result['linked']}")
+    print(f"Files already in place:      {planner.up_to_date + result['unchanged']}")
+    print(f"Failed copies:               {len(result['failed'])}")
+    print(f"Files not found:             {total_missing} (see {missing_path})")
+    print(f"Elapsed:                     {time.perf_counter() - started:.1f}s")
+
+    for f in result["failed"]:
+        print(f"  FAILED: {f['source']} -> {f['dest']}: {f['error']}")
+    for loader in loaders:
+        for r in loader.rejected:
+            print(f"  REJECTED: {r['table']} parent={r['parent_id']} source_id={r['source_id']} "
+                  f"{r['path']}: {r['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+"""
+Shared helpers for the organize scripts (rfq-docs.py, rfq-response-docs.py).
+
+- SourceIndex: SOURCE_DIR listed once (names, sizes, mtimes), so looking a
+  file up is a dict hit instead of an os.path.exists call on the share.
+- CopyPlanner: destination names decided up front, with collisions resolved
+  against an in-memory set of names already taken in each folder.
+- execute() / ParallelCopier: run the copies on a thread pool, optionally
+  as hardlinks or reflinks instead of byte copies.
+- prefetch_rows(): streams DB rows in batches on a background thread.
+- parse_file_list(): file names out of the MySQL document columns.
+- Manifest: what each DB row's file was copied to, and from which source
+  (size, mtime, sha256), so re-runs only copy new or changed files and an
+  interrupted run picks up where it stopped.
+"""
+import errno
+import hashlib
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def parse_file_list(value):
+    """Parse file names from various formats the DB might store them in."""
+    if value is None:
+        return []
+
+    # Handle bytes
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+
+    # Convert to string
+    value = str(value).strip()
+
+    # Skip empty values
+    if value in ("", "[]", "null", "None", "NULL"):
+        return []
+
+    # Try JSON parse
+    try:
+        files = json.loads(value)
+        if isinstance(files, list):
+            return [str(f).strip() for f in files if f and str(f).strip()]
+        elif isinstance(files, str) and files.strip():
+            return [files.strip()]
+        return []
+    except (json.JSONDecodeError, TypeError, ValueError):
+        pass
+
+    # Manual parsing fallback - remove brackets and split
+    cleaned = value.strip("[]").strip()
+    if not cleaned:
+        return []
+
+    files = []
+    # Handle quoted comma-separated values
+    in_quote = False
+    current = ""
+    for char in cleaned:
+        if char == '"' or char == "'":
+            in_quote = not in_quote
+        elif char == "," and not in_quote:
+            part = current.strip().strip('"').strip("'").strip()
+            if part:
+                files.append(part)
+            current = ""
+        else:
+            current += char
+
+    # Don't forget last item
+    part = current.strip().strip('"').strip("'").strip()
+    if part:
+        files.append(part)
+
+    return files
+
+
+class SourceFile(NamedTuple):
+    name: str
+    path: str
+    size: int
+    mtime: float
+
+
+class SourceIndex:
+    def __init__(self, source_dir: str):
+        self.source_dir = source_dir
+        self.files: Dict[str, SourceFile] = {}
+        self.by_lower: Dict[str, SourceFile] = {}
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                f = SourceFile(entry.name, entry.path, st.st_size, st.st_mtime)
+                self.files[entry.name] = f
+                self.by_lower.setdefault(entry.name.lower(), f)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def find(self, file_name: str, ignore_case: bool = False) -> Optional[SourceFile]:
+        found = self.files.get(file_name)
+        if found is None and ignore_case:
+            found = self.by_lower.get(file_name.lower())
+        if found is None and ("/" in file_name or os.sep in file_name):
+            # Names with a subfolder aren't in the top-level listing
+            path = os.path.join(self.source_dir, file_name)
+            if os.path.isfile(path):
+                st = os.stat(path)
+                found = SourceFile(file_name, path, st.st_size, st.st_mtime)
+        return found
+
+
+class CopyTask(NamedTuple):
+    source: SourceFile
+    dest: str
+    key: Optional[str] = None
+
+
+class Manifest:
+    """
+    Append-only JSONL log, one record per copied file; the last record per key wins.
+    Keys identify the DB reference (e.g. "rfq_boqs/123/file.pdf"), so a row is
+    mapped to the same destination on every run instead of a new _id copy.
+
+    A new destination is reserved (size/mtime/sha256 unset) before its copy
+    starts, so a run interrupted mid-copy maps the row back to that name on
+    resume and copies it again instead of planning another _id name.
+    """
+
+    def __init__(self, path: str, sync_every: int = 500):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.sync_every = sync_every
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from a crash
+                    self.records[rec["key"]] = rec
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.records.get(key)
+
+    def reserve(self, task: CopyTask) -> None:
+        """Record the planned destination before copying; never counts as up to date."""
+        self._write({"key": task.key, "source": task.source.path, "size": None,
+                     "mtime": None, "sha256": None, "dest": task.dest})
+
+    def record(self, task: CopyTask, sha256: Optional[str]) -> None:
+        self._write({"key": task.key, "source": task.source.path, "size": task.source.size,
+                     "mtime": task.source.mtime, "sha256": sha256, "dest": task.dest})
+
+    def _write(self, rec: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records[rec["key"]] = rec
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                os.fsync(self._fh.fileno())
+                self._unsynced = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+
+
+class CopyPlanner:
+    """
+    planner = CopyPlanner(manifest)
+    dest = planner.plan(source_file, folder, "a.pdf",
+                        lambda name, ext: f"{name}_id{row_id}{ext}", key=f"rfq_boqs/{row_id}/a.pdf")
+
+    The first claim of a name in a folder gets it; later ones get the renamed
+    form. Folders are listed once, on first use, so files left by earlier
+    runs count as taken just like they did with the per-row exists() check.
+
+    With a manifest, a reference (key) copied before keeps its destination:
+    it is skipped when its source is unchanged and the file is still there,
+    and re-copied over the same name otherwise.
+    """
+
+    def __init__(self, manifest: Optional[Manifest] = None,
+                 on_task: Optional[Callable[[CopyTask], None]] = None):
+        self.tasks: List[CopyTask] = []
+        self.manifest = manifest
+        self.up_to_date = 0
+        self.planned = 0
+        self._on_task = on_task
+        self._taken: Dict[str, Set[str]] = {}
+
+    def _add(self, task: CopyTask) -> None:
+        self.planned += 1
+        if self._on_task is not None:
+            self._on_task(task)  # Streaming: hand it straight to the copier
+        else:
+            self.tasks.append(task)
+
+    def _names(self, folder: str) -> Set[str]:
+        names = self._taken.get(folder)
+        if names is None:
+            os.makedirs(folder, exist_ok=True)
+            names = set(os.listdir(folder))
+            self._taken[folder] = names
+        return names
+
+    def plan(self, source: SourceFile, folder: str, file_name: str,
+             rename: Callable[[str, str], str], key: Optional[str] = None) -> str:
+        names = self._names(folder)
+        rec = self.manifest.get(key) if self.manifest is not None and key else None
+        if rec is not None and os.path.dirname(rec["dest"]) == folder:
+            dest_name = os.path.basename(rec["dest"])
+            present = dest_name in names
+            names.add(dest_name)
+            if present and rec["size"] == source.size and rec["mtime"] == source.mtime:
+                self.up_to_date += 1
+            else:
+                self._add(CopyTask(source, rec["dest"], key))
+            return rec["dest"]
+
+        if file_name in names:
+            name_part, ext = os.path.splitext(file_name)
+            file_name = rename(name_part, ext)
+        names.add(file_name)
+        dest = os.path.join(folder, file_name)
+        task = CopyTask(source, dest, key)
+        if self.manifest is not None and key:
+            self.manifest.reserve(task)
+        self._add(task)
+        return dest
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def copy_hashing(src: str, dest: str) -> str:
+    """
+    shutil.copy2, hashing the bytes on the way through (one read of the source).
+    The copy is written to dest + ".part" and renamed into place, so an
+    interrupted run never leaves a truncated file under the final name, and
+    an existing dest that is a hard link to the source is replaced, not
+    truncated through.
+    """
+    h = hashlib.sha256()
+    part = dest + ".part"
+    try:
+        with open(src, "rb") as s, open(part, "wb") as d:
+            for chunk in iter(lambda: s.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+                d.write(chunk)
+        shutil.copystat(src, part)
+        os.replace(part, dest)
+    except BaseException:
+        _remove_quietly(part)
+        raise
+    return h.hexdigest()
+
+
+def _reflink(src: str, dest: str) -> None:
+    """Copy-on-write clone (Btrfs, XFS, ...). Raises OSError where unsupported."""
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflinks are only supported on Linux here")
+    import fcntl
+
+    FICLONE = 0x40049409
+    part = dest + ".part"  # Same rename-into-place as copy_hashing
+    try:
+        with open(src, "rb") as s, open(part, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        shutil.copystat(src, part)
+        os.replace(part, dest)
+    except BaseException:
+        _remove_quietly(part)
+        raise
+
+
+def _hardlink(src: str, dest: str) -> None:
+    if os.path.lexists(dest):
+        os.remove(dest)
+    os.link(src, dest)
+
+
+LINKERS = {"hard": _hardlink, "reflink": _reflink}
+
+
+def transfer(task: CopyTask, link: Optional[str] = None,
+             manifest: Optional[Manifest] = None):
+    """
+    Copy (or link) one file; returns (how, sha256). Links fall back to a copy.
+    A source whose mtime changed but whose content hash matches the manifest
+    is not copied again ("unchanged").
+    """
+    rec = manifest.get(task.key) if manifest is not None and task.key else None
+    if (rec and rec.get("sha256") and rec["size"] == task.source.size
+            and rec["dest"] == task.dest and os.path.exists(task.dest)):
+        sha256 = file_sha256(task.source.path)
+        if sha256 == rec["sha256"]:
+            return "unchanged", sha256
+    if link:
+        try:
+            LINKERS[link](task.source.path, task.dest)
+            return "linked", None
+        except OSError:
+            pass  # Different filesystem, or no link support
+    return "copied", copy_hashing(task.source.path, task.dest)
+
+
+class ParallelCopier:
+    """
+    Copies submitted one at a time run on a thread pool. At most
+    `max_pending` copies are queued, so a producer streaming tasks from
+    the DB is throttled instead of queueing millions of them.
+    Copies are I/O-bound (mostly waiting on the share), so threads overlap
+    them well. Each finished copy is recorded in the manifest right away.
+    """
+
+    def __init__(self, workers: int = 16, link: Optional[str] = None,
+                 manifest: Optional[Manifest] = None, report_every: int = 1000,
+                 max_pending: Optional[int] = None):
+        self.link = link
+        self.manifest = manifest
+        self.report_every = report_every
+        self.counts = {"copied": 0, "linked": 0, "unchanged": 0, "bytes": 0}
+        self.failed: List[Dict[str, str]] = []
+        self.submitted = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._inflight = 0
+        self._idle = threading.Condition(self._lock)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="copy")
+        self._started = time.perf_counter()
+
+    def submit(self, task: CopyTask) -> None:
+        self._slots.acquire()
+        with self._lock:
+            self.submitted += 1
+            self._inflight += 1
+        future = self._pool.submit(self._run, task)
+        future.add_done_callback(self._done)
+
+    def _done(self, _future) -> None:
+        self._slots.release()
+        with self._lock:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.notify_all()
+
+    def drain(self) -> None:
+        """Block until every copy submitted so far has finished (e.g. before a checkpoint)."""
+        with self._lock:
+            while self._inflight:
+                self._idle.wait()
+
+    def _run(self, task: CopyTask) -> None:
+        try:
+            how, sha256 = transfer(task, self.link, self.manifest)
+        except OSError as e:
+            with self._lock:
+                self.failed.append({"source": task.source.path, "dest": task.dest, "error": str(e)})
+            return
+        if self.manifest is not None and task.key:
+            self.manifest.record(task, sha256)
+        with self._lock:
+            self.counts[how] += 1
+            self.counts["bytes"] += task.source.size
+            done = self.counts["copied"] + self.counts["linked"] + self.counts["unchanged"]
+            if done % self.report_every == 0:
+                elapsed = time.perf_counter() - self._started
+                print(f"  ... {done}/{self.submitted} files, {self.counts['bytes'] / 1e6:.0f} MB "
+                      f"in {elapsed:.0f}s")
+
+    def close(self) -> Dict[str, Any]:
+        """Wait for every submitted copy; returns counts and failures."""
+        self._pool.shutdown(wait=True)
+        return {**self.counts, "failed": self.failed,
+                "elapsed": round(time.perf_counter() - self._started, 1)}
+
+
+def execute(tasks: List[CopyTask], workers: int = 16, link: Optional[str] = None,
+            manifest: Optional[Manifest] = None, report_every: int = 1000) -> Dict[str, Any]:
+    """Run planned copies in parallel; returns counts and failures."""
+    copier = ParallelCopier(workers, link, manifest, report_every)
+    try:
+        for task in tasks:
+            copier.submit(task)
+    finally:
+        result = copier.close()
+    return result
+
+
+def prefetch_rows(cursor, batch_size: int = 5000, depth: int = 4) -> Iterator[tuple]:
+    """
+    Rows of an executed (unbuffered) cursor, fetched in batches on a
+    background thread so the next batch streams in while this one is
+    processed. At most `depth` batches are held in memory.
+    """
+    batches: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+
+    def produce() -> None:
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                batches.put(rows)
+                if not rows:
+                    return
+        except Exception as e:
+            batches.put(e)
+
+    threading.Thread(target=produce, name="db-fetch", daemon=True).start()
+    while True:
+        rows = batches.get()
+        if isinstance(rows, Exception):
+            raise rows
+        if not rows:
+            return
+        yield from rows
@@ -0,0 +1,176 @@
+"""
+Fuzzy matching of DB file names that aren't in SOURCE_DIR under that exact name.
+
+The names usually differ only by a numeric timestamp prefix
+('398445437_MAF_(7).pdf' vs 'MAF_(7).pdf'), case, extra spaces or URL
+encoding. The index is built once over the source listing; each miss is then
+a few dict lookups, with character trigrams as the last resort:
+
+  method       score
+  normalized   0.98   same name after URL-decoding, case and space folding
+  prefix       0.90   same once numeric prefixes are stripped (0.75 if several files share it)
+  trigram      <0.85  trigram Jaccard similarity of the stripped names, same extension
+
+  python reconcile.py missing.csv --out review.csv    # suggest matches for a missing-file CSV
+"""
+import argparse
+import csv
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+from urllib.parse import unquote_plus
+
+from organizer import SourceFile, SourceIndex
+
+_SPACES = re.compile(r"[\s_]+")
+_NUMERIC_PREFIX = re.compile(r"^(\d{5,}[ _-]*)+")
+
+MIN_TRIGRAM_SCORE = 0.5
+
+
+class Match(NamedTuple):
+    file: SourceFile
+    score: float
+    method: str
+
+
+def normalize(name: str) -> str:
+    name = unicodedata.normalize("NFKC", unquote_plus(name)).lower().strip()
+    return _SPACES.sub(" ", name)
+
+
+def strip_prefix(normalized: str) -> str:
+    stem, ext = os.path.splitext(normalized)
+    return _NUMERIC_PREFIX.sub("", stem).strip() + ext
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ReconcileIndex:
+    def __init__(self, files: Iterable[SourceFile]):
+        self.files: List[SourceFile] = []
+        self.by_normalized: Dict[str, List[int]] = defaultdict(list)
+        self.by_stripped: Dict[str, List[int]] = defaultdict(list)
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self._grams: List[FrozenSet[str]] = []
+        self._exts: List[str] = []
+        for i, f in enumerate(files):
+            self.files.append(f)
+            norm = normalize(f.name)
+            stripped = strip_prefix(norm)
+            stem, ext = os.path.splitext(stripped)
+            self.by_normalized[norm].append(i)
+            self.by_stripped[stripped].append(i)
+            grams = frozenset(trigrams(stem))
+            for g in grams:
+                self.postings[g].append(i)
+            self._grams.append(grams)
+            self._exts.append(ext)
+
+    @classmethod
+    def from_source(cls, source: SourceIndex) -> "ReconcileIndex":
+        return cls(source.files.values())
+
+    def match(self, name: str) -> Optional[Match]:
+        norm = normalize(os.path.basename(name))
+        hits = self.by_normalized.get(norm)
+        if hits:
+            return Match(self.files[hits[0]], 0.98, "normalized")
+
+        stripped = strip_prefix(norm)
+        hits = self.by_stripped.get(stripped)
+        if hits:
+            # Several uploads can share a name once the timestamp is gone
+            return Match(self.files[hits[0]], 0.90 if len(hits) == 1 else 0.75, "prefix")
+
+        stem, ext = os.path.splitext(stripped)
+        grams = trigrams(stem)
+        # Prefix filtering: a name with Jaccard >= MIN_TRIGRAM_SCORE must share
+        # at least one of the query's rarest (1 - MIN) * n + 1 trigrams, so
+        # only those postings are read, never the huge ones for ".pd" or "tec".
+        ranked = sorted((g for g in grams if g in self.postings), key=lambda g: len(self.postings[g]))
+        probe = ranked[:int((1 - MIN_TRIGRAM_SCORE) * len(grams)) + 1]
+        candidates = set()
+        for g in probe:
+            candidates.update(self.postings[g])
+        # ... and its trigram count is within a factor of MIN of the query's
+        lo, hi = len(grams) * MIN_TRIGRAM_SCORE, len(grams) / MIN_TRIGRAM_SCORE
+        best, best_score = None, 0.0
+        for i in candidates:
+            if self._exts[i] != ext or not lo <= len(self._grams[i]) <= hi:
+                continue
+            n = len(grams & self._grams[i])
+            score = n / (len(grams) + len(self._grams[i]) - n)
+            if score > best_score:
+                best, best_score = i, score
+        if best is None or best_score < MIN_TRIGRAM_SCORE:
+            return None
+        return Match(self.files[best], round(best_score * 0.85, 3), "trigram")
+
+
+def find_or_suggest(source: SourceIndex, reconciler: Optional[ReconcileIndex], file_name: str,
+                    accept_score: Optional[float] = None):
+    """
+    (source file or None, suggestion or None). A suggestion scoring at least
+    accept_score is used as the source file; below that it is only reported.
+    """
+    found = source.find(file_name, ignore_case=True)
+    if found is not None or reconciler is None:
+        return found, None
+    suggestion = reconciler.match(file_name)
+    if suggestion and accept_score is not None and suggestion.score >= accept_score:
+        return suggestion.file, suggestion
+    return None, suggestion
+
+
+def suggestion_fields(suggestion: Optional[Match]) -> Dict[str, object]:
+    """Extra review-CSV columns for a missing file."""
+    if suggestion is None:
+        return {"best_match": "", "score": "", "method": ""}
+    return {"best_match": suggestion.file.name, "score": suggestion.score, "method": suggestion.method}
+
+
+SUGGESTION_FIELDS = ["best_match", "score", "method"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suggest SOURCE_DIR matches for a missing-file CSV")
+    parser.add_argument("missing_csv", help="CSV with a file_name column (from the organizer scripts)")
+    parser.add_argument("--source-dir", required=True)
+    parser.add_argument("--out", help="Review CSV (default: <missing_csv>-review.csv)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = ReconcileIndex.from_source(SourceIndex(args.source_dir))
+    print(f"Indexed {len(index.files)} files in {time.perf_counter() - started:.1f}s")
+
+    out_path = args.out or os.path.splitext(args.missing_csv)[0] + "-review.csv"
+    matched = total = 0
+    lookup_secs = 0.0
+    with open(args.missing_csv, newline="", encoding="utf-8") as fin, \
+            open(out_path, "w", newline="", encoding="utf-8") as fout:
+        reader = csv.DictReader(fin)
+        fields = [f for f in reader.fieldnames or [] if f not in SUGGESTION_FIELDS]
+        writer = csv.DictWriter(fout, fieldnames=fields + SUGGESTION_FIELDS)
+        writer.writeheader()
+        for row in reader:
+            t0 = time.perf_counter()
+            suggestion = index.match(row["file_name"])
+            lookup_secs += time.perf_counter() - t0
+            total += 1
+            matched += suggestion is not None
+            writer.writerow({**{f: row.get(f) for f in fields}, **suggestion_fields(suggestion)})
+
+    per_lookup = lookup_secs / total * 1000 if total else 0
+    print(f"{matched}/{total} missing files have a suggested match ({per_lookup:.3f} ms per lookup)")
+    print(f"Review CSV: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
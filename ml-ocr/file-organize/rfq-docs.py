@@ -1,7 +1,11 @@
+import argparse
+import csv
 import os
-import shutil
 import mysql.connector
 
+from organizer import CopyPlanner, Manifest, SourceIndex, execute
+from reconcile import ReconcileIndex, find_or_suggest, suggestion_fields
+
 # --- Configuration ---
 SOURCE_DIR = r"C:\Users\gyan_\Downloads\uploads\rfqdocs"
 DEST_BASE_DIR = r"C:\Users\gyan_\Downloads\uploads\organized"  # Change if needed
@@ -24,21 +28,42 @@ TABLES = [
 
 # --- Main Script ---
 def main():
+    parser = argparse.ArgumentParser(description="Copy RFQ documents into per-table folders")
+    parser.add_argument("--workers", type=int, default=16, help="Parallel copies")
+    parser.add_argument("--link", nargs="?", const="hard", choices=["hard", "reflink"],
+                        help="Hardlink (default) or reflink instead of copying when source and "
+                             "destination share a filesystem; falls back to a copy otherwise. "
+                             "Hardlinked files share content with SOURCE_DIR, so don't edit them")
+    parser.add_argument("--manifest", default=os.path.join(DEST_BASE_DIR, ".rfq-docs-manifest.jsonl"),
+                        help="Record of what was copied where; re-runs only copy new or changed files")
+    parser.add_argument("--accept-score", type=float,
+                        help="Copy fuzzy matches scoring at least this (0-1); otherwise they are "
+                             "only suggested in the review CSV")
+    parser.add_argument("--review-csv", default=os.path.join(DEST_BASE_DIR, "rfq-docs-missing.csv"),
+                        help="Files not found, with suggested matches")
+    args = parser.parse_args()
+
+    # One pass over the source folder instead of an exists() call per row
+    source = SourceIndex(SOURCE_DIR)
+    reconciler = ReconcileIndex.from_source(source)
+    print(f"Files in source folder: {len(source)}")
+
     # Connect to MySQL
     conn = mysql.connector.connect(**DB_CONFIG)
     cursor = conn.cursor(dictionary=True)
 
     not_found_files = []
-    copied_count = 0
+    reconciled = 0
+    manifest = Manifest(args.manifest)
+    planner = CopyPlanner(manifest)
 
     for table_name in TABLES:
         print(f"\n{'='*60}")
         print(f"Processing table: {table_name}")
         print(f"{'='*60}")
 
-        # Create destination folder named after the table
+        # Destination folder named after the table
         dest_folder = os.path.join(DEST_BASE_DIR, table_name)
-        os.makedirs(dest_folder, exist_ok=True)
 
         # Query file_path and name from the table
         query = f"SELECT id, rfq_id, name, file_path FROM `{table_name}` WHERE file_path IS NOT NULL"
@@ -57,42 +82,64 @@ def main():
             # file_path might be a full path or relative path or just a filename
             file_name = os.path.basename(file_path)
 
-            source_file = os.path.join(SOURCE_DIR, file_name)
-            dest_file = os.path.join(dest_folder, file_name)
-
-            if os.path.exists(source_file):
+            source_file, suggestion = find_or_suggest(source, reconciler, file_name, args.accept_score)
+            if source_file is not None:
+                reconciled += suggestion is not None
                 # Handle duplicate file names by appending id
-                if os.path.exists(dest_file):
-                    name_part, ext = os.path.splitext(file_name)
-                    dest_file = os.path.join(dest_folder, f"{name_part}_id{row['id']}{ext}")
-
-                shutil.copy2(source_file, dest_file)
-                copied_count += 1
-                print(f"  ✓ Copied: {file_name}")
+                planner.plan(source_file, dest_folder, file_name,
+                             lambda name_part, ext, row_id=row["id"]: f"{name_part}_id{row_id}{ext}",
+                             key=f"{table_name}/{row['id']}/{file_name}")
             else:
                 not_found_files.append({
                     "table": table_name,
                     "id": row["id"],
                     "rfq_id": row["rfq_id"],
                     "file_name": file_name,
-                    "file_path": file_path
+                    "file_path": file_path,
+                    **suggestion_fields(suggestion)
                 })
                 print(f"  ✗ NOT FOUND: {file_name}")
 
     cursor.close()
     conn.close()
 
+    print(f"\nUp to date from earlier runs: {planner.up_to_date}")
+    print(f"Copying {len(planner.tasks)} files with {args.workers} workers"
+          f"{f' ({args.link} links)' if args.link else ''}...")
+    try:
+        result = execute(planner.tasks, workers=args.workers, link=args.link, manifest=manifest)
+    finally:
+        manifest.close()
+
     # --- Summary ---
     print(f"\n{'='*60}")
     print(f"SUMMARY")
     print(f"{'='*60}")
-    print(f"Total files copied: {copied_count}")
+    print(f"Total files copied: {result['copied']}")
+    print(f"Already up to date: {planner.up_to_date + result['unchanged']}")
+    if args.link:
+        print(f"Total files linked: {result['linked']}")
+    print(f"Failed copies:      {len(result['failed'])}")
     print(f"Files not found:    {len(not_found_files)}")
+    print(f"Fuzzy-matched:      {reconciled}")
+    print(f"Elapsed:            {result['elapsed']}s ({result['bytes'] / 1e6:.0f} MB)")
+
+    if result["failed"]:
+        print(f"\n--- Failed Copies ---")
+        for f in result["failed"]:
+            print(f"  {f['source']} -> {f['dest']}: {f['error']}")
 
     if not_found_files:
         print(f"\n--- Files Not Found ---")
         for nf in not_found_files:
-            print(f"  Table: {nf['table']}, ID: {nf['id']}, RFQ_ID: {nf['rfq_id']}, File: {nf['file_path']}")
+            print(f"  Table: {nf['table']}, ID: {nf['id']}, RFQ_ID: {nf['rfq_id']}, File: {nf['file_path']}"
+                  + (f"  (maybe {nf['best_match']}, score {nf['score']})" if nf["best_match"] else ""))
+
+        with open(args.review_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(not_found_files[0]))
+            writer.writeheader()
+            writer.writerows(not_found_files)
+        print(f"\nReview CSV: {args.review_csv}")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,13 @@
+import argparse
+import csv
 import os
-import shutil
-import json
+import time
 import mysql.connector
 
+from organizer import (CopyPlanner, Manifest, ParallelCopier, SourceIndex, parse_file_list,
+                       prefetch_rows)
+from reconcile import SUGGESTION_FIELDS, ReconcileIndex, find_or_suggest, suggestion_fields
+
 # --- Configuration ---
 SOURCE_DIR = r"C:\Users\gyan_\Downloads\uploads\rfqdocs"
 DEST_BASE_DIR = r"C:\Users\gyan_\Downloads\uploads\organized"
@@ -23,180 +28,144 @@ FILE_COLUMNS = [
 ]
 
 
-def parse_file_list(value):
-    """Parse file names from various formats the DB might store them in."""
-    if value is None:
-        return []
-
-    # Handle bytes
-    if isinstance(value, (bytes, bytearray)):
-        value = value.decode("utf-8")
-
-    # Convert to string
-    value = str(value).strip()
-
-    # Skip empty values
-    if value in ("", "[]", "null", "None", "NULL"):
-        return []
-
-    # Try JSON parse
-    try:
-        files = json.loads(value)
-        if isinstance(files, list):
-            return [str(f).strip() for f in files if f and str(f).strip()]
-        elif isinstance(files, str) and files.strip():
-            return [files.strip()]
-        return []
-    except (json.JSONDecodeError, TypeError, ValueError):
-        pass
-
-    # Manual parsing fallback - remove brackets and split
-    cleaned = value.strip("[]").strip()
-    if not cleaned:
-        return []
-
-    files = []
-    # Handle quoted comma-separated values
-    in_quote = False
-    current = ""
-    for char in cleaned:
-        if char == '"' or char == "'":
-            in_quote = not in_quote
-        elif char == "," and not in_quote:
-            part = current.strip().strip('"').strip("'").strip()
-            if part:
-                files.append(part)
-            current = ""
-        else:
-            current += char
-
-    # Don't forget last item
-    part = current.strip().strip('"').strip("'").strip()
-    if part:
-        files.append(part)
-
-    return files
+MISSING_CSV_FIELDS = ["column", "id", "rfq_id", "file_name", "raw_value"] + SUGGESTION_FIELDS
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Copy RFQ response documents into per-column folders")
+    parser.add_argument("--workers", type=int, default=16, help="Parallel copies")
+    parser.add_argument("--link", nargs="?", const="hard", choices=["hard", "reflink"],
+                        help="Hardlink (default) or reflink instead of copying when possible")
+    parser.add_argument("--manifest",
+                        default=os.path.join(DEST_BASE_DIR, ".rfq-response-docs-manifest.jsonl"),
+                        help="Record of what was copied where; re-runs only copy new or changed files")
+    parser.add_argument("--missing-csv", default=os.path.join(DEST_BASE_DIR, "rfq-response-missing.csv"),
+                        help="Where to write the files that were not found")
+    parser.add_argument("--accept-score", type=float,
+                        help="Copy fuzzy matches scoring at least this (0-1); otherwise they are "
+                             "only suggested in the missing-file CSV")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per fetchmany()")
+    parser.add_argument("--report-every", type=int, default=10000, help="Progress line every N rows")
+    args = parser.parse_args()
+
+    # Step 1: List all source files for matching (one pass; lookups are dict hits)
+    if not os.path.exists(SOURCE_DIR):
+        print(f"ERROR: Source directory does not exist: {SOURCE_DIR}")
+        return
+    source = SourceIndex(SOURCE_DIR)
+    reconciler = ReconcileIndex.from_source(source)
+    print(f"Total files in source folder: {len(source)}\n")
+
     conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
 
-    # Step 1: Check total row count
-    cursor.execute("SELECT COUNT(*) as total FROM `rfq_responses`")
-    total = cursor.fetchone()["total"]
+    # Step 2: Check total row count
+    cursor.execute("SELECT COUNT(*) FROM `rfq_responses`")
+    total = cursor.fetchone()[0]
     print(f"Total rows in rfq_responses table: {total}\n")
 
-    # Step 2: Fetch ALL rows (no limit, no filter)
-    cursor.execute(
-        "SELECT `id`, `rfq_id`, `quotation_document`, `technical_documents`, "
-        "`maf_document`, `mii_document` FROM `rfq_responses` ORDER BY `id`"
-    )
-    rows = cursor.fetchall()
-    print(f"Total records fetched by query: {len(rows)}\n")
-
-    # Step 3: List all source files for matching
-    source_files_set = set()
-    source_files_map = {}  # lowercase -> actual filename
-    if os.path.exists(SOURCE_DIR):
-        for f in os.listdir(SOURCE_DIR):
-            if os.path.isfile(os.path.join(SOURCE_DIR, f)):
-                source_files_set.add(f)
-                source_files_map[f.lower()] = f
-        print(f"Total files in source folder: {len(source_files_set)}\n")
-    else:
-        print(f"ERROR: Source directory does not exist: {SOURCE_DIR}")
-        return
+    # Step 3: Stream ALL rows (no limit, no filter). The default cursor is
+    # unbuffered: rows come off the socket as they're fetched instead of
+    # being loaded up front, and plain tuples are cheaper than dicts.
+    columns = ", ".join(f"`{c}`" for c in FILE_COLUMNS)
+    cursor.execute(f"SELECT `id`, `rfq_id`, {columns} FROM `rfq_responses` ORDER BY `id`")
 
-    copied_count = 0
-    not_found_files = []
-    empty_rows = 0
+    manifest = Manifest(args.manifest)
+    copier = ParallelCopier(args.workers, args.link, manifest)
+    planner = CopyPlanner(manifest, on_task=copier.submit)
 
-    # Step 4: Process EVERY row
+    fetched = 0
+    empty_rows = 0
+    not_found = 0
+    reconciled = 0
+    os.makedirs(os.path.dirname(os.path.abspath(args.missing_csv)), exist_ok=True)
+    missing_file = open(args.missing_csv, "w", newline="", encoding="utf-8")
+    missing = csv.DictWriter(missing_file, fieldnames=MISSING_CSV_FIELDS)
+    missing.writeheader()
+
+    # Step 4: Process EVERY row as it arrives. Fetching (background thread),
+    # parsing/planning (here) and copying (thread pool) overlap.
     print("=" * 70)
     print("PROCESSING ALL ROWS")
     print("=" * 70)
+    started = time.perf_counter()
 
-    for row in rows:
-        row_id = row["id"]
-        rfq_id = row["rfq_id"]
-        row_has_files = False
-
-        for col_name in FILE_COLUMNS:
-            raw_value = row.get(col_name)
-            file_names = parse_file_list(raw_value)
-
-            if not file_names:
-                continue
-
-            row_has_files = True
-
-            # Create folder for this column
-            dest_folder = os.path.join(DEST_BASE_DIR, col_name)
-            os.makedirs(dest_folder, exist_ok=True)
-
-            for file_name in file_names:
-                # Try exact match
-                source_file = os.path.join(SOURCE_DIR, file_name)
-                found = os.path.exists(source_file)
-
-                # Try case-insensitive match
-                if not found and file_name.lower() in source_files_map:
-                    actual_name = source_files_map[file_name.lower()]
-                    source_file = os.path.join(SOURCE_DIR, actual_name)
-                    found = True
-
-                if found:
-                    dest_file = os.path.join(dest_folder, file_name)
-
-                    # Handle duplicate file names
-                    if os.path.exists(dest_file):
-                        name_part, ext = os.path.splitext(file_name)
-                        dest_file = os.path.join(
-                            dest_folder,
-                            f"{name_part}_rfq{rfq_id}_id{row_id}{ext}"
-                        )
-
-                    shutil.copy2(source_file, dest_file)
-                    copied_count += 1
-                    print(f"  ✓ [id={row_id}] {col_name} → {file_name}")
-                else:
-                    not_found_files.append({
-                        "column": col_name,
-                        "id": row_id,
-                        "rfq_id": rfq_id,
-                        "file_name": file_name,
-                        "raw_value": repr(raw_value)
-                    })
-                    print(f"  ✗ [id={row_id}] {col_name} → NOT FOUND: {file_name}")
-
-        if not row_has_files:
-            empty_rows += 1
-            print(f"  - [id={row_id}] No files in any column")
-
-    cursor.close()
-    conn.close()
+    try:
+        for row in prefetch_rows(cursor, args.batch_size):
+            row_id, rfq_id = row[0], row[1]
+            fetched += 1
+            row_has_files = False
+
+            for col_name, raw_value in zip(FILE_COLUMNS, row[2:]):
+                file_names = parse_file_list(raw_value)
+
+                if not file_names:
+                    continue
+
+                row_has_files = True
+
+                # Folder for this column
+                dest_folder = os.path.join(DEST_BASE_DIR, col_name)
+
+                for file_name in file_names:
+                    # Exact match, then case-insensitive, then fuzzy
+                    source_file, suggestion = find_or_suggest(source, reconciler, file_name,
+                                                              args.accept_score)
+
+                    if source_file is not None:
+                        reconciled += suggestion is not None
+                        # Handle duplicate file names
+                        planner.plan(
+                            source_file, dest_folder, file_name,
+                            lambda name_part, ext, rfq_id=rfq_id, row_id=row_id:
+                                f"{name_part}_rfq{rfq_id}_id{row_id}{ext}",
+                            key=f"{col_name}/{row_id}/{file_name}")
+                    else:
+                        not_found += 1
+                        missing.writerow({
+                            "column": col_name,
+                            "id": row_id,
+                            "rfq_id": rfq_id,
+                            "file_name": file_name,
+                            "raw_value": repr(raw_value),
+                            **suggestion_fields(suggestion)
+                        })
+
+            if not row_has_files:
+                empty_rows += 1
+
+            if fetched % args.report_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  ... {fetched}/{total} rows in {elapsed:.0f}s ({fetched / elapsed:.0f} rows/s), "
+                      f"{planner.planned} copies queued, {not_found} not found")
+    finally:
+        missing_file.close()
+        result = copier.close()
+        manifest.close()
+        cursor.close()
+        conn.close()
 
     # --- Summary ---
     print(f"\n{'=' * 70}")
     print(f"SUMMARY")
     print(f"{'=' * 70}")
     print(f"Total rows in DB:            {total}")
-    print(f"Total rows fetched:          {len(rows)}")
+    print(f"Total rows fetched:          {fetched}")
     print(f"Rows with no files:          {empty_rows}")
-    print(f"Rows with files:             {len(rows) - empty_rows}")
-    print(f"Total files copied:          {copied_count}")
-    print(f"Total files not found:       {len(not_found_files)}")
-    print(f"Files in source folder:      {len(source_files_set)}")
-
-    if not_found_files:
-        print(f"\n{'=' * 70}")
-        print(f"MISSING FILES DETAILS")
-        print(f"{'=' * 70}")
-        for nf in not_found_files:
-            print(f"  ID: {nf['id']}, RFQ: {nf['rfq_id']}, "
-                  f"Col: {nf['column']}, File: {nf['file_name']}")
-            print(f"    Raw DB value: {nf['raw_value']}")
+    print(f"Rows with files:             {fetched - empty_rows}")
+    print(f"Total files copied:          {result['copied'] + result['linked']}")
+    print(f"Already up to date:          {planner.up_to_date + result['unchanged']}")
+    print(f"Failed copies:               {len(result['failed'])}")
+    print(f"Total files not found:       {not_found}")
+    print(f"Fuzzy-matched and copied:    {reconciled}")
+    print(f"Files in source folder:      {len(source)}")
+    print(f"Elapsed:                     {time.perf_counter() - started:.1f}s")
+
+    for f in result["failed"]:
+        print(f"  FAILED: {f['source']} -> {f['dest']}: {f['error']}")
+
+    if not_found:
+        print(f"\nMissing file details (with suggested matches) written to {args.missing_csv}")
 
     # Show what folders were created
     print(f"\n{'=' * 70}")
@@ -1,3 +1,5 @@
+import argparse
+import time
 import psycopg2
 
 # --- Configuration ---
@@ -26,33 +28,75 @@ PATH_PREFIX_MAP = {
 }
 
 
-def clean_path(raw_path):
-    """
-    Clean broken JSON artifacts from path.
-    Examples:
-      '["398445437_MAF_(7).pdf"]'                        → '398445437_MAF_(7).pdf'
-      '"252158409_file.pdf"'                              → '252158409_file.pdf'
-      '"1034741108_file.pdf"]'                            → '1034741108_file.pdf'
-      '["178347812_file.pdf"'                             → '178347812_file.pdf'
-      '[]'                                                → ''
-      'rfq-response-quotation/1772089779741_file.jpeg'   → 'rfq-response-quotation/1772089779741_file.jpeg' (unchanged)
-    """
-    if not raw_path:
-        return ""
-
-    cleaned = raw_path.strip()
-
-    # Remove leading/trailing brackets and quotes
-    cleaned = cleaned.strip("[").strip("]").strip('"').strip("'").strip()
-
-    # If it's empty after cleaning (was "[]")
-    if not cleaned:
-        return ""
+# Cleans broken JSON artifacts from the `path` column inside Postgres, in one
+# set-based UPDATE per id range: trim whitespace, then [ ] " ' from both ends
+# (in that order), then whitespace. Paths that end up empty become NULL.
+#   '["398445437_MAF_(7).pdf"]'   -> '398445437_MAF_(7).pdf'
+#   '"1034741108_file.pdf"]'      -> '1034741108_file.pdf'
+#   '[]'                          -> NULL
+#   'rfq-response-quotation/1772089779741_file.jpeg' (unchanged)
+CLEAN_PATH_SQL = r"""regexp_replace(
+    btrim(btrim(btrim(btrim(regexp_replace(path, '^\s+|\s+$', '', 'g'), '['), ']'), '"'), ''''),
+    '^\s+|\s+$', '', 'g')"""
+
+CLEAN_BATCH_SQL = f"""
+    WITH changed AS (
+        UPDATE rfq_response_documents
+        SET path = NULLIF({CLEAN_PATH_SQL}, '')
+        WHERE id >= %s AND id < %s
+          AND path IS NOT NULL
+          AND {CLEAN_PATH_SQL} <> path
+        RETURNING path
+    )
+    SELECT COUNT(*), COUNT(*) FILTER (WHERE path IS NULL) FROM changed
+"""
+
+
+def clean_paths(conn, cursor, batch_size, commit_batches):
+    """Step 1 as one set-based UPDATE per id range; returns (cleaned, emptied)."""
+    cursor.execute("SELECT MIN(id), MAX(id) FROM rfq_response_documents")
+    min_id, max_id = cursor.fetchone()
+    if min_id is None:
+        return 0, 0
+
+    # Show a few of the changes before making them
+    cursor.execute(f"""
+        SELECT id, path, {CLEAN_PATH_SQL}
+        FROM rfq_response_documents
+        WHERE path IS NOT NULL AND {CLEAN_PATH_SQL} <> path
+        ORDER BY id
+        LIMIT 10
+    """)
+    for row_id, raw_path, cleaned in cursor.fetchall():
+        if not cleaned:
+            print(f"  ✓ [id={row_id}] EMPTIED (was {raw_path!r})")
+        else:
+            print(f"  ✓ [id={row_id}] {raw_path!r} → {cleaned!r}")
 
-    return cleaned
+    cleaned_count = 0
+    emptied_count = 0
+    started = time.perf_counter()
+    for lo in range(min_id, max_id + 1, batch_size):
+        hi = min(lo + batch_size, max_id + 1)
+        cursor.execute(CLEAN_BATCH_SQL, (lo, hi))
+        changed, emptied = cursor.fetchone()
+        cleaned_count += changed
+        emptied_count += emptied
+        if commit_batches:
+            conn.commit()
+        print(f"  ... ids up to {hi - 1} ({(hi - min_id) / (max_id + 1 - min_id):.0%}): "
+              f"{cleaned_count} cleaned in {time.perf_counter() - started:.1f}s")
+    return cleaned_count, emptied_count
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Normalize doc_type and path in rfq_response_documents")
+    parser.add_argument("--batch-size", type=int, default=100000, help="Ids per Step 1 UPDATE")
+    parser.add_argument("--commit-batches", action="store_true",
+                        help="Commit each Step 1 batch as it finishes (safe to re-run) instead of "
+                             "holding everything for the final confirmation")
+    args = parser.parse_args()
+
     conn = psycopg2.connect(**PG_CONFIG)
     cursor = conn.cursor()
 
@@ -83,39 +127,7 @@ def main():
     print("STEP 1: Cleaning broken JSON from path column")
     print("=" * 70)
 
-    # Fetch all rows to clean
-    cursor.execute("""
-        SELECT id, doc_type, path, rfq_response_id
-        FROM rfq_response_documents
-        ORDER BY id
-    """)
-    all_rows = cursor.fetchall()
-
-    cleaned_count = 0
-    emptied_count = 0
-
-    for row_id, doc_type, raw_path, rfq_response_id in all_rows:
-        if raw_path is None:
-            continue
-
-        cleaned = clean_path(raw_path)
-
-        if cleaned != raw_path:
-            cursor.execute("""
-                UPDATE rfq_response_documents
-                SET path = %s
-                WHERE id = %s
-            """, (cleaned if cleaned else None, row_id))
-
-            cleaned_count += 1
-
-            if not cleaned:
-                emptied_count += 1
-                print(f"  ✓ [id={row_id}] EMPTIED (was '[]' or empty)")
-            else:
-                print(f"  ✓ [id={row_id}] Cleaned:")
-                print(f"      BEFORE: {repr(raw_path)}")
-                print(f"      AFTER:  {repr(cleaned)}")
+    cleaned_count, emptied_count = clean_paths(conn, cursor, args.batch_size, args.commit_batches)
 
     print(f"\n  Paths cleaned: {cleaned_count}")
     print(f"  Paths emptied: {emptied_count}")
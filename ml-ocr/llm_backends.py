@@ -0,0 +1,497 @@
+"""
+Unified LLM backend layer over OpenAI and the self-hosted (Ollama) server.
+
+Modes:
+  - single:   only the first backend in `order`
+  - fallback: try backends in order until one answers
+  - hedged:   start the first backend; if it is slower than its observed latency
+              percentile, start the next one too. First answer wins; the loser's
+              connection is closed, which stops its generation.
+
+Every backend call is retried with backoff and guarded by a circuit breaker, so a
+backend that keeps failing is skipped until its reset timeout has passed.
+Base URLs are configurable, so any mode can be exercised against llm_stub_server.py.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+from typing import Callable, Dict, Any, Iterable, List, Optional
+
+from concurrency import get_limiter
+from retrieval import FIELD_GROUPS, select_windows
+from llm_prompts import (
+    CLEAN_SYSTEM_PROMPT,
+    extract_system_prompt,
+    build_clean_user,
+    build_extract_user,
+    merge_clean_results,
+    merge_extractions,
+)
+from self_hosted_llm import CancelEvent, GenerationCancelled, LocalLLMClient, abort_on_cancel
+from token_budget import (
+    TokenUsage,
+    PromptBudgetError,
+    check_budget,
+    estimate_tokens,
+    estimate_messages_tokens,
+    ledger,
+    prompt_budget,
+    split_to_budget,
+)
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here (env vars override for deployments / stub testing)
+ROUTER_CONFIG = {
+    "mode": os.getenv("LLM_MODE", "fallback"),                  # single | fallback | hedged
+    "order": os.getenv("LLM_BACKENDS", "openai,local").split(","),
+    "openai_base_url": os.getenv("OPENAI_BASE_URL"),            # None -> api.openai.com
+    "openai_model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    "local_base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+    "local_model": os.getenv("OLLAMA_MODEL", "llama3.1:8b"),
+    "timeout": 120.0,           # Per attempt, seconds
+    "max_retries": 2,           # Extra attempts per backend call
+    "retry_backoff": 0.5,       # Seconds, doubled per retry
+    "hedge_percentile": 0.95,   # Hedge once the primary is slower than this percentile
+    "hedge_min_samples": 20,    # Below this many samples use hedge_default_delay
+    "hedge_default_delay": 5.0,
+    "breaker_failures": 5,      # Consecutive failures that open the breaker
+    "breaker_reset": 30.0,      # Seconds before a half-open trial call
+}
+
+
+class BackendError(RuntimeError):
+    """A backend call failed (after retries) or returned unusable output."""
+
+
+class InvalidJSONError(BackendError):
+    """The backend answered, but not with JSON; `content` is the raw reply."""
+
+    def __init__(self, backend: str, content: str, error: Exception):
+        self.content = content
+        super().__init__(f"{backend} returned invalid JSON: {error}")
+
+
+class AllBackendsFailed(RuntimeError):
+    """No backend produced an answer."""
+
+    def __init__(self, errors: List[BaseException]):
+        self.errors = errors
+        super().__init__("All LLM backends failed: " + "; ".join(str(e) for e in errors))
+
+    def invalid_reply(self) -> Optional[str]:
+        """Raw reply of the last backend that gave up on invalid JSON, if any did."""
+        for e in reversed(self.errors):
+            cause = e if isinstance(e, InvalidJSONError) else e.__cause__
+            if isinstance(cause, InvalidJSONError):
+                return cause.content
+        return None
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after reset timeout."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int, default: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return default
+        idx = min(len(samples) - 1, int(p * len(samples)))
+        return samples[idx]
+
+
+class LLMBackend:
+    """Base class: complete_json(system, user) -> parsed JSON dict."""
+
+    name = "base"
+    model = ""
+
+    def complete_json(self, system: str, user: str, stage: str, temperature: float,
+                      max_tokens: int, cancel_event: CancelEvent) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, model: str, base_url: Optional[str] = None, timeout: float = 120.0,
+                 api_key: Optional[str] = None):
+        self.model = model
+        self.base_url = base_url
+        self.timeout = timeout
+        self.api_key = api_key
+        self._client = None
+
+    def _get_client(self):
+        # Imported here so local-only deployments don't need the SDK or CONSTANTS
+        if self._client is None:
+            from openai import OpenAI
+            api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                from CONSTANTS import OPENAI_API_KEY
+                api_key = OPENAI_API_KEY
+            self._client = OpenAI(api_key=api_key, base_url=self.base_url,
+                                  timeout=self.timeout, max_retries=0)
+        return self._client
+
+    def complete_json(self, system, user, stage, temperature, max_tokens, cancel_event):
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ]
+        estimated = estimate_messages_tokens(messages)
+        check_budget(estimated, self.model, max_tokens)
+
+        # Streamed so that a cancelled hedge closes the connection early
+        with get_limiter("openai").slot(tokens=estimated + max_tokens,
+                                        neutral=(GenerationCancelled,)) as permit:
+            stream = self._get_client().chat.completions.create(
+                model=self.model,
+                temperature=temperature,
+                response_format={"type": "json_object"},
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            pieces = []
+            usage = None
+            try:
+                with abort_on_cancel(cancel_event, stream.close):
+                    for chunk in stream:
+                        if cancel_event.is_set():
+                            raise GenerationCancelled("generation cancelled")
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            pieces.append(chunk.choices[0].delta.content)
+                        if getattr(chunk, "usage", None):
+                            usage = chunk.usage
+            finally:
+                stream.close()
+
+            if usage is not None:
+                details = getattr(usage, "prompt_tokens_details", None)
+                ledger.record(TokenUsage(
+                    stage=stage,
+                    model=self.model,
+                    prompt_tokens=usage.prompt_tokens or 0,
+                    completion_tokens=usage.completion_tokens or 0,
+                    cached_tokens=(getattr(details, "cached_tokens", 0) or 0) if details else 0,
+                    estimated_prompt_tokens=estimated,
+                ))
+                permit.tokens_used = (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+        return _parse_json("".join(pieces) or "{}", self.name)
+
+
+class LocalBackend(LLMBackend):
+    name = "local"
+
+    def __init__(self, model: str, base_url: str = "http://localhost:11434", timeout: float = 120.0):
+        self.model = model
+        self.client = LocalLLMClient(base_url=base_url, timeout=timeout)
+
+    def complete_json(self, system, user, stage, temperature, max_tokens, cancel_event):
+        response = self.client.generate(user, model=self.model, temperature=temperature,
+                                        format="json", system=system, stage=stage,
+                                        cancel_event=cancel_event, max_tokens=max_tokens)
+        return _parse_json(response, self.name)
+
+
+def _parse_json(content: str, backend: str) -> Dict[str, Any]:
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError as e:
+        # Invalid JSON counts as a failure so the router can retry or fall back
+        raise InvalidJSONError(backend, content, e)
+
+
+class BackendRouter:
+    def __init__(self, backends: List[LLMBackend], mode: str = "fallback",
+                 config: Optional[Dict[str, Any]] = None):
+        if mode not in ("single", "fallback", "hedged"):
+            raise ValueError(f"Unknown LLM routing mode: {mode}")
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = backends
+        self.mode = mode
+        self.config = {**ROUTER_CONFIG, **(config or {})}
+        self.breakers = {b.name: CircuitBreaker(self.config["breaker_failures"],
+                                                self.config["breaker_reset"]) for b in backends}
+        self.latency = {b.name: LatencyTracker() for b in backends}
+        # Enough threads for every slot the backends' limiters may ever grant,
+        # so the pool never caps hedged concurrency below the limiters
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(get_limiter(b.name).max_limit for b in backends),
+            thread_name_prefix="llm-hedge")
+
+    def min_prompt_budget(self, max_tokens: int) -> int:
+        """Smallest prompt budget among backends, since any of them may serve a call."""
+        return min(prompt_budget(b.model, max_tokens) for b in self.backends)
+
+    def complete_json(self, system: str, user: str, stage: str = "chat",
+                      temperature: float = 0.0, max_tokens: int = 2000) -> Dict[str, Any]:
+        request = (system, user, stage, temperature, max_tokens)
+        backends = self.backends[:1] if self.mode == "single" else self.backends
+        if self.mode == "hedged" and len(backends) > 1:
+            return self._hedged(backends, request)
+        errors: List[BaseException] = []
+        for backend in backends:
+            try:
+                return self._call_with_retries(backend, request, CancelEvent())
+            except PromptBudgetError:
+                raise
+            except Exception as e:
+                logger.warning(f"LLM backend '{backend.name}' failed: {e}")
+                errors.append(e)
+        raise AllBackendsFailed(errors)
+
+    def _call_with_retries(self, backend: LLMBackend, request, cancel_event: CancelEvent):
+        breaker = self.breakers[backend.name]
+        delay = self.config["retry_backoff"]
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.config["max_retries"] + 1):
+            if cancel_event.is_set():
+                raise GenerationCancelled("generation cancelled")
+            if not breaker.allow():
+                raise BackendError(f"circuit open for backend '{backend.name}'")
+            started = time.monotonic()
+            try:
+                result = backend.complete_json(*request, cancel_event=cancel_event)
+            except (PromptBudgetError, GenerationCancelled):
+                # Neither says anything about the backend's health
+                breaker.release_trial()
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                last_error = e
+                logger.info(f"LLM backend '{backend.name}' attempt {attempt + 1} failed: {e}")
+                if attempt < self.config["max_retries"] and not cancel_event.wait(delay):
+                    delay *= 2
+                continue
+            breaker.record_success()
+            self.latency[backend.name].add(time.monotonic() - started)
+            return result
+        raise BackendError(f"backend '{backend.name}' failed after retries: {last_error}") from last_error
+
+    def _hedged(self, backends: List[LLMBackend], request) -> Dict[str, Any]:
+        cfg = self.config
+        remaining = list(backends)
+        in_flight = {}  # future -> (backend, cancel_event)
+        errors: List[BaseException] = []
+
+        def launch():
+            backend = remaining.pop(0)
+            event = CancelEvent()
+            future = self._executor.submit(self._call_with_retries, backend, request, event)
+            in_flight[future] = (backend, event)
+            return backend
+
+        primary = launch()
+        hedge_delay = self.latency[primary.name].percentile(
+            cfg["hedge_percentile"], cfg["hedge_min_samples"], cfg["hedge_default_delay"])
+
+        deadline = time.monotonic() + hedge_delay
+        while in_flight:
+            timeout = max(0.0, deadline - time.monotonic()) if remaining else None
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = launch()
+                logger.info(f"Hedging: '{primary.name}' exceeded {hedge_delay:.2f}s, "
+                            f"also asking '{hedged.name}'")
+                deadline = time.monotonic() + hedge_delay
+                continue
+            for future in done:
+                backend, _ = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except PromptBudgetError:
+                    self._cancel_all(in_flight)
+                    raise
+                except Exception as e:
+                    logger.warning(f"LLM backend '{backend.name}' failed: {e}")
+                    errors.append(e)
+                    continue
+                self._cancel_all(in_flight)
+                return result
+            # A failure should not wait out the hedge delay before trying the next backend
+            if not in_flight and remaining:
+                launch()
+        raise AllBackendsFailed(errors)
+
+    @staticmethod
+    def _cancel_all(in_flight) -> None:
+        for future, (backend, event) in in_flight.items():
+            event.set()
+            future.cancel()
+            logger.info(f"Cancelled losing request to '{backend.name}'")
+
+
+def build_backend(name: str, config: Dict[str, Any]) -> LLMBackend:
+    if name == "openai":
+        return OpenAIBackend(config["openai_model"], base_url=config["openai_base_url"],
+                             timeout=config["timeout"])
+    if name == "local":
+        return LocalBackend(config["local_model"], base_url=config["local_base_url"],
+                            timeout=config["timeout"])
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+
+_router: Optional[BackendRouter] = None
+_single_routers: Dict[tuple, BackendRouter] = {}
+_router_lock = threading.Lock()
+
+
+def get_router() -> BackendRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            backends = [build_backend(n.strip(), ROUTER_CONFIG)
+                        for n in ROUTER_CONFIG["order"] if n.strip()]
+            _router = BackendRouter(backends, mode=ROUTER_CONFIG["mode"])
+    return _router
+
+
+def single_backend_router(name: str, model: str) -> BackendRouter:
+    """Shared router over one backend and model (llm_postprocess, self_hosted_llm)."""
+    with _router_lock:
+        key = (name, model)
+        if key not in _single_routers:
+            backend = build_backend(name, {**ROUTER_CONFIG, f"{name}_model": model})
+            _single_routers[key] = BackendRouter([backend], mode="single")
+        return _single_routers[key]
+
+
+def _chunk_limit(router: BackendRouter, system: str, build_user: Callable[[str], str],
+                 max_tokens: int) -> int:
+    """Tokens left for the document text once the stage's own prompt is taken out."""
+    overhead = estimate_tokens(system) + estimate_tokens(build_user("")) + 8
+    return router.min_prompt_budget(max_tokens) - overhead
+
+
+def clean_ocr_text(
+    text: str,
+    preserve_case: bool = True,
+    keep_hindi: bool = True,
+    standardize_tokens: bool = True,
+    max_tokens: int = 2000,
+    router: Optional[BackendRouter] = None,
+) -> Dict[str, Any]:
+    """
+    Same contract as llm_postprocess.clean_ocr_text, served through the router.
+    A chunk no backend could clean (after retries, e.g. replies that never
+    parse as JSON) is kept as it was, so cleanup never fails the document.
+    """
+    router = router or get_router()
+    # The cleaned text is echoed back, so chunks must also fit the completion
+    build_user = partial(build_clean_user, preserve_case=preserve_case, keep_hindi=keep_hindi,
+                         standardize_tokens=standardize_tokens)
+    limit = min(_chunk_limit(router, CLEAN_SYSTEM_PROMPT, build_user, max_tokens),
+                int(max_tokens * 0.75))
+    parts = []
+    for chunk in split_to_budget(text, limit):
+        try:
+            parts.append(router.complete_json(CLEAN_SYSTEM_PROMPT, build_user(chunk), stage="clean",
+                                              temperature=0.1, max_tokens=max_tokens))
+        except AllBackendsFailed as e:
+            logger.warning(f"Cleanup failed, keeping the original chunk: {e}")
+            parts.append({"cleaned_text": chunk, "notes": ["Parsing failed, returning original"]})
+    return merge_clean_results(parts)
+
+
+def extract_structured_fields(
+    text: str,
+    max_tokens: int = 2000,
+    on_overflow: str = "split",
+    use_retrieval: bool = True,
+    include_items: bool = True,
+    router: Optional[BackendRouter] = None,
+    skip_fields: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """
+    Same contract as llm_postprocess.extract_structured_fields, served through the router.
+    skip_fields: fields already known (e.g. from ner_extract); retrieval groups
+    made up only of these are not searched for.
+    """
+    router = router or get_router()
+    system = extract_system_prompt(include_items)
+    limit = _chunk_limit(router, system, build_extract_user, max_tokens)
+    sources = None
+    if use_retrieval:
+        skip = set(skip_fields)
+        groups = [g for g in FIELD_GROUPS
+                  if (include_items or g != "items") and not set(FIELD_GROUPS[g]["fields"]) <= skip]
+        text, sources = select_windows(text, groups=groups)
+    if on_overflow == "refuse" and estimate_tokens(text) > limit:
+        raise PromptBudgetError(f"Document of ~{estimate_tokens(text)} tokens exceeds "
+                                f"extraction budget of {limit}")
+    parts = []
+    for chunk in split_to_budget(text, limit):
+        parts.append(router.complete_json(system, build_extract_user(chunk),
+                                          stage="extract", temperature=0.0, max_tokens=max_tokens))
+    result = merge_extractions(parts)
+    if sources is not None:
+        result["source_windows"] = sources
+    return result
@@ -1,38 +1,12 @@
-import os
-import json
+"""
+OpenAI-only clean / extract entry points, kept for existing callers. They are
+served by llm_backends with the OpenAI backend alone, so chunking, budgets,
+retries and rate limiting are the same as for every other route.
+"""
 import logging
-from typing import Dict, Any, Optional
-from openai import OpenAI
-from CONSTANTS import OPENAI_API_KEY
-
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+from typing import Dict, Any, Iterable
 
 logger = logging.getLogger(__name__)
-_client: Optional[OpenAI] = None
-
-def get_client() -> OpenAI:
-    global _client
-    if _client is None:
-        if not os.getenv("OPENAI_API_KEY"):
-            raise RuntimeError("OPENAI_API_KEY not set")
-        _client = OpenAI()
-    return _client
-
-def _chat_json(messages, model="gpt-4o-mini", temperature=0.2, max_tokens=2000) -> Dict[str, Any]:
-    client = get_client()
-    resp = client.chat.completions.create(
-        model=model,
-        temperature=temperature,
-        response_format={"type": "json_object"},
-        messages=messages,
-        max_tokens=max_tokens,
-    )
-    content = resp.choices[0].message.content or "{}"
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        logger.warning("Model did not return valid JSON; returning raw text")
-        return {"cleaned_text": content}
 
 def clean_ocr_text(
     text: str,
@@ -40,6 +14,7 @@ def clean_ocr_text(
     keep_hindi: bool = True,
     standardize_tokens: bool = True,
     model: str = "gpt-4o-mini",
+    max_tokens: int = 2000,
 ) -> Dict[str, Any]:
     """
     Return JSON with:
@@ -47,101 +22,42 @@ def clean_ocr_text(
       - notes: list[str] (what was fixed)
       - removed_lines: list[str]
       - stats: dict
+
+    Text that would not fit the prompt budget (or whose cleaned copy would
+    not fit max_tokens) is cleaned in chunks and stitched back together.
     """
-    system = (
-        "You clean OCR'd text with minimal hallucination. "
-        "Preserve meaning and wording; fix spacing, broken words, punctuation, "
-        "and common OCR errors (0/O, rn/m, E&M, quotes, dashes). "
-        "Merge soft-wrapped lines and hyphenated words across line breaks. "
-        "Remove recurring headers/footers if confidently identified. "
-        "If bilingual (English + Hindi Devanagari), keep Hindi as-is; do not romanize."
-    )
-    user = {
-        "text": text,
-        "requirements": {
-            "preserve_case": preserve_case,
-            "keep_hindi": keep_hindi,
-            "standardize_tokens": standardize_tokens,
-            "standardizations": [
-                "Dates to ISO yyyy-mm-dd where unambiguous",
-                "Currency to 'INR <amount>'",
-                "Percent spacing normalized (e.g., '50%')",
-            ],
-        },
-        "output_format": {
-            "type": "object",
-            "properties": {
-                "cleaned_text": {"type": "string"},
-                "notes": {"type": "array", "items": {"type": "string"}},
-                "removed_lines": {"type": "array", "items": {"type": "string"}},
-                "stats": {"type": "object"},
-            },
-            "required": ["cleaned_text"],
-        },
-    }
-    messages = [
-        {"role": "system", "content": system},
-        {
-            "role": "user",
-            "content": (
-                "Clean and normalize this OCR text. Return a JSON object with keys "
-                "'cleaned_text', 'notes', 'removed_lines', and 'stats'.\n\n"
-                + json.dumps(user, ensure_ascii=False)
-            ),
-        },
-    ]
-    return _chat_json(messages, model=model, temperature=0.1)
+    from llm_backends import clean_ocr_text as clean, single_backend_router
+
+    return clean(text, preserve_case, keep_hindi, standardize_tokens, max_tokens=max_tokens,
+                 router=single_backend_router("openai", model))
 
 def extract_structured_fields(
     text: str,
     model: str = "gpt-4o-mini",
+    max_tokens: int = 2000,
+    on_overflow: str = "split",
+    use_retrieval: bool = True,
+    include_items: bool = True,
+    skip_fields: Iterable[str] = (),
 ) -> Dict[str, Any]:
     """
     Extracts a tender-like schema. Adjust fields as needed.
+    on_overflow: "split" extracts per chunk and merges, "refuse" raises PromptBudgetError.
+    use_retrieval: send only the BM25-selected windows of long documents; their
+    offsets into `text` are returned under "source_windows".
+    include_items: set False when items already came from table_extract.
+    A reply that is still not JSON after retries comes back as {"cleaned_text": reply}.
     """
-    schema = {
-        "type": "object",
-        "properties": {
-            "document_type": {"type": "string", "enum": ["tender", "unknown"]},
-            "title": {"type": "string"},
-            "buyer": {"type": "string"},
-            "tender_id": {"type": "string"},
-            "publication_date": {"type": "string", "description": "yyyy-mm-dd if present"},
-            "submission_deadline": {"type": "string", "description": "yyyy-mm-dd if present"},
-            "estimated_value_inr": {"type": "number"},
-            "currency": {"type": "string", "default": "INR"},
-            "contact": {"type": "string"},
-            "address": {"type": "string"},
-            "items": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "description": {"type": "string"},
-                        "quantity": {"type": "number"},
-                        "unit": {"type": "string"},
-                        "specs": {"type": "string"},
-                    },
-                },
-            },
-            "notes": {"type": "string"},
-            "confidence": {"type": "number"},
-        },
-        "required": ["document_type"],
-    }
+    from llm_backends import (AllBackendsFailed, extract_structured_fields as extract,
+                              single_backend_router)
 
-    system = (
-        "You are a precise information extractor. "
-        "Only use facts in the text; do not invent values. "
-        "If you are unsure, return null for that field."
-    )
-    prompt = {
-        "instruction": "Extract the following fields from the OCR text. Return JSON only.",
-        "schema": schema,
-        "text": text,
-    }
-    messages = [
-        {"role": "system", "content": system},
-        {"role": "user", "content": json.dumps(prompt, ensure_ascii=False)},
-    ]
-    return _chat_json(messages, model=model, temperature=0.0)
+    try:
+        return extract(text, max_tokens=max_tokens, on_overflow=on_overflow,
+                       use_retrieval=use_retrieval, include_items=include_items,
+                       router=single_backend_router("openai", model), skip_fields=skip_fields)
+    except AllBackendsFailed as e:
+        reply = e.invalid_reply()
+        if reply is None:
+            raise
+        logger.warning("Model did not return valid JSON; returning raw text")
+        return {"cleaned_text": reply}
@@ -0,0 +1,193 @@
+"""
+Shared prompt layout for the OCR cleanup and field extraction stages.
+
+Everything static (instructions, schema, example) lives in the system prompt and
+is serialized once at import, so the prefix sent to the server is byte-identical
+across calls and can be served from the provider's prompt / KV-prefix cache.
+Per-call content (options, then the document text) always comes last.
+"""
+import json
+from typing import Dict, Any, List
+
+
+def _dump(obj: Any) -> str:
+    # Fixed separators/ordering so the serialized prefix never varies
+    return json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+CLEAN_OUTPUT_FORMAT = {
+    "type": "object",
+    "properties": {
+        "cleaned_text": {"type": "string"},
+        "notes": {"type": "array", "items": {"type": "string"}},
+        "removed_lines": {"type": "array", "items": {"type": "string"}},
+        "stats": {"type": "object"},
+    },
+    "required": ["cleaned_text"],
+}
+
+CLEAN_STANDARDIZATIONS = [
+    "Dates to ISO yyyy-mm-dd where unambiguous",
+    "Currency to 'INR <amount>'",
+    "Percent spacing normalized (e.g., '50%')",
+]
+
+CLEAN_SYSTEM_PROMPT = (
+    "You clean OCR'd text with minimal hallucination. "
+    "Preserve meaning and wording; fix spacing, broken words, punctuation, "
+    "and common OCR errors (0/O, rn/m, E&M, quotes, dashes). "
+    "Merge soft-wrapped lines and hyphenated words across line breaks. "
+    "Remove recurring headers/footers if confidently identified. "
+    "If bilingual (English + Hindi Devanagari), keep Hindi as-is; do not romanize.\n\n"
+    "When standardize_tokens is true, apply these standardizations:\n"
+    + "\n".join(f"- {s}" for s in CLEAN_STANDARDIZATIONS)
+    + "\n\nReturn ONLY a JSON object with keys 'cleaned_text', 'notes', "
+    "'removed_lines', and 'stats', matching this JSON schema:\n"
+    + _dump(CLEAN_OUTPUT_FORMAT)
+)
+
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "document_type": {"type": "string", "enum": ["tender", "unknown"]},
+        "title": {"type": "string"},
+        "buyer": {"type": "string"},
+        "tender_id": {"type": "string"},
+        "publication_date": {"type": "string", "description": "yyyy-mm-dd if present"},
+        "submission_deadline": {"type": "string", "description": "yyyy-mm-dd if present"},
+        "estimated_value_inr": {"type": "number"},
+        "currency": {"type": "string", "default": "INR"},
+        "contact": {"type": "string"},
+        "address": {"type": "string"},
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "description": {"type": "string"},
+                    "quantity": {"type": "number"},
+                    "unit": {"type": "string"},
+                    "specs": {"type": "string"},
+                },
+            },
+        },
+        "notes": {"type": "string"},
+        "confidence": {"type": "number"},
+    },
+    "required": ["document_type"],
+}
+
+EXTRACTION_EXAMPLE = {
+    "document_type": "tender",
+    "title": "Supply of Laboratory Equipment",
+    "buyer": "AIIMS Delhi",
+    "tender_id": "AIIMS/PUR/2024/123",
+    "publication_date": "2024-01-15",
+    "submission_deadline": "2024-02-15",
+    "estimated_value_inr": 5000000.0,
+    "currency": "INR",
+    "contact": "Dr. Sharma (procurement@aiims.edu)",
+    "address": "AIIMS, Ansari Nagar, New Delhi",
+    "items": [
+        {
+            "description": "Laboratory Centrifuge",
+            "quantity": 5,
+            "unit": "pieces",
+            "specs": "Min 5000 RPM, refrigerated"
+        }
+    ],
+    "notes": "EMD: 2% of tender value",
+    "confidence": 0.9
+}
+
+def _extract_system_prompt(include_items: bool) -> str:
+    schema, example = EXTRACTION_SCHEMA, EXTRACTION_EXAMPLE
+    if not include_items:
+        # Items come from the table extractor; leave them out of the request entirely
+        schema = {**schema, "properties": {k: v for k, v in schema["properties"].items() if k != "items"}}
+        example = {k: v for k, v in example.items() if k != "items"}
+    return (
+        "You are a precise information extractor. "
+        "Only use facts in the text; do not invent values. "
+        "If you are unsure, return null for that field. "
+        "The text may be a set of excerpts from a longer document.\n\n"
+        "Extract the fields of this JSON schema from the OCR text and return JSON only:\n"
+        + _dump(schema)
+        + "\n\nExample output:\n"
+        + _dump(example)
+    )
+
+
+EXTRACT_SYSTEM_PROMPT = _extract_system_prompt(include_items=True)
+EXTRACT_SYSTEM_PROMPT_NO_ITEMS = _extract_system_prompt(include_items=False)
+
+
+def extract_system_prompt(include_items: bool = True) -> str:
+    return EXTRACT_SYSTEM_PROMPT if include_items else EXTRACT_SYSTEM_PROMPT_NO_ITEMS
+
+
+def build_clean_user(
+    text: str,
+    preserve_case: bool = True,
+    keep_hindi: bool = True,
+    standardize_tokens: bool = True,
+) -> str:
+    options = {
+        "keep_hindi": keep_hindi,
+        "preserve_case": preserve_case,
+        "standardize_tokens": standardize_tokens,
+    }
+    return f"Options: {json.dumps(options, sort_keys=True)}\n\nOCR text:\n{text}"
+
+
+def build_extract_user(text: str) -> str:
+    return f"OCR text:\n{text}"
+
+
+def merge_clean_results(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Stitch per-chunk cleanup results back into one result."""
+    if len(parts) == 1:
+        return parts[0]
+    merged: Dict[str, Any] = {"cleaned_text": "", "notes": [], "removed_lines": [],
+                              "stats": {"chunks": len(parts)}}
+    merged["cleaned_text"] = "\n\n".join(p.get("cleaned_text", "") for p in parts).strip()
+    for p in parts:
+        merged["notes"].extend(p.get("notes") or [])
+        merged["removed_lines"].extend(p.get("removed_lines") or [])
+    return merged
+
+
+def merge_extractions(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine per-chunk extractions: first non-null scalar wins, items are
+    concatenated, notes joined, confidence is the mean of reported values.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    merged: Dict[str, Any] = {}
+    items: List[Any] = []
+    notes: List[str] = []
+    confidences: List[float] = []
+    for p in parts:
+        for key, value in p.items():
+            if key == "items":
+                items.extend(value or [])
+            elif key == "notes":
+                if value:
+                    notes.append(str(value))
+            elif key == "confidence":
+                if isinstance(value, (int, float)):
+                    confidences.append(float(value))
+            elif key == "document_type":
+                if merged.get(key) in (None, "unknown") and value:
+                    merged[key] = value
+            elif merged.get(key) in (None, "") and value not in (None, ""):
+                merged[key] = value
+    merged.setdefault("document_type", "unknown")
+    if items or any("items" in p for p in parts):
+        merged["items"] = items
+    if notes:
+        merged["notes"] = "\n".join(notes)
+    if confidences:
+        merged["confidence"] = sum(confidences) / len(confidences)
+    return merged
@@ -0,0 +1,136 @@
+"""
+Local stub LLM server for exercising llm_backends without real models.
+
+Speaks just enough of both APIs:
+  POST /api/generate          (Ollama, streamed or not)
+  POST /v1/chat/completions   (OpenAI, streamed SSE or not)
+
+It echoes the OCR text from the prompt back as a valid JSON answer, after an
+optional delay, and can fail a fraction of requests with a given status code.
+
+Usage:
+  python llm_stub_server.py --port 11434 --delay 0.2 --jitter 1.0 --fail-rate 0.1
+  OLLAMA_BASE_URL=http://localhost:11434 OPENAI_BASE_URL=http://localhost:8001/v1 \\
+      OPENAI_API_KEY=stub LLM_MODE=hedged python main.py samples/ai_integration.pdf
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _answer(user_text: str) -> str:
+    text = user_text.split("OCR text:\n", 1)[-1]
+    return json.dumps({"cleaned_text": text, "notes": [], "removed_lines": [], "stats": {},
+                       "document_type": "unknown", "confidence": 0.0})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "LLMStub/1.0"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, status: int, body) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        time.sleep(self.server.delay + random.random() * self.server.jitter)
+        if random.random() < self.server.fail_rate:
+            self._send_json(self.server.fail_status, {"error": {"message": "stub failure"}})
+            return
+
+        if self.path.rstrip("/").endswith("/api/generate"):
+            self._ollama(payload)
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self._openai(payload)
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _ollama(self, payload):
+        answer = _answer(payload.get("prompt", ""))
+        prompt_tokens = len((payload.get("system", "") + payload.get("prompt", "")).split())
+        final = {"model": payload.get("model"), "response": answer, "done": True,
+                 "prompt_eval_count": prompt_tokens, "eval_count": len(answer.split())}
+        if not payload.get("stream", True):
+            self._send_json(200, final)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for i in range(0, len(answer), 16):
+            self.wfile.write((json.dumps({"response": answer[i:i + 16], "done": False}) + "\n").encode())
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+        final["response"] = ""
+        self.wfile.write((json.dumps(final) + "\n").encode())
+
+    def _openai(self, payload):
+        messages = payload.get("messages", [])
+        user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        answer = _answer(user)
+        usage = {"prompt_tokens": sum(len(m.get("content", "").split()) for m in messages),
+                 "completion_tokens": len(answer.split()),
+                 "prompt_tokens_details": {"cached_tokens": 0}}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "stub", "object": "chat.completion", "created": int(time.time()),
+                "model": payload.get("model")}
+        if not payload.get("stream"):
+            self._send_json(200, {**base, "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": answer}}]})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunk = {**base, "object": "chat.completion.chunk"}
+        for i in range(0, len(answer), 16):
+            event = {**chunk, "choices": [{"index": 0, "delta": {"content": answer[i:i + 16]},
+                                           "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+        self.wfile.write(f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama/OpenAI server for LLM backend testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--delay", type=float, default=0.0, help="Base latency per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency up to N s")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Delay between streamed chunks")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--fail-status", type=int, default=500, help="e.g. 500, 503 or 429")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.delay = args.delay
+    server.jitter = args.jitter
+    server.token_delay = args.token_delay
+    server.fail_rate = args.fail_rate
+    server.fail_status = args.fail_status
+    server.verbose = args.verbose
+    print(f"Stub LLM server on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
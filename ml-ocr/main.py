@@ -1,32 +1,84 @@
+import argparse
 import json
 import sys
 import logging
-from extract_text import extract_text_tesseract
-from pre_process import preprocess_text
-from llm_postprocess import clean_ocr_text, extract_structured_fields
+from ocr_engines import ENGINES
+from pipeline import run_pipeline
 
-def main():
-    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
-
-    default_path = 'samples/ai_integration.pdf'
-    target_path = sys.argv[1] if len(sys.argv) > 1 else default_path
+def run_single(target_path: str, use_llm: bool = True, ocr_engine: str = None,
+               pipelined: bool = False) -> int:
+    def on_stage(name, result):
+        if name == "clean":
+            print(result["cleaned_text"])
 
     try:
-        raw_text = extract_text_tesseract(target_path)
-        rule_cleaned = preprocess_text(raw_text)
+        if pipelined:
+            import asyncio
+            from pipelined import run_pipelined
+            result = asyncio.run(run_pipelined(target_path, use_llm=use_llm, on_stage=on_stage,
+                                               ocr_engine=ocr_engine))
+        else:
+            result = run_pipeline(target_path, use_llm=use_llm, on_stage=on_stage, ocr_engine=ocr_engine)
+        if not use_llm:
+            print(result["cleaned_text"])
 
-        # Optional: LLM cleanup for higher quality
-        llm_clean = clean_ocr_text(rule_cleaned)
-        cleaned_text = llm_clean.get("cleaned_text", rule_cleaned)
+        # Optional: structured extraction
+        print(json.dumps(result.get("fields", {"items": result.get("items", [])}),
+                         indent=2, ensure_ascii=False))
 
-        print(cleaned_text)
+        from token_budget import ledger
+        logging.info(f"Stage timings: {json.dumps(result['timings'])}")
+        logging.info(f"Token usage: {json.dumps(ledger.totals())}")
+        return 0
 
-        # Optional: structured extraction
-        fields = extract_structured_fields(cleaned_text)
-        print(json.dumps(fields, indent=2, ensure_ascii=False))
+    except Exception:
+        logging.exception(f"Failed to process {target_path}")
+        return 1
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    parser = argparse.ArgumentParser(description="OCR + extraction for tender/RFQ documents")
+    parser.add_argument("paths", nargs="*", default=['samples/ai_integration.pdf'],
+                        help="Document to process, or files/directories with --bulk")
+    parser.add_argument("--no-llm", action="store_true", help="Skip the LLM cleanup/extraction stages")
+    parser.add_argument("--ocr-engine", choices=sorted(ENGINES),
+                        help="OCR engine (default: OCR_ENGINE env var, else tesseract)")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Overlap OCR, preprocessing and LLM cleanup across page batches")
+    bulk = parser.add_argument_group("bulk mode")
+    bulk.add_argument("--bulk", action="store_true", help="Walk the given directories in parallel")
+    bulk.add_argument("--out", default="results", help="Directory for per-document JSON results")
+    bulk.add_argument("--workers", type=int, default=4)
+    bulk.add_argument("--order", default="newest",
+                      choices=["newest", "oldest", "smallest", "largest", "name"],
+                      help="Which documents to process first")
+    bulk.add_argument("--manifest", help="Progress manifest (default: <out>/manifest.jsonl)")
+    bulk.add_argument("--persist", action="store_true", help="Upsert results into Postgres")
+    bulk.add_argument("--persist-root",
+                      help="Root that DB paths are relative to (e.g. the organized/ folder)")
+    bulk.add_argument("--index", metavar="DB", help="Also add results to this full-text search index")
+    bulk.add_argument("--dedup", action="store_true",
+                      help="Reuse results of identical or rescanned documents instead of re-running OCR")
+    bulk.add_argument("--ocr-processes", type=int, default=0,
+                      help="OCR pages in N worker processes, handing pages over in shared memory "
+                           "(one page per task: no cross-page batching for the ONNX engine)")
+    bulk.add_argument("--store", metavar="DIR",
+                      help="Also write pages, word boxes, timings and fields to this Parquet store")
+    args = parser.parse_args()
+
+    if args.bulk:
+        from bulk import run_bulk
+        summary = run_bulk(args.paths, args.out, workers=args.workers, order=args.order,
+                           manifest_path=args.manifest, use_llm=not args.no_llm,
+                           persist=args.persist, persist_root=args.persist_root,
+                           index_path=args.index, dedup=args.dedup, ocr_engine=args.ocr_engine,
+                           ocr_processes=args.ocr_processes, store_path=args.store)
+        print(json.dumps(summary))
+        sys.exit(1 if summary["failed"] else 0)
 
-    except Exception as e:
-        print(f"Error: {e}")
+    sys.exit(run_single(args.paths[0], use_llm=not args.no_llm, ocr_engine=args.ocr_engine,
+                        pipelined=args.pipelined))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,311 @@
+"""
+Local (no LLM) extraction of buyer, address and contact with spaCy plus rules.
+
+- A small spaCy pipeline: only tok2vec + ner are kept, everything else
+  (tagger, parser, lemmatizer, ...) is excluded at load time.
+- An EntityRuler ahead of the statistical NER tags Indian government buyers
+  (ministries, departments, PSUs, AIIMS/IITs, railways, municipal bodies) as
+  GOV_BUYER; e-mail, phone and PIN codes are plain regexes.
+- Only the header and contact windows (retrieval.py) go through the model.
+- Every field comes back with a confidence from its evidence: the entity
+  source, a cue word on the same line ("Buyer:", "Address:", ...), position
+  and repetition. Fields at or above NER_CONFIG['accept_confidence'] are
+  used directly by the pipeline; the LLM only fills what is still missing.
+
+Many documents at once (nlp.pipe batches, optional worker processes), e.g.
+to backfill bulk results:
+
+  python ner_extract.py results/ --n-process 4
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NER_FIELDS = ["buyer", "address", "contact"]
+
+# Configure behavior here (env vars override for deployments)
+NER_CONFIG = {
+    "enabled": os.getenv("OCR_NER", "1") != "0",
+    "model": os.getenv("OCR_NER_MODEL", "en_core_web_sm"),
+    "batch_size": 32,             # Documents per nlp.pipe batch
+    "n_process": 1,               # Worker processes for nlp.pipe (batch mode)
+    "accept_confidence": 0.8,     # Fields at/above this are used without asking the LLM
+    "max_chars": 20000,           # Text per document sent through the model
+    "header_chars": 1500,         # Buyers named this early are more likely the issuer
+}
+
+# Components never needed for entity extraction
+UNUSED_COMPONENTS = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter", "morphologizer",
+                     "textcat"]
+
+_CAP = {"TEXT": {"REGEX": r"^[A-Z][A-Za-z.&()-]*$"}}
+_JOIN = {"LOWER": {"IN": ["and", "&", "of", "for", "the"]}, "OP": "?"}
+
+GOV_HEADS = ["ministry", "department", "deptt", "dept", "directorate", "government", "govt",
+             "office", "commissionerate", "headquarters", "institute", "university", "council",
+             "commission", "authority", "board"]
+
+GOV_ACRONYMS = ["AIIMS", "IIT", "NIT", "IIM", "IISER", "DRDO", "ISRO", "BSNL", "MTNL", "NTPC", "ONGC",
+                "BHEL", "GAIL", "SAIL", "IOCL", "HPCL", "BPCL", "CPWD", "PWD", "NHAI", "RITES",
+                "IRCON", "HAL", "BEL", "ESIC", "CGHS", "ICMR", "ICAR", "CSIR", "KVS", "NVS", "DMRC",
+                "CRPF", "BSF", "CISF", "ITBP", "NHPC", "DVC", "FCI", "NIC"]
+
+GOV_BUYER_PATTERNS = [
+    # Ministry of Health and Family Welfare / Government of Uttar Pradesh / Office of the ...
+    [{"LOWER": {"IN": GOV_HEADS}}, {"LOWER": "of"}, {"LOWER": "the", "OP": "?"}, _CAP, {**_CAP, "OP": "*"}],
+    [{"LOWER": {"IN": GOV_HEADS}}, {"LOWER": "of"}, {"LOWER": "the", "OP": "?"}, _CAP, {**_CAP, "OP": "*"},
+     _JOIN, _CAP, {**_CAP, "OP": "*"}],
+    # AIIMS Delhi, IIT Bombay, CPWD
+    [{"TEXT": {"IN": GOV_ACRONYMS}}, {"TEXT": {"REGEX": r"^[A-Z][a-z]+$"}, "OP": "?"}],
+    # Northern Railway, Indian Railways, South Central Railway
+    [_CAP, {**_CAP, "OP": "?"}, {"LOWER": {"IN": ["railway", "railways"]}}],
+    # Lucknow Municipal Corporation, Nagar Nigam Kanpur, Zila Parishad
+    [_CAP, {"LOWER": {"IN": ["municipal", "nagar", "zila", "zilla"]}},
+     {"LOWER": {"IN": ["corporation", "council", "nigam", "palika", "parishad"]}}],
+    [{"LOWER": {"IN": ["nagar", "zila", "zilla"]}}, {"LOWER": {"IN": ["nigam", "palika", "parishad"]}}, _CAP],
+    # Indian Army / Indian Navy / Indian Air Force
+    [{"LOWER": "indian"}, {"LOWER": {"IN": ["army", "navy", "air"]}}, {"LOWER": "force", "OP": "?"}],
+]
+
+BUYER_CUES = re.compile(r"\b(buyer|purchaser|organi[sz]ation|procuring entity|issued by|department name|"
+                        r"name of (the )?(work|office|department))\b", re.I)
+ADDRESS_CUES = re.compile(r"\b(address|correspondence|office at|situated)\b", re.I)
+CONTACT_CUES = re.compile(r"\b(contact|officer|incharge|in-charge|e-?mail|tel|phone|mobile|enquir)", re.I)
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE_RE = re.compile(r"(?<!\d)(?:\+91[\s-]?)?(?:0\d{2,4}[\s-]?\d{6,8}|[6-9]\d{9})(?!\d)")
+PIN_RE = re.compile(r"(?<!\d)[1-9]\d{2}\s?\d{3}(?!\d)")
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def load_nlp():
+    """The shared spaCy pipeline (loaded once). Falls back to rules only without the model."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is not None:
+            return _nlp
+        try:
+            import spacy
+        except ImportError:
+            raise RuntimeError("spaCy is required for NER extraction. Install it: pip install spacy")
+        started = time.perf_counter()
+        try:
+            nlp = spacy.load(NER_CONFIG["model"], exclude=UNUSED_COMPONENTS)
+        except OSError:
+            logger.warning(f"spaCy model {NER_CONFIG['model']} not installed "
+                           f"(python -m spacy download {NER_CONFIG['model']}); using rules only")
+            nlp = spacy.blank("en")
+        where = {"before": "ner"} if "ner" in nlp.pipe_names else {}
+        ruler = nlp.add_pipe("entity_ruler", config={"overwrite_ents": True}, **where)
+        ruler.add_patterns([{"label": "GOV_BUYER", "pattern": p} for p in GOV_BUYER_PATTERNS])
+        logger.info(f"NER pipeline {nlp.pipe_names} loaded in {time.perf_counter() - started:.1f}s")
+        _nlp = nlp
+        return nlp
+
+
+def ner_text(text: str) -> str:
+    """The part of a document worth running NER on: header and contact windows."""
+    from retrieval import select_windows
+
+    context, _ = select_windows(text, groups=["header", "contact"])
+    return context[:NER_CONFIG["max_chars"]]
+
+
+class _Lines:
+    def __init__(self, text: str):
+        self.text = text
+        self.starts = [0] + [m.end() for m in re.finditer("\n", text)]
+
+    def index(self, offset: int) -> int:
+        return bisect.bisect_right(self.starts, offset) - 1
+
+    def line(self, i: int) -> str:
+        end = self.starts[i + 1] - 1 if i + 1 < len(self.starts) else len(self.text)
+        return self.text[self.starts[i]:end].strip()
+
+
+def _field(value: str, confidence: float, source: str) -> Dict[str, Any]:
+    return {"value": value, "confidence": round(min(confidence, 0.95), 2), "source": source}
+
+
+def _buyer(doc, lines: _Lines) -> Optional[Dict[str, Any]]:
+    counts: Dict[str, int] = {}
+    candidates: List[Tuple[float, str, str]] = []
+    for ent in doc.ents:
+        if ent.label_ not in ("GOV_BUYER", "ORG"):
+            continue
+        name = " ".join(ent.text.split()).strip(" ,.:;-")
+        if len(name) < 3:
+            continue
+        counts[name.lower()] = counts.get(name.lower(), 0) + 1
+        score = 0.7 if ent.label_ == "GOV_BUYER" else 0.5
+        if BUYER_CUES.search(lines.line(lines.index(ent.start_char))):
+            score += 0.25
+        if ent.start_char < NER_CONFIG["header_chars"]:
+            score += 0.05
+        candidates.append((score, name, "ruler" if ent.label_ == "GOV_BUYER" else "ner"))
+    if not candidates:
+        return None
+    # Named more than once: more likely the issuer than a passing mention
+    score, name, source = max((s + (0.05 if counts[n.lower()] > 1 else 0), n, src) for s, n, src in candidates)
+    return _field(name, score, source)
+
+
+def _address(doc, lines: _Lines) -> Optional[Dict[str, Any]]:
+    places = {lines.index(e.start_char) for e in doc.ents if e.label_ in ("GPE", "LOC", "FAC")}
+    best = None
+    for m in PIN_RE.finditer(lines.text):
+        end = lines.index(m.start())
+        start = end
+        cued = False
+        # Walk back over the short lines of the same address block
+        while start > 0 and end - start < 3:
+            prev = lines.line(start - 1)
+            if not prev or len(prev) > 80 or EMAIL_RE.search(prev):
+                break
+            if ADDRESS_CUES.search(prev):
+                cued = True
+                if not prev.endswith(":"):  # "Address: Stores Section" (keep the part after the label)
+                    start -= 1
+                break
+            start -= 1
+        block = [lines.line(i) for i in range(start, end + 1)]
+        block[0] = re.sub(r"^[^:]*\b(address|correspondence)\b[^:]*:\s*", "", block[0], flags=re.I)
+        text = ", ".join(part.strip(" ,") for part in block if part)
+        score = 0.6
+        if cued or ADDRESS_CUES.search(lines.line(end)):
+            score += 0.2
+        if places & set(range(start, end + 1)):
+            score += 0.1
+        if best is None or score > best["confidence"]:
+            best = _field(text, score, "pin")
+    if best is None:
+        # No PIN code: the rest of a line that says "Address:"
+        for i in range(len(lines.starts)):
+            m = re.search(r"address\s*[:\-]\s*(.{10,})", lines.line(i), re.I)
+            if m:
+                return _field(m.group(1).strip(), 0.5, "cue")
+    return best
+
+
+def _contact(doc, lines: _Lines) -> Optional[Dict[str, Any]]:
+    email = EMAIL_RE.search(lines.text)
+    phone = PHONE_RE.search(lines.text)
+    anchor = email or phone
+    if anchor is None:
+        return None
+    line_no = lines.index(anchor.start())
+    person = None
+    for ent in doc.ents:
+        if ent.label_ == "PERSON" and line_no - 2 <= lines.index(ent.start_char) <= line_no:
+            person = " ".join(ent.text.split())
+    details = ", ".join(m.group(0) for m in (email, phone) if m)
+    value = f"{person} ({details})" if person else details
+    score = 0.7 if email else 0.5
+    if person:
+        score += 0.15
+    if any(CONTACT_CUES.search(lines.line(i)) for i in range(max(0, line_no - 2), line_no + 1)):
+        score += 0.1
+    return _field(value, score, "regex+ner" if person else "regex")
+
+
+def _entities(doc) -> Dict[str, Dict[str, Any]]:
+    lines = _Lines(doc.text)
+    found = {"buyer": _buyer(doc, lines), "address": _address(doc, lines), "contact": _contact(doc, lines)}
+    return {k: v for k, v in found.items() if v is not None}
+
+
+def extract_entities(text: str) -> Dict[str, Dict[str, Any]]:
+    """{field: {value, confidence, source}} for buyer / address / contact found in text."""
+    nlp = load_nlp()
+    return _entities(nlp(ner_text(text)))
+
+
+def extract_entities_batch(texts: Iterable[str], batch_size: Optional[int] = None,
+                           n_process: Optional[int] = None) -> Iterator[Dict[str, Dict[str, Any]]]:
+    """extract_entities over many documents with nlp.pipe batching, in input order."""
+    nlp = load_nlp()
+    docs = nlp.pipe((ner_text(t) for t in texts), batch_size=batch_size or NER_CONFIG["batch_size"],
+                    n_process=n_process or NER_CONFIG["n_process"])
+    for doc in docs:
+        yield _entities(doc)
+
+
+def confident_fields(entities: Dict[str, Dict[str, Any]], threshold: Optional[float] = None) -> Dict[str, str]:
+    threshold = NER_CONFIG["accept_confidence"] if threshold is None else threshold
+    return {k: v["value"] for k, v in entities.items() if v["confidence"] >= threshold}
+
+
+def merge_into_fields(fields: Dict[str, Any], entities: Dict[str, Dict[str, Any]],
+                      override: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Fill fields the LLM left empty (or that were never asked for) from confident
+    entities. Fields in override (those whose context was left out of the
+    prompt because NER was sure) take the NER value whatever the LLM said.
+    """
+    override = set(override)
+    for name, value in confident_fields(entities).items():
+        if name in override or fields.get(name) in (None, ""):
+            fields[name] = value
+    return fields
+
+
+def _result_files(root: str) -> Iterator[str]:
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.endswith(".json"):
+                yield os.path.join(dirpath, name)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Add buyer/address/contact entities to bulk result files")
+    parser.add_argument("results", help="Bulk --out directory")
+    parser.add_argument("--batch-size", type=int, default=NER_CONFIG["batch_size"])
+    parser.add_argument("--n-process", type=int, default=NER_CONFIG["n_process"])
+    parser.add_argument("--force", action="store_true", help="Redo files that already have entities")
+    args = parser.parse_args()
+
+    paths, texts = [], []
+    for path in _result_files(args.results):
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        if "entities" in result and not args.force:
+            continue
+        text = result.get("cleaned_text") or result.get("text") or result.get("raw_text")
+        if text:
+            paths.append(path)
+            texts.append(text)
+    logger.info(f"{len(paths)} results to process")
+
+    started = time.perf_counter()
+    filled = 0
+    for path, entities in zip(paths, extract_entities_batch(texts, args.batch_size, args.n_process)):
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        result["entities"] = entities
+        fields = result.setdefault("fields", {})
+        before = sum(1 for k in NER_FIELDS if fields.get(k) not in (None, ""))
+        merge_into_fields(fields, entities)
+        filled += sum(1 for k in NER_FIELDS if fields.get(k) not in (None, "")) - before
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    secs = time.perf_counter() - started
+    logger.info(f"Done: {len(paths)} documents in {secs:.1f}s "
+                f"({len(paths) / secs if secs else 0:.1f} docs/s), {filled} empty fields filled")
+
+
+if __name__ == "__main__":
+    main()
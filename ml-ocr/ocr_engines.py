@@ -0,0 +1,413 @@
+"""
+OCR engines behind one interface, so extract_text can use something other than
+Tesseract per document or per page.
+
+  tesseract  pytesseract.image_to_string (default)
+  onnx       text detection + recognition models on onnxruntime's CPU provider
+             (DB-style detector and CTC recognizer, e.g. PP-OCR models exported to ONNX)
+
+Every engine takes a batch of page images: recognize(images, page_classes) ->
+text per image. page_classes (page_classify.py) lets an engine tune itself per
+page; Tesseract picks --psm/--oem from it. recognize_words() also returns the
+words with their boxes and confidences (for the result store, result_store.py);
+it is used instead of recognize() when OCR_CONFIG["word_boxes"] is on.
+The ONNX engine runs detection on the whole batch in one call and recognition
+on batches of line crops; Tesseract has no batch API and does pages one by one.
+
+Pick the default with OCR_ENGINE, or pass engine= to extract_text functions.
+Compare engines on your own documents (throughput and agreement with the first):
+
+  python ocr_engines.py compare samples/a.pdf samples/b.png --engines tesseract,onnx
+"""
+import argparse
+import difflib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here (env vars override for deployments)
+OCR_CONFIG = {
+    "engine": os.getenv("OCR_ENGINE", "tesseract"),
+    "zoom": 2.0,                # PDF render scale for OCR (2x ~ 300 DPI for A4)
+    "tesseract_lang": "eng+hin",
+    "word_boxes": os.getenv("OCR_WORD_BOXES", "0") == "1",   # Keep word boxes/confidences per page
+    # Tesseract flags per page class (page_classify.py); unknown/unclassified pages get ""
+    "tesseract_page_config": {
+        "text": "--oem 1 --psm 3",      # LSTM, automatic layout
+        "table": "--oem 1 --psm 6",     # One uniform block: keeps table rows together
+        "sparse": "--oem 1 --psm 11",   # Sparse text: no layout assumptions
+    },
+    "batch_size": int(os.getenv("OCR_BATCH_SIZE", "4")),      # Pages rendered and recognized together
+    "onnx_det_model": os.getenv("OCR_ONNX_DET", "models/det.onnx"),
+    "onnx_rec_model": os.getenv("OCR_ONNX_REC", "models/rec.onnx"),
+    "onnx_charset": os.getenv("OCR_ONNX_CHARSET", "models/charset.txt"),  # One character per line
+    "onnx_threads": int(os.getenv("OCR_ONNX_THREADS", "0")),  # 0 = onnxruntime default
+    "det_max_side": 1280,       # Longest page side fed to the detector
+    "det_threshold": 0.3,       # Text probability for a pixel
+    "det_min_box": 4,           # Boxes smaller than this (detector pixels) are noise
+    "det_unclip": 1.6,          # Grow boxes by this ratio (the detector predicts shrunk text cores)
+    "rec_height": 48,
+    "rec_max_width": 1280,
+    "rec_batch_size": 32,       # Line crops per recognizer call
+}
+
+
+class OCREngine:
+    """Base class: recognize(images, page_classes) -> text per image (BGR or grayscale numpy arrays)."""
+
+    name = "base"
+    batch_size = 1
+
+    def recognize(self, images: List, page_classes: Optional[List[str]] = None) -> List[str]:
+        raise NotImplementedError
+
+    def recognize_words(self, images: List,
+                        page_classes: Optional[List[str]] = None) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        (text, words) per image. Words are {"text", "left", "top", "width",
+        "height", "conf"} in image pixels, conf 0-100 (None if the engine has none).
+        """
+        return [(text, []) for text in self.recognize(images, page_classes)]
+
+
+def _words_to_text(words: List[Dict[str, Any]], keys: List[tuple]) -> str:
+    """Words with (block, paragraph, line) keys -> lines, with a blank line between paragraphs."""
+    out: List[str] = []
+    prev = None
+    for word, key in zip(words, keys):
+        if prev is not None:
+            out.append(" " if key == prev else "\n" if key[:2] == prev[:2] else "\n\n")
+        out.append(word["text"])
+        prev = key
+    return "".join(out)
+
+
+class TesseractEngine(OCREngine):
+    name = "tesseract"
+
+    def __init__(self, lang: Optional[str] = None):
+        import pytesseract  # noqa: F401  (fail on construction, not on the first page)
+        self.lang = lang    # None: OCR_CONFIG['tesseract_lang'] at call time
+        self.batch_size = OCR_CONFIG["batch_size"]
+
+    def recognize(self, images: List, page_classes: Optional[List[str]] = None) -> List[str]:
+        import cv2
+        import pytesseract
+
+        configs = OCR_CONFIG["tesseract_page_config"]
+        lang = self.lang or OCR_CONFIG["tesseract_lang"]
+        texts = []
+        for i, img in enumerate(images):
+            gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            config = configs.get(page_classes[i], "") if page_classes else ""
+            texts.append(pytesseract.image_to_string(gray, lang=lang, config=config).strip())
+        return texts
+
+    def recognize_words(self, images: List, page_classes: Optional[List[str]] = None):
+        import cv2
+        import pytesseract
+
+        configs = OCR_CONFIG["tesseract_page_config"]
+        lang = self.lang or OCR_CONFIG["tesseract_lang"]
+        out = []
+        for i, img in enumerate(images):
+            gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            config = configs.get(page_classes[i], "") if page_classes else ""
+            # One Tesseract run: the text is rebuilt from the words instead of calling image_to_string too
+            data = pytesseract.image_to_data(gray, lang=lang, config=config,
+                                             output_type=pytesseract.Output.DICT)
+            words, keys = [], []
+            for k, token in enumerate(data["text"]):
+                conf = float(data["conf"][k])
+                if conf < 0 or not token.strip():
+                    continue  # Block/paragraph/line rows and empty words
+                words.append({"text": token.strip(), "left": data["left"][k], "top": data["top"][k],
+                              "width": data["width"][k], "height": data["height"][k],
+                              "conf": round(conf, 1)})
+                keys.append((data["block_num"][k], data["par_num"][k], data["line_num"][k]))
+            out.append((_words_to_text(words, keys), words))
+        return out
+
+
+def _resolve(path: str) -> str:
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+def _load_charset(path: str) -> List[str]:
+    with open(_resolve(path), "r", encoding="utf-8") as f:
+        chars = [line.rstrip("\r\n") for line in f]
+    # Index 0 is the CTC blank; the space is implied after the listed characters
+    return [""] + chars + [" "]
+
+
+def _group_lines(boxes: List[tuple]) -> List[List[tuple]]:
+    """(x0, y0, x1, y1) boxes -> reading order: lines top to bottom, boxes left to right."""
+    lines: List[List[tuple]] = []
+    for box in sorted(boxes, key=lambda b: (b[1] + b[3]) / 2):
+        cy = (box[1] + box[3]) / 2
+        if lines:
+            last = lines[-1]
+            top = min(b[1] for b in last)
+            bottom = max(b[3] for b in last)
+            if top <= cy <= bottom:
+                last.append(box)
+                continue
+        lines.append([box])
+    return [sorted(line, key=lambda b: b[0]) for line in lines]
+
+
+class OnnxEngine(OCREngine):
+    """Detection + recognition on onnxruntime's CPUExecutionProvider."""
+
+    name = "onnx"
+
+    def __init__(self, det_model: Optional[str] = None, rec_model: Optional[str] = None,
+                 charset: Optional[str] = None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("onnxruntime is required for the onnx OCR engine. Install it: pip install onnxruntime")
+
+        options = ort.SessionOptions()
+        if OCR_CONFIG["onnx_threads"]:
+            options.intra_op_num_threads = OCR_CONFIG["onnx_threads"]
+        providers = ["CPUExecutionProvider"]
+        self.det = ort.InferenceSession(_resolve(det_model or OCR_CONFIG["onnx_det_model"]),
+                                        sess_options=options, providers=providers)
+        self.rec = ort.InferenceSession(_resolve(rec_model or OCR_CONFIG["onnx_rec_model"]),
+                                        sess_options=options, providers=providers)
+        self.charset = _load_charset(charset or OCR_CONFIG["onnx_charset"])
+        self.batch_size = OCR_CONFIG["batch_size"]
+
+    # --- detection ---
+
+    def _det_input(self, images: List):
+        """Resize (multiple of 32, longest side <= det_max_side) and pad into one NCHW batch."""
+        import cv2
+        import numpy as np
+
+        resized, scales = [], []
+        for img in images:
+            if img.ndim == 2:
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+            h, w = img.shape[:2]
+            scale = min(1.0, OCR_CONFIG["det_max_side"] / max(h, w))
+            nh = max(32, int(round(h * scale / 32)) * 32)
+            nw = max(32, int(round(w * scale / 32)) * 32)
+            resized.append(cv2.resize(img, (nw, nh)))
+            scales.append((w / nw, h / nh))
+
+        height = max(r.shape[0] for r in resized)
+        width = max(r.shape[1] for r in resized)
+        batch = np.zeros((len(resized), 3, height, width), dtype=np.float32)
+        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+        std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+        for i, r in enumerate(resized):
+            rgb = r[:, :, ::-1].astype(np.float32) / 255.0
+            batch[i, :, :r.shape[0], :r.shape[1]] = ((rgb - mean) / std).transpose(2, 0, 1)
+        return batch, [r.shape[:2] for r in resized], scales
+
+    def _boxes(self, prob, shape, scale, page_shape) -> List[tuple]:
+        import cv2
+        import numpy as np
+
+        h, w = shape
+        mask = (prob[:h, :w] > OCR_CONFIG["det_threshold"]).astype(np.uint8)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        sx, sy = scale
+        page_h, page_w = page_shape
+        boxes = []
+        for c in contours:
+            x, y, bw, bh = cv2.boundingRect(c)
+            if min(bw, bh) < OCR_CONFIG["det_min_box"]:
+                continue
+            # Unclip: grow by area * ratio / perimeter on every side
+            pad = bw * bh * OCR_CONFIG["det_unclip"] / (2 * (bw + bh))
+            x0 = max(0, int((x - pad) * sx))
+            y0 = max(0, int((y - pad) * sy))
+            x1 = min(page_w, int((x + bw + pad) * sx))
+            y1 = min(page_h, int((y + bh + pad) * sy))
+            boxes.append((x0, y0, x1, y1))
+        return boxes
+
+    # --- recognition ---
+
+    def _rec_batch(self, crops: List) -> List[Tuple[str, float]]:
+        import cv2
+        import numpy as np
+
+        rec_h = OCR_CONFIG["rec_height"]
+        resized = []
+        for crop in crops:
+            h, w = crop.shape[:2]
+            nw = min(OCR_CONFIG["rec_max_width"], max(1, int(round(w * rec_h / h))))
+            resized.append(cv2.resize(crop, (nw, rec_h)))
+        width = max(r.shape[1] for r in resized)
+        batch = np.zeros((len(resized), 3, rec_h, width), dtype=np.float32)
+        for i, r in enumerate(resized):
+            x = (r[:, :, ::-1].astype(np.float32) / 255.0 - 0.5) / 0.5
+            batch[i, :, :, :r.shape[1]] = x.transpose(2, 0, 1)
+
+        probs = self.rec.run(None, {self.rec.get_inputs()[0].name: batch})[0]   # N x T x C
+        if not np.allclose(probs[:, :1].sum(axis=2), 1.0, atol=1e-3):
+            # Raw logits rather than a softmax output: normalize for the confidences
+            probs = np.exp(probs - probs.max(axis=2, keepdims=True))
+            probs /= probs.sum(axis=2, keepdims=True)
+        best = probs.argmax(axis=2)
+        top = probs.max(axis=2)
+        out = []
+        for seq, p in zip(best, top):
+            # Greedy CTC: collapse repeats, drop blanks
+            keep = np.ones(len(seq), dtype=bool)
+            keep[1:] = seq[1:] != seq[:-1]
+            keep &= seq != 0
+            text = "".join(self.charset[i] for i in seq[keep] if i < len(self.charset))
+            out.append((text, float(p[keep].mean()) * 100 if keep.any() else 0.0))
+        return out
+
+    def _read(self, images: List) -> List[List[List[tuple]]]:
+        """Per page, lines top to bottom of (box, text, conf) left to right."""
+        import cv2
+
+        if not images:
+            return []
+        batch, shapes, scales = self._det_input(images)
+        probs = self.det.run(None, {self.det.get_inputs()[0].name: batch})[0][:, 0]   # N x H x W
+
+        # Every line crop from every page goes through the recognizer in fixed-size batches
+        crops, owners = [], []
+        page_lines: List[List[List[tuple]]] = []
+        for p, img in enumerate(images):
+            if img.ndim == 2:
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+            lines = _group_lines(self._boxes(probs[p], shapes[p], scales[p], img.shape[:2]))
+            page_lines.append(lines)
+            for l, line in enumerate(lines):
+                for box in line:
+                    x0, y0, x1, y1 = box
+                    crops.append(img[y0:y1, x0:x1])
+                    owners.append((p, l))
+
+        size = OCR_CONFIG["rec_batch_size"]
+        # Similar widths together waste less padding
+        order = sorted(range(len(crops)), key=lambda i: crops[i].shape[1] / max(1, crops[i].shape[0]))
+        out_lines = [[[] for _ in lines] for lines in page_lines]
+        for start in range(0, len(order), size):
+            chunk = order[start:start + size]
+            for i, (text, conf) in zip(chunk, self._rec_batch([crops[i] for i in chunk])):
+                p, l = owners[i]
+                out_lines[p][l].append((i, text.strip(), conf))
+
+        pages = []
+        for p, lines in enumerate(out_lines):
+            # Crops were appended left to right, so the crop index restores word order
+            pages.append([[(page_lines[p][l][k], t, conf) for k, (_, t, conf) in enumerate(sorted(line))]
+                          for l, line in enumerate(lines)])
+        return pages
+
+    def recognize(self, images: List, page_classes: Optional[List[str]] = None) -> List[str]:
+        texts = []
+        for lines in self._read(images):
+            joined = (" ".join(t for _, t, _ in line if t) for line in lines)
+            texts.append("\n".join(line for line in joined if line).strip())
+        return texts
+
+    def recognize_words(self, images: List, page_classes: Optional[List[str]] = None):
+        out = []
+        for lines in self._read(images):
+            # A detected text box is the unit here; it may hold several words
+            words = [{"text": t, "left": x0, "top": y0, "width": x1 - x0, "height": y1 - y0,
+                      "conf": round(conf, 1)}
+                     for line in lines for (x0, y0, x1, y1), t, conf in line if t]
+            keys = [(0, 0, l) for l, line in enumerate(lines) for _, t, _ in line if t]
+            out.append((_words_to_text(words, keys), words))
+        return out
+
+
+ENGINES = {
+    "tesseract": TesseractEngine,
+    "onnx": OnnxEngine,
+}
+
+_engines: Dict[str, OCREngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name: Optional[str] = None) -> OCREngine:
+    """Shared engine instance by name (default: OCR_CONFIG['engine']); models load once."""
+    name = name or OCR_CONFIG["engine"]
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR engine {name!r}; choose from {', '.join(ENGINES)}")
+    with _engines_lock:
+        if name not in _engines:
+            started = time.perf_counter()
+            _engines[name] = ENGINES[name]()
+            logger.info(f"OCR engine {name} loaded in {time.perf_counter() - started:.1f}s")
+        return _engines[name]
+
+
+def agreement(a: str, b: str) -> float:
+    """Similarity of two OCR outputs in [0, 1], ignoring whitespace differences."""
+    a, b = " ".join(a.split()), " ".join(b.split())
+    if not a and not b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def compare(paths: List[str], engines: List[str]) -> Dict[str, Dict[str, float]]:
+    """
+    OCR every page of every document with each engine (no text layer, so every
+    page is recognized). Returns per engine: pages, seconds, pages_per_sec and
+    agreement (mean per-page similarity to the first engine's text).
+    """
+    from extract_text import load_pages
+
+    # Rendered up front so every engine times recognition only
+    pages = [img for path in paths for img in load_pages(path)]
+    logger.info(f"Comparing {', '.join(engines)} on {len(pages)} pages from {len(paths)} documents")
+
+    outputs: Dict[str, List[str]] = {}
+    report: Dict[str, Dict[str, float]] = {}
+    for name in engines:
+        engine = get_engine(name)
+        started = time.perf_counter()
+        texts = []
+        for i in range(0, len(pages), engine.batch_size):
+            texts.extend(engine.recognize(pages[i:i + engine.batch_size]))
+        secs = time.perf_counter() - started
+        outputs[name] = texts
+        report[name] = {"pages": len(pages), "seconds": round(secs, 2),
+                        "pages_per_sec": round(len(pages) / secs, 2) if secs else 0.0}
+
+    baseline = outputs[engines[0]]
+    for name in engines:
+        scores = [agreement(x, y) for x, y in zip(baseline, outputs[name])]
+        report[name]["agreement"] = round(sum(scores) / len(scores), 3) if scores else 1.0
+    return report
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="OCR engines")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    cmp = sub.add_parser("compare", help="Throughput and text agreement of engines on the same pages")
+    cmp.add_argument("paths", nargs="+", help="Images or PDFs")
+    cmp.add_argument("--engines", default="tesseract,onnx",
+                     help="Comma-separated; agreement is measured against the first")
+    args = parser.parse_args()
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    report = compare(args.paths, engines)
+    print(f"{'engine':12s} {'pages':>6s} {'seconds':>9s} {'pages/s':>8s} {'agreement':>10s}")
+    for name, r in report.items():
+        print(f"{name:12s} {r['pages']:6d} {r['seconds']:9.2f} {r['pages_per_sec']:8.2f} {r['agreement']:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
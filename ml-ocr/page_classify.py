@@ -0,0 +1,85 @@
+"""
+Cheap page classification on the rendered image, before OCR.
+
+  blank   nothing to read (separator pages, scanner noise): OCR is skipped
+  sparse  a few marks on a mostly empty page (signature, stamp, short note)
+  table   ruled grid of horizontal and vertical lines
+  text    everything else
+
+All features come from one downscaled grayscale copy with whole-array numpy /
+OpenCV ops (ink density, morphological line extraction, connected component
+statistics), a few milliseconds per page. ocr_engines maps the class to
+Tesseract settings (OCR_CONFIG['tesseract_page_config']).
+"""
+import os
+from typing import Any, Dict, Tuple
+
+PAGE_CLASSES = ["blank", "sparse", "table", "text"]
+
+# Configure behavior here
+CLASSIFY_CONFIG = {
+    "enabled": os.getenv("OCR_CLASSIFY_PAGES", "1") != "0",
+    "work_width": 600,          # Pages are downscaled to this width before measuring
+    "max_ink_level": 160,       # Gray level above which a pixel is never ink (keeps Otsu honest on blank pages)
+    "min_component_area": 4,    # Smaller components are specks (at work_width)
+    "blank_max_ink": 0.002,     # Fraction of ink pixels below which a page can be blank...
+    "blank_max_components": 3,  # ...if it also has at most this many components
+    "sparse_max_components": 60,
+    "sparse_max_ink": 0.01,
+    "line_min_frac": 1 / 12,    # Ruling lines span at least this fraction of the page width/height
+    "table_min_h_lines": 3,
+    "table_min_v_lines": 2,
+}
+
+
+def page_features(img) -> Dict[str, Any]:
+    import cv2
+    import numpy as np
+
+    cfg = CLASSIFY_CONFIG
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    if w > cfg["work_width"]:
+        gray = cv2.resize(gray, (cfg["work_width"], max(1, round(h * cfg["work_width"] / w))),
+                          interpolation=cv2.INTER_AREA)
+    sh, sw = gray.shape
+
+    otsu, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    ink = (gray < min(otsu, cfg["max_ink_level"])).astype(np.uint8)
+    ink_pixels = int(ink.sum())
+
+    # Ruling lines: what survives an opening with a long thin kernel
+    h_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(8, int(sw * cfg["line_min_frac"])), 1))
+    v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(8, int(sh * cfg["line_min_frac"]))))
+    horizontal = cv2.morphologyEx(ink, cv2.MORPH_OPEN, h_kernel)
+    vertical = cv2.morphologyEx(ink, cv2.MORPH_OPEN, v_kernel)
+    h_lines = cv2.connectedComponents(horizontal)[0] - 1
+    v_lines = cv2.connectedComponents(vertical)[0] - 1
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT][areas >= cfg["min_component_area"]]
+    areas = areas[areas >= cfg["min_component_area"]]
+
+    return {
+        "ink": ink_pixels / float(sh * sw),
+        "components": int(areas.size),
+        "median_height": float(np.median(heights)) if heights.size else 0.0,
+        "largest_component": float(areas.max() / ink_pixels) if areas.size else 0.0,
+        "h_lines": int(h_lines),
+        "v_lines": int(v_lines),
+        "line_ink": float((horizontal | vertical).sum() / ink_pixels) if ink_pixels else 0.0,
+    }
+
+
+def classify_page(img) -> Tuple[str, Dict[str, Any]]:
+    """(class, features) for a BGR or grayscale page image."""
+    cfg = CLASSIFY_CONFIG
+    f = page_features(img)
+    if f["ink"] < cfg["blank_max_ink"] and f["components"] <= cfg["blank_max_components"]:
+        return "blank", f
+    if f["h_lines"] >= cfg["table_min_h_lines"] and f["v_lines"] >= cfg["table_min_v_lines"]:
+        return "table", f
+    if f["components"] <= cfg["sparse_max_components"] or f["ink"] < cfg["sparse_max_ink"]:
+        return "sparse", f
+    return "text", f
@@ -0,0 +1,220 @@
+"""
+Page OCR in worker processes with page images handed over through shared memory.
+
+Pickling a rendered page to a worker process copies it twice (pickle, pipe)
+and keeps a third copy alive on the other side: ~4-25 MB per page. Instead,
+pages are rendered into slots of one SharedMemory block (PageRing); workers
+attach to the block once and get only a small descriptor (slot, height,
+width) per page, which they view as a numpy array without copying.
+
+Slots come back to the ring when the worker's result arrives, so the ring
+size bounds both memory and how far rendering can run ahead of OCR (render
+blocks on a free slot).
+
+Pages are rendered in grayscale (what Tesseract and the page classifier use
+anyway), a third of the size of BGR. PyMuPDF can't render into a caller's
+buffer, so each pixmap is copied once into its slot; that copy is the only
+one.
+
+Each worker OCRs one page per task, so engines that batch pages (ONNX,
+OCR_CONFIG["batch_size"]) run at batch size 1 here; batching a task's
+worth of pages would need batch_size slots per process.
+
+  pool = PageOCRPool(processes=4)
+  pages = extract_page_details("doc.pdf", ocr_pool=pool)
+  pool.close()
+"""
+import logging
+import math
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here
+PAGE_STORE_CONFIG = {
+    "slot_pixels": 2400 * 3400,     # Largest grayscale page per slot (A3 at 2x zoom fits)
+    "slots_per_process": 2,         # One being OCR'd, one rendered and waiting
+}
+
+
+class PageRef(NamedTuple):
+    """What travels to a worker instead of the pixels."""
+    slot: int
+    height: int
+    width: int
+
+
+class PageRing:
+    """Fixed ring of page-sized slots in one shared memory block (owned by the parent process)."""
+
+    def __init__(self, slots: int, slot_bytes: int):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for i in range(slots):
+            self._free.put(i)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def acquire(self) -> int:
+        """Next free slot; blocks while every slot is in use."""
+        return self._free.get()
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+    def render(self, page, zoom: float = 2.0) -> PageRef:
+        """Render a PyMuPDF page in grayscale into a free slot."""
+        import numpy as np
+        from extract_text import _load_fitz
+
+        fitz = _load_fitz()
+        rect = page.rect
+        needed = rect.width * zoom * rect.height * zoom
+        if needed > self.slot_bytes:
+            # Oversized page (posters, drawings): render smaller rather than fail
+            smaller = zoom * math.sqrt(self.slot_bytes / needed) * 0.99
+            logger.warning(f"Page {rect.width:.0f}x{rect.height:.0f}pt too large for a slot at zoom "
+                           f"{zoom}; rendering at {smaller:.2f}")
+            zoom = smaller
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+
+        slot = self.acquire()
+        try:
+            src = np.ndarray((pix.height, pix.width), dtype=np.uint8, buffer=pix.samples_mv,
+                             strides=(pix.stride, 1))
+            view_slot(self.shm, self.slot_bytes, PageRef(slot, pix.height, pix.width))[:] = src
+        except BaseException:
+            self.release(slot)
+            raise
+        return PageRef(slot, pix.height, pix.width)
+
+    def put(self, img) -> PageRef:
+        """Copy an already decoded image (e.g. from cv2.imread) into a free slot, as grayscale."""
+        import cv2
+
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if gray.size > self.slot_bytes:
+            scale = math.sqrt(self.slot_bytes / gray.size) * 0.99
+            gray = cv2.resize(gray, (int(gray.shape[1] * scale), int(gray.shape[0] * scale)),
+                              interpolation=cv2.INTER_AREA)
+        slot = self.acquire()
+        ref = PageRef(slot, gray.shape[0], gray.shape[1])
+        try:
+            view_slot(self.shm, self.slot_bytes, ref)[:] = gray
+        except BaseException:
+            self.release(slot)
+            raise
+        return ref
+
+    def view(self, ref: PageRef):
+        return view_slot(self.shm, self.slot_bytes, ref)
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+def view_slot(shm: shared_memory.SharedMemory, slot_bytes: int, ref: PageRef):
+    """Zero-copy numpy view of a page in its slot."""
+    import numpy as np
+
+    return np.ndarray((ref.height, ref.width), dtype=np.uint8, buffer=shm.buf,
+                      offset=ref.slot * slot_bytes)
+
+
+# --- worker side ---
+
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_slot_bytes = 0
+
+
+def _attach(shm_name: str, slot_bytes: int) -> None:
+    global _worker_shm, _worker_slot_bytes
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_slot_bytes = slot_bytes
+
+
+def _ocr_slot(ref: PageRef, engine: Optional[str], classify: bool, words: bool) -> Dict[str, Any]:
+    from ocr_engines import get_engine
+    from page_classify import classify_page
+
+    img = view_slot(_worker_shm, _worker_slot_bytes, ref)
+    result: Dict[str, Any] = {}
+    page_class = None
+    if classify:
+        page_class, _ = classify_page(img)
+        result["page_class"] = page_class
+        if page_class == "blank":
+            result.update(text="", source="blank")
+            return result
+    ocr = get_engine(engine)
+    if words:
+        text, result["words"] = ocr.recognize_words([img], [page_class])[0]
+    else:
+        text = ocr.recognize([img], [page_class])[0]
+    result.update(text=text, source="ocr", engine=ocr.name)
+    return result
+
+
+class PageOCRPool:
+    """Worker processes that OCR pages from a shared PageRing."""
+
+    def __init__(self, processes: int, slots: Optional[int] = None):
+        cfg = PAGE_STORE_CONFIG
+        self.ring = PageRing(slots or processes * cfg["slots_per_process"], cfg["slot_pixels"])
+        self.executor = ProcessPoolExecutor(max_workers=processes, initializer=_attach,
+                                            initargs=(self.ring.name, self.ring.slot_bytes))
+        self._closed = False
+        logger.info(f"Page OCR pool: {processes} processes, {self.ring.slots} slots of "
+                    f"{self.ring.slot_bytes / 1e6:.0f} MB")
+
+    def submit(self, ref: PageRef, engine: Optional[str] = None, classify: bool = True) -> Future:
+        """OCR the page in ref's slot; the slot is released when the result (or error) is back."""
+        from ocr_engines import OCR_CONFIG
+
+        try:
+            # word_boxes is read here, not in the worker: workers keep the config they started with
+            future = self.executor.submit(_ocr_slot, ref, engine, classify, OCR_CONFIG["word_boxes"])
+        except BaseException:
+            self.ring.release(ref.slot)
+            raise
+        future.add_done_callback(lambda _: self.ring.release(ref.slot))
+        return future
+
+    def ocr_pages(self, refs, pages: List[Dict[str, Any]], engine=None, classify: bool = True) -> None:
+        """
+        refs yields (page index, PageRef) as pages are rendered; results are
+        merged into pages[i]. Rendering the next page overlaps OCR of earlier
+        ones and pauses while the ring is full. engine may be a name or a
+        function (page_index, image) -> name, called on the slot view.
+        """
+        futures = []
+        for i, ref in refs:
+            try:
+                name = engine(i, self.ring.view(ref)) if callable(engine) else engine
+            except BaseException:
+                self.ring.release(ref.slot)  # Not submitted, so no result will release it
+                raise
+            futures.append((i, self.submit(ref, name, classify)))
+        for i, future in futures:
+            pages[i].update(future.result())
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.executor.shutdown(wait=True)
+        self.ring.close()
+
+    def __enter__(self) -> "PageOCRPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
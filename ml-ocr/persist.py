@@ -0,0 +1,185 @@
+"""
+Bulk persistence of pipeline results into Postgres.
+
+Results are linked to rfq_documents / rfq_response_documents by `path`, stored
+the same way those tables store it (e.g. 'rfq-detailed-boq/398445437_BOQ.pdf'),
+so `JOIN document_ocr_results r ON r.path = d.path` finds a document's OCR.
+
+Rows are buffered and written per batch with COPY into a session temp table,
+then upserted with one INSERT ... ON CONFLICT, over a single reused connection.
+Re-running a backfill rewrites rows in place instead of duplicating them.
+
+A result only counts as persisted once its batch has committed: add() takes an
+on_commit(error) callback that runs then (error None) or when the row could
+not be written. A failed batch is retried row by row, so one bad row doesn't
+fail the rest of its batch.
+"""
+import io
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+PG_CONFIG = {
+    "host": os.getenv("PGHOST", "localhost"),
+    "port": int(os.getenv("PGPORT", 5432)),
+    "user": os.getenv("PGUSER", "postgres"),
+    "password": os.getenv("PGPASSWORD", "gyan"),
+    "database": os.getenv("PGDATABASE", "tms_local"),
+}
+
+TABLE = "document_ocr_results"
+
+COLUMNS = ["path", "file_name", "raw_text", "cleaned_text", "fields", "items", "timings", "error"]
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    id bigserial PRIMARY KEY,
+    path text NOT NULL UNIQUE,
+    file_name text NOT NULL,
+    raw_text text,
+    cleaned_text text,
+    fields jsonb,
+    items jsonb,
+    timings jsonb,
+    error text,
+    created_at timestamptz DEFAULT now(),
+    updated_at timestamptz DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS {TABLE}_file_name_idx ON {TABLE} (file_name);
+"""
+
+UPSERT = f"""
+INSERT INTO {TABLE} ({", ".join(COLUMNS)})
+SELECT DISTINCT ON (path) {", ".join(COLUMNS)} FROM _ocr_staging
+ORDER BY path, id DESC
+ON CONFLICT (path) DO UPDATE SET
+    file_name = EXCLUDED.file_name,
+    raw_text = EXCLUDED.raw_text,
+    cleaned_text = EXCLUDED.cleaned_text,
+    fields = EXCLUDED.fields,
+    items = EXCLUDED.items,
+    timings = EXCLUDED.timings,
+    error = EXCLUDED.error,
+    updated_at = now()
+"""
+
+
+def db_path(doc_path: str, root: Optional[str] = None) -> str:
+    """Path as the rfq document tables store it: relative to `root`, forward slashes."""
+    rel = os.path.relpath(doc_path, root) if root else os.path.basename(doc_path)
+    return rel.replace(os.sep, "/")
+
+
+def _json(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False)
+
+
+def _csv_field(value: Any) -> str:
+    # Unquoted empty is NULL in COPY's CSV format; every real value is quoted.
+    # NUL bytes are not allowed in Postgres text and OCR output occasionally has them.
+    if value is None:
+        return ""
+    return '"' + str(value).replace("\x00", "").replace('"', '""') + '"'
+
+
+class ResultWriter:
+    """
+    writer = ResultWriter(root="organized")
+    writer.add(result, on_commit=ack)   # from run_pipeline; ack(None) once committed
+    writer.close()                      # flushes the last batch
+
+    Rows and callbacks are buffered together; add() itself doesn't raise for
+    database errors, they go to the row's on_commit.
+    """
+
+    def __init__(self, root: Optional[str] = None, batch_size: int = 500,
+                 pg_config: Optional[Dict[str, Any]] = None):
+        import psycopg2
+
+        self.root = root
+        self.batch_size = batch_size
+        self.conn = psycopg2.connect(**(pg_config or PG_CONFIG))
+        self.written = 0
+        self._rows: List[List[Any]] = []
+        self._callbacks: List[Optional[Callable[[Optional[str]], None]]] = []
+        self._lock = threading.Lock()
+        with self.conn.cursor() as cur:
+            cur.execute(DDL)
+            # Staging ids come from the same sequence, so the newest row per path wins
+            cur.execute(f"CREATE TEMP TABLE _ocr_staging (LIKE {TABLE} INCLUDING DEFAULTS) "
+                        f"ON COMMIT DELETE ROWS")
+        self.conn.commit()
+
+    def add(self, result: Dict[str, Any], error: Optional[str] = None,
+            on_commit: Optional[Callable[[Optional[str]], None]] = None) -> None:
+        path = result["path"]
+        row = [
+            db_path(path, self.root),
+            os.path.basename(path),
+            result.get("raw_text"),
+            result.get("cleaned_text"),
+            _json(result.get("fields")),
+            _json(result.get("items")),
+            _json(result.get("timings")),
+            error,
+        ]
+        with self._lock:
+            self._rows.append(row)
+            self._callbacks.append(on_commit)
+            if len(self._rows) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _write(self, rows: List[List[Any]]) -> None:
+        buf = io.StringIO()
+        for row in rows:
+            buf.write(",".join(_csv_field(v) for v in row) + "\n")
+        buf.seek(0)
+        try:
+            with self.conn.cursor() as cur:
+                cur.copy_expert(
+                    f"COPY _ocr_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                    buf)
+                cur.execute(UPSERT)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def _flush_locked(self) -> None:
+        if not self._rows:
+            return
+        rows, callbacks = self._rows, self._callbacks
+        self._rows, self._callbacks = [], []
+        errors: List[Optional[str]] = [None] * len(rows)
+        try:
+            self._write(rows)
+        except Exception as e:
+            logger.warning(f"Batch of {len(rows)} results failed ({type(e).__name__}: {e}); "
+                           f"retrying row by row")
+            for i, row in enumerate(rows):
+                try:
+                    self._write([row])
+                except Exception as row_error:
+                    errors[i] = f"persist: {type(row_error).__name__}: {row_error}"
+                    logger.error(f"Could not persist {row[0]}: {errors[i]}")
+        ok = errors.count(None)
+        self.written += ok
+        logger.info(f"Persisted {ok} results ({self.written} total)")
+        for callback, error in zip(callbacks, errors):
+            if callback is not None:
+                callback(error)
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
@@ -0,0 +1,150 @@
+"""
+The OCR -> preprocess -> LLM pipeline as named stages, shared by the CLI and the service.
+"""
+import logging
+import time
+from typing import Dict, Any, Callable, Optional
+
+from extract_text import extract_page_details, join_pages
+from pre_process import preprocess_text
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["ocr", "preprocess", "clean", "ner", "tables", "extract"]
+
+StageCallback = Callable[[str, Dict[str, Any]], None]
+
+
+def warm_up(use_llm: bool = True) -> None:
+    """Load the heavy backends up front (for long-running workers)."""
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    import pytesseract
+    from extract_text import _load_fitz
+    from ocr_engines import OCR_CONFIG, get_engine
+
+    _load_fitz()
+    try:
+        logger.info(f"Tesseract {pytesseract.get_tesseract_version()} ready")
+    except Exception as e:
+        logger.warning(f"Tesseract not available: {e}")
+    if OCR_CONFIG["engine"] != "tesseract":
+        get_engine()
+    if use_llm:
+        from llm_backends import get_router
+        get_router()
+
+
+def _ner(result: Dict[str, Any]) -> None:
+    from ner_extract import extract_entities
+    try:
+        result["entities"] = extract_entities(result["cleaned_text"])
+    except RuntimeError as e:  # spaCy not installed: the LLM still extracts these fields
+        logger.warning(f"Skipping NER: {e}")
+        result["entities"] = {}
+
+
+def _tables(result: Dict[str, Any]) -> None:
+    from table_extract import extract_items
+    try:
+        result["items"] = extract_items(result["path"], result.get("page_info"))
+    except Exception as e:  # The LLM can still extract items; don't lose the document over a table
+        logger.warning(f"Table extraction failed for {result['path']}: {type(e).__name__}: {e}")
+        result["items"] = []
+
+
+def _extract(result: Dict[str, Any]) -> None:
+    from llm_backends import extract_structured_fields
+    from ner_extract import confident_fields, merge_into_fields
+    items = result.get("items")
+    entities = result.get("entities", {})
+    # Fields NER is already sure of don't need their retrieval windows in the prompt;
+    # the LLM's value for them comes from unrelated context, so NER's wins
+    skip = set(confident_fields(entities))
+    fields = extract_structured_fields(result["cleaned_text"], include_items=not items, skip_fields=skip)
+    merge_into_fields(fields, entities, override=skip)
+    if items:
+        fields["items"] = items
+    result["fields"] = fields
+
+
+def _local_fields(result: Dict[str, Any]) -> None:
+    """Without the LLM, fields are whatever NER is confident about plus the table items."""
+    if result.get("entities"):
+        from ner_extract import confident_fields
+        result["fields"] = {**confident_fields(result["entities"]), "items": result.get("items", [])}
+
+
+def run_pipeline(
+    path: str,
+    use_llm: bool = True,
+    on_stage: Optional[StageCallback] = None,
+    ocr_engine: Optional[str] = None,
+    ocr_pool=None,
+    ocr_result: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Run every stage on one document. After each stage on_stage(name, result) is
+    called with the result so far, so callers can publish partial results.
+    Result keys: path, pages (raw text per page), page_info (per page: source,
+    page_class, engine), raw_text, text (rule-cleaned), cleaned_text, entities
+    (buyer/address/contact with confidences, ner_extract.py), items, fields,
+    timings.
+    ocr_engine: OCR engine name (ocr_engines.ENGINES); None uses OCR_CONFIG.
+    ocr_pool: page_store.PageOCRPool to OCR pages in worker processes.
+    ocr_result: pages / page_info / ocr_engine from an earlier run of the same
+    document with the same OCR settings; the ocr stage then reuses them.
+    """
+    result: Dict[str, Any] = {"path": path, "timings": {}}
+
+    def stage(name: str, fn: Callable[[], None]) -> None:
+        started = time.perf_counter()
+        fn()
+        result["timings"][name] = round(time.perf_counter() - started, 3)
+        if on_stage is not None:
+            on_stage(name, result)
+
+    def ocr():
+        from ocr_engines import OCR_CONFIG
+        if ocr_result is not None:
+            result.update({k: ocr_result[k] for k in ("pages", "page_info", "ocr_engine")})
+        else:
+            details = extract_page_details(path, engine=ocr_engine, ocr_pool=ocr_pool)
+            result["pages"] = [page.pop("text") for page in details]
+            result["page_info"] = details
+            result["ocr_engine"] = ocr_engine or OCR_CONFIG["engine"]
+        result["raw_text"] = join_pages(result["pages"])
+
+    def preprocess():
+        result["text"] = preprocess_text(result["raw_text"])
+        result["cleaned_text"] = result["text"]
+
+    def clean():
+        from llm_backends import clean_ocr_text
+        llm_clean = clean_ocr_text(result["text"])
+        result["cleaned_text"] = llm_clean.get("cleaned_text", result["text"])
+
+    def ner():
+        _ner(result)
+
+    def tables():
+        _tables(result)
+
+    def extract():
+        _extract(result)
+
+    stage("ocr", ocr)
+    stage("preprocess", preprocess)
+    if use_llm:
+        stage("clean", clean)
+    from ner_extract import NER_CONFIG
+    if NER_CONFIG["enabled"]:
+        stage("ner", ner)
+    from table_extract import TABLES
+    if TABLES["enabled"]:
+        stage("tables", tables)
+    if use_llm:
+        stage("extract", extract)
+    else:
+        _local_fields(result)
+    return result
@@ -0,0 +1,188 @@
+"""
+Pipelined (overlapping) run of one document: same result as pipeline.run_pipeline.
+
+run_pipeline finishes each stage before starting the next, so the CPU idles
+during LLM calls and the LLM idles during OCR. Here pages move through the
+stages in batches, connected by bounded asyncio queues:
+
+  OCR (executor) -> preprocess (executor) -> LLM cleanup (up to N chunks in flight)
+
+and table extraction runs alongside cleanup once OCR is done (it uses the
+page classes). While batch k is being
+cleaned by the LLM, batch k+1 is preprocessed and batch k+2 is OCR'd; a full
+queue pauses the stage feeding it. Extraction (which needs the whole cleaned
+text) starts once the last chunk is cleaned. End-to-end time tends towards
+the slowest stage instead of the sum.
+
+Cleanup works per page batch, so its LLM calls see less context than a
+whole-document call would.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from extract_text import iter_page_batches, join_pages
+from pipeline import StageCallback, _extract, _local_fields, _ner, _tables
+from pre_process import preprocess_text
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here
+PIPELINED_CONFIG = {
+    "page_batch": 4,            # Pages per batch flowing through the stages
+    "queue_size": 2,            # Batches buffered between two stages
+    "clean_concurrency": 4,     # Batches being cleaned by the LLM at once
+}
+
+
+async def run_pipelined(
+    path: str,
+    use_llm: bool = True,
+    on_stage: Optional[StageCallback] = None,
+    ocr_engine: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Same result keys as run_pipeline. timings holds the time each stage spent
+    working (they overlap, so they add up to more than timings["wall"]).
+    on_stage(name, result) is called as each stage finishes for the whole document.
+    """
+    from ocr_engines import OCR_CONFIG
+
+    cfg = PIPELINED_CONFIG
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=3 + cfg["clean_concurrency"], thread_name_prefix="pipelined")
+    result: Dict[str, Any] = {"path": path, "timings": {}, "ocr_engine": ocr_engine or OCR_CONFIG["engine"]}
+    busy: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    async def run(stage: str, fn: Callable, *args):
+        t0 = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            busy[stage] = busy.get(stage, 0.0) + time.perf_counter() - t0
+
+    def done(stage: str) -> None:
+        result["timings"][stage] = round(busy.get(stage, 0.0), 3)
+        if on_stage is not None:
+            on_stage(stage, result)
+
+    ocr_queue: asyncio.Queue = asyncio.Queue(maxsize=cfg["queue_size"])
+    text_queue: asyncio.Queue = asyncio.Queue(maxsize=cfg["queue_size"])
+    batches: List[List[Dict[str, Any]]] = []
+    texts: List[str] = []
+    cleaned: List[str] = []
+
+    async def ocr_stage():
+        pages = iter_page_batches(path, cfg["page_batch"], engine=ocr_engine)
+        # A batch may still be OCR'ing in the executor when this stage is
+        # cancelled; close() (which closes the PDF) waits for it under the lock
+        lock = threading.Lock()
+
+        def next_batch():
+            with lock:
+                return next(pages, None)
+
+        def close_pages():
+            with lock:
+                pages.close()
+
+        try:
+            while True:
+                batch = await run("ocr", next_batch)
+                if batch is None:
+                    break
+                await ocr_queue.put((len(batches), batch))
+                batches.append(batch)
+        except BaseException:
+            # Not the stage executor: it is being shut down by now
+            loop.run_in_executor(None, close_pages)
+            raise
+        await ocr_queue.put(None)
+        details = [page for batch in batches for page in batch]
+        # Copies: preprocessing may still be reading the last batches
+        result["pages"] = [page["text"] for page in details]
+        result["page_info"] = [{k: v for k, v in page.items() if k not in ("text", "page")}
+                               for page in details]
+        result["raw_text"] = join_pages(result["pages"])
+        done("ocr")
+
+    async def preprocess_stage():
+        while True:
+            item = await ocr_queue.get()
+            if item is None:
+                break
+            n, batch = item
+            text = await run("preprocess", preprocess_text, join_pages([p["text"] for p in batch]))
+            texts.append(text)
+            cleaned.append(text)
+            await text_queue.put((n, text))
+        await text_queue.put(None)
+        result["text"] = join_pages(texts)
+        result["cleaned_text"] = result["text"]
+        done("preprocess")
+
+    async def clean_stage():
+        from llm_backends import clean_ocr_text
+
+        slots = asyncio.Semaphore(cfg["clean_concurrency"])
+
+        async def clean(n: int, text: str) -> None:
+            try:
+                if text.strip():
+                    out = await run("clean", clean_ocr_text, text)
+                    cleaned[n] = out.get("cleaned_text", text)
+            finally:
+                slots.release()
+
+        tasks = []
+        while True:
+            item = await text_queue.get()
+            if item is None:
+                break
+            # Waiting here (not inside the task) keeps the backlog in the bounded queue
+            await slots.acquire()
+            tasks.append(asyncio.ensure_future(clean(*item)))
+        await asyncio.gather(*tasks)
+        result["cleaned_text"] = join_pages(cleaned)
+        done("clean")
+
+    async def drain_text_queue():
+        while await text_queue.get() is not None:
+            pass
+
+    async def tables_stage():
+        from table_extract import TABLES
+        await ocr_task
+        if TABLES["enabled"]:
+            await run("tables", _tables, result)
+            done("tables")
+
+    ocr_task = asyncio.ensure_future(ocr_stage())
+    tables_task = asyncio.ensure_future(tables_stage())
+    stages = [ocr_task] + [asyncio.ensure_future(s) for s in
+                           (preprocess_stage(), clean_stage() if use_llm else drain_text_queue())]
+    try:
+        await asyncio.gather(*stages)
+
+        from ner_extract import NER_CONFIG
+        if NER_CONFIG["enabled"]:
+            await run("ner", _ner, result)
+            done("ner")
+        await tables_task
+        if use_llm:
+            await run("extract", _extract, result)
+            done("extract")
+        else:
+            _local_fields(result)
+    except BaseException:
+        for task in stages + [tables_task]:
+            task.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=False)
+    result["timings"]["wall"] = round(time.perf_counter() - started, 3)
+    return result
@@ -0,0 +1,414 @@
+"""
+Columnar store of pipeline results (Parquet datasets, pyarrow) for corpus-wide
+analysis: confidence distributions, per-buyer stats, reprocessing candidates.
+
+Three datasets under one root, each partitioned by processing day (hive
+layout, <root>/<dataset>/day=YYYY-MM-DD/part-*.parquet):
+
+  docs   one row per document run: timings per stage, extracted fields, errors
+  pages  one row per page: text, source, class, engine, word count and confidence
+  words  one row per OCR word (or text layer word): box and confidence
+
+Results are buffered and written a batch at a time (one file per dataset and
+day per batch), sorted by path and page so row-group statistics let filters
+on path skip most of a file. Reads go through pyarrow.dataset: partition and
+column pruning, predicate pushdown into the Parquet row groups, and files are
+memory-mapped rather than read into buffers.
+
+A document processed again gets new rows with a later run_at; summary and
+reprocess only look at each document's latest run.
+
+  python main.py --bulk organized/ --store results/store       # write while processing
+  python result_store.py build results/ results/store            # backfill bulk JSON results
+  python result_store.py query results/store pages --where "mean_conf < 60" --columns path,page,mean_conf
+  python result_store.py summary results/store
+  python result_store.py reprocess results/store --max-conf 60 > redo.txt
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import uuid
+from typing import Callable, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here
+RESULT_STORE_CONFIG = {
+    "batch_pages": 5000,            # Flush once this many pages are buffered...
+    "batch_words": 1_000_000,       # ...or this many words
+    "compression": "zstd",
+    "row_group_rows": 100_000,
+}
+
+STAGE_COLUMNS = ["ocr", "preprocess", "clean", "ner", "tables", "extract", "dedup"]
+FIELD_COLUMNS = ["document_type", "title", "buyer", "tender_id", "publication_date",
+                 "submission_deadline", "estimated_value_inr", "currency", "contact", "address"]
+DATASETS = ("docs", "pages", "words")
+
+
+def _schemas() -> Dict[str, Any]:
+    import pyarrow as pa
+
+    run = [("path", pa.string()), ("run_at", pa.timestamp("ms"))]
+    return {
+        "docs": pa.schema(
+            run + [("file_name", pa.string()), ("ocr_engine", pa.string()), ("n_pages", pa.int32()),
+                   ("n_ocr_pages", pa.int32()), ("duplicate_of", pa.string()), ("error", pa.string())]
+            + [(f"t_{s}", pa.float64()) for s in STAGE_COLUMNS] + [("t_total", pa.float64())]
+            + [(f, pa.string()) for f in FIELD_COLUMNS]
+            + [("n_items", pa.int32()), ("fields_json", pa.string())]),
+        "pages": pa.schema(
+            run + [("page", pa.int32()), ("source", pa.string()), ("page_class", pa.string()),
+                   ("engine", pa.string()), ("text", pa.string()), ("n_chars", pa.int32()),
+                   ("n_words", pa.int32()), ("mean_conf", pa.float32()), ("min_conf", pa.float32())]),
+        "words": pa.schema(
+            run + [("page", pa.int32()), ("word", pa.int32()), ("text", pa.string()),
+                   ("left", pa.int32()), ("top", pa.int32()), ("width", pa.int32()),
+                   ("height", pa.int32()), ("conf", pa.float32())]),
+    }
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive")
+
+
+def _scalar(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def result_rows(result: Dict[str, Any], error: Optional[str] = None,
+                run_at: Optional[datetime.datetime] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """A pipeline result (pipeline.run_pipeline) as rows for each dataset."""
+    run_at = run_at or datetime.datetime.now()
+    day = run_at.strftime("%Y-%m-%d")
+    path = result["path"]
+    base = {"path": path, "run_at": run_at, "day": day}
+    timings = result.get("timings") or {}
+    fields = result.get("fields") or {}
+    page_texts = result.get("pages") or []
+    page_info = result.get("page_info") or [{} for _ in page_texts]
+
+    pages, words = [], []
+    for n, (text, info) in enumerate(zip(page_texts, page_info)):
+        page_words = info.get("words") or []
+        confs = [w["conf"] for w in page_words if w.get("conf") is not None]
+        pages.append(dict(base, page=n, source=info.get("source"), page_class=info.get("page_class"),
+                          engine=info.get("engine"), text=text, n_chars=len(text),
+                          n_words=len(page_words) if page_words else len(text.split()),
+                          mean_conf=sum(confs) / len(confs) if confs else None,
+                          min_conf=min(confs) if confs else None))
+        words.extend(dict(base, page=n, word=k, text=w["text"], left=w["left"], top=w["top"],
+                          width=w["width"], height=w["height"], conf=w.get("conf"))
+                     for k, w in enumerate(page_words))
+
+    doc = dict(base, file_name=os.path.basename(path), ocr_engine=result.get("ocr_engine"),
+               n_pages=len(page_texts),
+               n_ocr_pages=sum(1 for info in page_info if info.get("source") == "ocr"),
+               duplicate_of=result.get("duplicate_of"), error=error,
+               t_total=round(sum(v for k, v in timings.items() if k in STAGE_COLUMNS), 3) if timings else None,
+               n_items=len(fields.get("items") or result.get("items") or []),
+               fields_json=_scalar(fields) if fields else None)
+    doc.update({f"t_{s}": timings.get(s) for s in STAGE_COLUMNS})
+    doc.update({f: _scalar(fields.get(f)) for f in FIELD_COLUMNS})
+    return {"docs": [doc], "pages": pages, "words": words}
+
+
+class ResultStore:
+    """
+    store = ResultStore("results/store")
+    store.add(result, on_commit=ack)   # buffered; ack(None) once its batch is written
+    store.close()                      # writes what is left
+
+    Safe to share between worker threads. A batch that fails to write calls
+    its results' on_commit with the error instead of raising from add().
+    """
+
+    def __init__(self, root: str):
+        import pyarrow  # noqa: F401  (fail on construction, not on the first flush)
+
+        self.root = root
+        self.schemas = _schemas()
+        self._rows: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in DATASETS}
+        self._callbacks: List[Callable[[Optional[str]], None]] = []
+        self._lock = threading.Lock()
+        self.written = {kind: 0 for kind in DATASETS}
+
+    def add(self, result: Dict[str, Any], error: Optional[str] = None,
+            on_commit: Optional[Callable[[Optional[str]], None]] = None) -> None:
+        rows = result_rows(result, error)
+        cfg = RESULT_STORE_CONFIG
+        with self._lock:
+            for kind in DATASETS:
+                self._rows[kind].extend(rows[kind])
+            if on_commit is not None:
+                self._callbacks.append(on_commit)
+            if (len(self._rows["pages"]) >= cfg["batch_pages"]
+                    or len(self._rows["words"]) >= cfg["batch_words"]):
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        cfg = RESULT_STORE_CONFIG
+        file_format = ds.ParquetFileFormat()
+        batch, callbacks = self._rows, self._callbacks
+        self._rows, self._callbacks = {kind: [] for kind in DATASETS}, []
+        error = None
+        try:
+            # docs last: a document's row there means its pages and words are written
+            for kind in reversed(DATASETS):
+                rows = batch[kind]
+                if not rows:
+                    continue
+                schema = self.schemas[kind].append(pa.field("day", pa.string()))
+                table = pa.Table.from_pylist(rows, schema=schema)
+                sort_keys = [("path", "ascending")] + ([("page", "ascending")] if kind != "docs" else [])
+                ds.write_dataset(
+                    table.sort_by(sort_keys), os.path.join(self.root, kind), format=file_format,
+                    partitioning=_partitioning(),
+                    basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                    existing_data_behavior="overwrite_or_ignore",
+                    file_options=file_format.make_write_options(compression=cfg["compression"]),
+                    max_rows_per_group=cfg["row_group_rows"], min_rows_per_group=0)
+                self.written[kind] += len(rows)
+            logger.info(f"Result store: {self.written['docs']} docs, {self.written['pages']} pages, "
+                        f"{self.written['words']} words written")
+        except Exception as e:
+            error = f"result store: {type(e).__name__}: {e}"
+            logger.error(f"Could not write {len(batch['docs'])} results to the store: {error}")
+        for callback in callbacks:
+            callback(error)
+
+    def close(self) -> None:
+        self.flush()
+
+
+def open_dataset(root: str, kind: str):
+    """A dataset of the store (docs, pages or words), memory-mapped; None if nothing was written yet."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    path = os.path.join(root, kind)
+    if not os.path.isdir(path):
+        return None
+    schema = _schemas()[kind].append(pa.field("day", pa.string()))
+    return ds.dataset(path, schema=schema, format="parquet", partitioning=_partitioning(),
+                      filesystem=fs.LocalFileSystem(use_mmap=True))
+
+
+def read(root: str, kind: str, where=None, columns: Optional[List[str]] = None,
+         limit: Optional[int] = None):
+    """
+    Rows of one dataset as a pyarrow Table; where is a pyarrow.dataset
+    expression (see parse_where). With limit the scan stops once it has that many rows.
+    """
+    dataset = open_dataset(root, kind)
+    if dataset is None:
+        schema = _schemas()[kind]
+        return schema.empty_table().select(columns) if columns else schema.empty_table()
+    if limit is not None:
+        return dataset.head(limit, columns=columns, filter=where)
+    return dataset.to_table(columns=columns, filter=where)
+
+
+_WHERE_RE = re.compile(r"^\s*(\w+)\s*(==|!=|<=|>=|<|>|=)\s*(.+?)\s*$")
+
+
+def parse_where(kind: str, clauses: List[str]):
+    """["mean_conf < 60", "day >= 2026-01-01"] -> one pyarrow.dataset expression (AND)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = _schemas()[kind].append(pa.field("day", pa.string()))
+    expr = None
+    for clause in clauses:
+        m = _WHERE_RE.match(clause)
+        if not m or m.group(1) not in schema.names:
+            raise ValueError(f"Bad filter {clause!r}: expected <column> <op> <value>, "
+                             f"columns: {', '.join(schema.names)}")
+        name, op, raw = m.groups()
+        raw = raw.strip("'\"")
+        field_type = schema.field(name).type
+        if raw.lower() == "null":
+            value = None
+        elif pa.types.is_integer(field_type):
+            value = int(raw)
+        elif pa.types.is_floating(field_type):
+            value = float(raw)
+        elif pa.types.is_timestamp(field_type):
+            value = datetime.datetime.fromisoformat(raw)
+        else:
+            value = raw
+        field = ds.field(name)
+        if value is None:
+            cond = field.is_null() if op in ("=", "==") else field.is_valid()
+        else:
+            cond = {"=": field == value, "==": field == value, "!=": field != value,
+                    "<": field < value, "<=": field <= value, ">": field > value, ">=": field >= value}[op]
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def latest_runs(table):
+    """Only the rows from each document's latest run (table needs path and run_at)."""
+    if table.num_rows == 0:
+        return table
+    latest = table.group_by("path").aggregate([("run_at", "max")])
+    latest = latest.select(["path", "run_at_max"]).rename_columns(["path", "run_at"])
+    return table.join(latest, ["path", "run_at"], join_type="inner")
+
+
+def summary(root: str, where: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Corpus overview: stage timings, page confidence by engine and class, documents per buyer."""
+    import pyarrow.compute as pc
+
+    docs = latest_runs(read(root, "docs", parse_where("docs", where or []) if where else None,
+                            columns=["path", "run_at", "buyer", "error", "n_pages", "n_items", "t_total"]
+                            + [f"t_{s}" for s in STAGE_COLUMNS]))
+    pages = latest_runs(read(root, "pages", columns=["path", "run_at", "engine", "page_class", "source",
+                                                     "mean_conf", "n_words"]))
+    if where:
+        pages = pages.filter(pc.is_in(pages["path"], value_set=docs["path"]))
+    out: Dict[str, Any] = {
+        "docs": docs.num_rows,
+        "failed": docs.num_rows - docs["error"].null_count,
+        "pages": pages.num_rows,
+        "mean_seconds": {c[2:]: round(pc.mean(docs[c]).as_py(), 3)
+                         for c in ["t_total"] + [f"t_{s}" for s in STAGE_COLUMNS]
+                         if docs.num_rows and docs[c].null_count < docs.num_rows},
+    }
+
+    ocr = pages.filter(pc.is_valid(pages["mean_conf"]))
+    if ocr.num_rows:
+        deciles = pc.quantile(ocr["mean_conf"], q=[0.1, 0.25, 0.5, 0.75, 0.9]).to_pylist()
+        out["page_conf_quantiles"] = dict(zip(["p10", "p25", "p50", "p75", "p90"],
+                                              [round(q, 1) for q in deciles]))
+        for key in ("engine", "page_class"):
+            grouped = ocr.group_by(key).aggregate([("mean_conf", "mean"), ("mean_conf", "count")])
+            out[f"conf_by_{key}"] = {
+                row[key] or "-": {"pages": row["mean_conf_count"], "mean_conf": round(row["mean_conf_mean"], 1)}
+                for row in grouped.to_pylist()}
+    out["pages_by_source"] = {row["source"] or "-": row["count_all"]
+                              for row in pages.group_by("source").aggregate([([], "count_all")]).to_pylist()}
+
+    buyers = docs.filter(pc.is_valid(docs["buyer"]))
+    if buyers.num_rows:
+        grouped = buyers.group_by("buyer").aggregate([("path", "count"), ("n_pages", "sum"),
+                                                     ("n_items", "sum")])
+        top = grouped.sort_by([("path_count", "descending")]).slice(0, 20).to_pylist()
+        out["top_buyers"] = [{"buyer": r["buyer"], "docs": r["path_count"], "pages": r["n_pages_sum"],
+                              "items": r["n_items_sum"]} for r in top]
+    return out
+
+
+def reprocess_candidates(root: str, max_conf: float, min_pages: int = 1) -> List[str]:
+    """Documents whose latest run has at least min_pages OCR pages below max_conf mean confidence."""
+    import pyarrow.compute as pc
+
+    pages = latest_runs(read(root, "pages", where=parse_where("pages", [f"mean_conf < {max_conf}"]),
+                             columns=["path", "run_at", "page"]))
+    # The filter ran before latest_runs: drop pages of older runs of documents re-run since
+    current = latest_runs(read(root, "docs", columns=["path", "run_at"]))
+    pages = pages.join(current, ["path", "run_at"], join_type="inner")
+    if pages.num_rows == 0:
+        return []
+    counts = pages.group_by("path").aggregate([("page", "count")])
+    return sorted(counts.filter(pc.greater_equal(counts["page_count"], min_pages))["path"].to_pylist())
+
+
+def build_from_results(store: ResultStore, results_dir: str) -> Dict[str, int]:
+    """Add the per-document JSON files written by bulk mode (no word boxes unless they were kept)."""
+    added = failed = 0
+    for dirpath, _, filenames in os.walk(results_dir):
+        for name in filenames:
+            if not name.endswith(".json"):
+                continue
+            full = os.path.join(dirpath, name)
+            try:
+                with open(full, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {full}: {e}")
+                failed += 1
+                continue
+            if "path" not in result:
+                continue
+            store.add(result)
+            added += 1
+    store.flush()
+    return {"added": added, "failed": failed}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    parser = argparse.ArgumentParser(description="Columnar (Parquet) store of OCR results")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Add bulk-mode JSON results to a store")
+    build.add_argument("results_dir")
+    build.add_argument("store")
+
+    query = sub.add_parser("query", help="Filtered rows of one dataset")
+    query.add_argument("store")
+    query.add_argument("dataset", choices=DATASETS)
+    query.add_argument("--where", action="append", default=[],
+                       help="<column> <op> <value>, e.g. \"mean_conf < 60\" (repeatable, ANDed)")
+    query.add_argument("--columns", help="Comma-separated columns (default: all)")
+    query.add_argument("-n", "--limit", type=int, default=50)
+    query.add_argument("--csv", action="store_true")
+
+    summ = sub.add_parser("summary", help="Timings, confidence distribution and per-buyer stats")
+    summ.add_argument("store")
+    summ.add_argument("--where", action="append", default=[], help="Filter on docs columns")
+
+    redo = sub.add_parser("reprocess", help="Print documents with low-confidence OCR pages")
+    redo.add_argument("store")
+    redo.add_argument("--max-conf", type=float, default=60.0, help="Page mean confidence below this")
+    redo.add_argument("--min-pages", type=int, default=1)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            store = ResultStore(args.store)
+            try:
+                print(json.dumps(build_from_results(store, args.results_dir)))
+            finally:
+                store.close()
+        elif args.command == "query":
+            columns = args.columns.split(",") if args.columns else None
+            table = read(args.store, args.dataset, parse_where(args.dataset, args.where), columns,
+                         limit=args.limit)
+            frame = table.to_pandas()
+            if args.csv:
+                frame.to_csv(sys.stdout, index=False)
+            else:
+                print(frame.to_string(index=False, max_colwidth=60))
+        elif args.command == "summary":
+            print(json.dumps(summary(args.store, args.where), ensure_ascii=False, indent=2))
+        elif args.command == "reprocess":
+            for path in reprocess_candidates(args.store, args.max_conf, args.min_pages):
+                print(path)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Local BM25 retrieval of the document windows that hold each group of extraction fields.
+
+Instead of sending a whole tender to the LLM, the cleaned text is cut into
+paragraph windows, each field group (NIT header, key dates, value/EMD, contact
+block, items) ranks the windows with BM25 against its own keyword query, and
+only the top-K windows per group are sent. Windows keep their character
+offsets into the cleaned text so extracted values can be traced back.
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Any, List, Tuple
+
+# Configure behavior here (no signature changes needed)
+RETRIEVAL = {
+    "top_k": 3,                 # Windows kept per field group
+    "max_window_chars": 1200,   # Long paragraphs are cut into windows of about this size
+    "min_doc_chars": 6000,      # Shorter documents are sent whole
+    "always_include_first": True,  # The opening window usually carries the NIT header
+    "k1": 1.5,
+    "b": 0.75,
+}
+
+FIELD_GROUPS = {
+    "header": {
+        "fields": ["document_type", "title", "buyer", "tender_id"],
+        "query": "tender notice inviting nit e-tender bid enquiry rfq reference ref no number "
+                 "title name of work subject supply organisation department ministry government",
+    },
+    "dates": {
+        "fields": ["publication_date", "submission_deadline"],
+        "query": "date published publication start bid submission end last due deadline closing "
+                 "opening time schedule key critical dates",
+    },
+    "value": {
+        "fields": ["estimated_value_inr", "currency", "notes"],
+        "query": "estimated cost value amount inr emd earnest money deposit tender fee security "
+                 "performance guarantee lakh crore exemption",
+    },
+    "contact": {
+        "fields": ["contact", "address"],
+        "query": "contact address officer phone tel mobile email fax pin road nagar district "
+                 "state office correspondence",
+    },
+    "items": {
+        "fields": ["items"],
+        "query": "item description quantity qty unit nos specification specifications boq "
+                 "schedule of requirement sr no make model",
+    },
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+@dataclass
+class Window:
+    start: int
+    end: int
+    text: str
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def split_windows(text: str, max_chars: int = None) -> List[Window]:
+    """Paragraph windows with character offsets; oversized paragraphs are cut at line breaks."""
+    max_chars = max_chars or RETRIEVAL["max_window_chars"]
+    windows: List[Window] = []
+    pos = 0
+    for sep in list(re.finditer(r"\n\s*\n", text)) + [None]:
+        end = sep.start() if sep else len(text)
+        raw = text[pos:end]
+        start, para = pos + len(raw) - len(raw.lstrip()), raw.strip()
+        pos = sep.end() if sep else len(text)
+        while len(para) > max_chars:
+            cut = para.rfind("\n", 0, max_chars)
+            if cut <= 0:
+                cut = para.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            windows.append(Window(start, start + cut, para[:cut]))
+            skipped = len(para[cut:]) - len(para[cut:].lstrip())
+            start, para = start + cut + skipped, para[cut:].lstrip()
+        if para:
+            windows.append(Window(start, start + len(para), para))
+    return windows
+
+
+class BM25:
+    def __init__(self, docs: List[List[str]], k1: float = None, b: float = None):
+        self.k1 = k1 if k1 is not None else RETRIEVAL["k1"]
+        self.b = b if b is not None else RETRIEVAL["b"]
+        self.tfs = [Counter(d) for d in docs]
+        self.lengths = [len(d) for d in docs]
+        self.avg_len = (sum(self.lengths) / len(docs)) if docs else 0.0
+        df = Counter(term for d in docs for term in set(d))
+        n = len(docs)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def scores(self, query: List[str]) -> List[float]:
+        out = []
+        for tf, length in zip(self.tfs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_len or 1))
+            score = 0.0
+            for term in query:
+                f = tf.get(term)
+                if f:
+                    score += self.idf[term] * f * (self.k1 + 1) / (f + norm)
+            out.append(score)
+        return out
+
+
+def select_windows(text: str, top_k: int = None,
+                   groups: List[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Return (context, sources): the text of the selected windows in document order,
+    and one entry per window with its offsets and the field groups that picked it.
+    Documents under RETRIEVAL["min_doc_chars"] come back whole.
+    groups: restrict retrieval to these FIELD_GROUPS keys (default: all).
+    """
+    top_k = top_k or RETRIEVAL["top_k"]
+    groups = groups or list(FIELD_GROUPS)
+    if len(text) < RETRIEVAL["min_doc_chars"]:
+        return text, [{"start": 0, "end": len(text), "groups": groups}]
+
+    windows = split_windows(text)
+    if not windows:
+        return text, []
+    index = BM25([tokenize(w.text) for w in windows])
+
+    picked: Dict[int, List[str]] = {}
+    if RETRIEVAL["always_include_first"]:
+        picked[0] = ["header"]
+    for group in groups:
+        spec = FIELD_GROUPS[group]
+        scores = index.scores(tokenize(spec["query"]))
+        ranked = sorted(range(len(windows)), key=lambda i: scores[i], reverse=True)
+        for i in ranked[:top_k]:
+            if scores[i] <= 0:
+                break
+            window_groups = picked.setdefault(i, [])
+            if group not in window_groups:
+                window_groups.append(group)
+
+    order = sorted(picked)
+    context = "\n\n".join(windows[i].text for i in order)
+    sources = [{"start": windows[i].start, "end": windows[i].end, "groups": picked[i]}
+               for i in order]
+    return context, sources
@@ -0,0 +1,288 @@
+"""
+Local full-text search over OCR output (SQLite FTS5).
+
+Every page's preprocess_text output goes into an FTS5 table keyed by document
+and page number; extracted fields go into a second table so they can be
+searched on their own. Re-indexing a document replaces its rows, and documents
+whose size/mtime haven't changed are skipped, so updates are incremental.
+
+  python search_index.py build results/              # index bulk-mode JSON results
+  python search_index.py query "refrigerated centrifuge" -n 20
+  python search_index.py query "ministry of defence" --fields
+  python search_index.py stats
+
+Bulk mode can also index as it goes: python main.py --bulk organized/ --index ocr_index.db
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Any, Iterator, List, Optional
+
+from pre_process import preprocess_text
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here
+SEARCH = {
+    "db_path": os.getenv("OCR_INDEX_DB", "ocr_index.db"),
+    # unicode61 matches whole words (Devanagari included); "trigram" also
+    # matches substrings, e.g. part numbers, at roughly 3x the index size.
+    "tokenizer": "unicode61 remove_diacritics 2",
+    "batch_size": 200,          # Documents per commit while indexing
+    "snippet_tokens": 12,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    mtime REAL,
+    page_count INTEGER,
+    fields TEXT,
+    indexed_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+    text, doc_id UNINDEXED, page UNINDEXED, tokenize = '{tokenizer}'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS doc_fields USING fts5(
+    text, doc_id UNINDEXED, tokenize = '{tokenizer}'
+);
+"""
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def flatten_fields(value: Any, key: str = "") -> Iterator[str]:
+    """'key: value' lines for every scalar in the extracted fields."""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if k == "source_windows":
+                continue
+            yield from flatten_fields(v, k)
+    elif isinstance(value, list):
+        for v in value:
+            yield from flatten_fields(v, key)
+    elif value not in (None, ""):
+        yield f"{key}: {value}" if key else str(value)
+
+
+def match_query(text: str) -> str:
+    """Plain words -> an FTS5 query where every word must appear (any order)."""
+    return " ".join(f'"{t}"' for t in _TERM_RE.findall(text))
+
+
+class SearchIndex:
+    """
+    index = SearchIndex("ocr_index.db")
+    index.add(result, size=st.st_size, mtime=st.st_mtime)   # from run_pipeline
+    index.search("refrigerated centrifuge")
+    index.close()
+
+    One connection, shared by bulk worker threads behind a lock; writes are
+    committed every `batch_size` documents.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, batch_size: Optional[int] = None):
+        self.db_path = db_path or SEARCH["db_path"]
+        self.batch_size = batch_size or SEARCH["batch_size"]
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA.format(tokenizer=SEARCH["tokenizer"]))
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def is_current(self, path: str, size: Optional[int], mtime: Optional[float]) -> bool:
+        """Whether path is indexed from the source document at this size and mtime."""
+        with self._lock:
+            row = self.conn.execute("SELECT size, mtime FROM docs WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def add(self, result: Dict[str, Any], size: Optional[int] = None,
+            mtime: Optional[float] = None) -> None:
+        """Index (or re-index) one pipeline result; needs its "pages" or "raw_text"."""
+        path = result["path"]
+        raw_pages = result.get("pages") or [result.get("raw_text") or ""]
+        pages = [preprocess_text(p) for p in raw_pages]
+        fields = result.get("fields")
+        fields_text = "\n".join(flatten_fields(fields)) if fields else ""
+
+        with self._lock:
+            cur = self.conn.cursor()
+            row = cur.execute("SELECT id FROM docs WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                doc_id = row[0]
+                cur.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+                cur.execute("DELETE FROM doc_fields WHERE doc_id = ?", (doc_id,))
+                cur.execute("UPDATE docs SET size = ?, mtime = ?, page_count = ?, fields = ?, "
+                            "indexed_at = ? WHERE id = ?",
+                            (size, mtime, len(pages), json.dumps(fields, ensure_ascii=False),
+                             time.time(), doc_id))
+            else:
+                cur.execute("INSERT INTO docs (path, size, mtime, page_count, fields, indexed_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (path, size, mtime, len(pages), json.dumps(fields, ensure_ascii=False),
+                             time.time()))
+                doc_id = cur.lastrowid
+            cur.executemany("INSERT INTO pages (text, doc_id, page) VALUES (?, ?, ?)",
+                            [(text, doc_id, i) for i, text in enumerate(pages, start=1) if text])
+            if fields_text:
+                cur.execute("INSERT INTO doc_fields (text, doc_id) VALUES (?, ?)",
+                            (fields_text, doc_id))
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.conn.commit()
+                self._pending = 0
+
+    def remove(self, path: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT id FROM docs WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                return False
+            self.conn.execute("DELETE FROM pages WHERE doc_id = ?", (row[0],))
+            self.conn.execute("DELETE FROM doc_fields WHERE doc_id = ?", (row[0],))
+            self.conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+            self.conn.commit()
+        return True
+
+    def search(self, query: str, limit: int = 20, fields: bool = False,
+               raw: bool = False) -> List[Dict[str, Any]]:
+        """
+        Ranked hits (best first). Page hits carry the page number; with
+        fields=True the extracted fields are searched instead (page is None).
+        raw=True passes the query through as FTS5 syntax (phrases, OR, NEAR, prefix*).
+        """
+        fts_query = query if raw else match_query(query)
+        if not fts_query:
+            return []
+        table = "doc_fields" if fields else "pages"
+        page_col = "NULL" if fields else "t.page"
+        sql = (f"SELECT d.path, {page_col}, t.rank, "
+               f"snippet({table}, 0, '[', ']', '...', {SEARCH['snippet_tokens']}) "
+               f"FROM {table} t JOIN docs d ON d.id = t.doc_id "
+               f"WHERE {table} MATCH ? ORDER BY t.rank LIMIT ?")
+        with self._lock:
+            rows = self.conn.execute(sql, (fts_query, limit)).fetchall()
+        return [{"path": path, "page": page, "score": round(-rank, 4), "snippet": snippet}
+                for path, page, rank, snippet in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            docs, pages = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(page_count), 0) FROM docs").fetchone()
+        size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        return {"docs": docs, "pages": pages, "db_mb": round(size / 1e6, 2)}
+
+    def commit(self) -> None:
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+    def optimize(self) -> None:
+        """Merge FTS5 segments; worth running after a large build."""
+        with self._lock:
+            self.conn.execute("INSERT INTO pages (pages) VALUES ('optimize')")
+            self.conn.execute("INSERT INTO doc_fields (doc_fields) VALUES ('optimize')")
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
+
+
+def index_results_dir(index: SearchIndex, results_dir: str) -> Dict[str, int]:
+    """
+    Index the per-document JSON files written by bulk mode. Like bulk and
+    watch mode, rows are keyed on the source document's size/mtime, so
+    documents whose source hasn't changed are skipped (also when the other
+    modes indexed them).
+    """
+    added = skipped = failed = 0
+    for dirpath, _, filenames in os.walk(results_dir):
+        for name in filenames:
+            if not name.endswith(".json"):
+                continue
+            full = os.path.join(dirpath, name)
+            try:
+                with open(full, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+                if "path" not in result:
+                    continue
+                try:
+                    st = os.stat(result["path"])
+                    size, mtime = st.st_size, st.st_mtime
+                except OSError:
+                    size = mtime = None     # Source moved away: index what we have
+                if index.is_current(result["path"], size, mtime):
+                    skipped += 1
+                    continue
+                index.add(result, size=size, mtime=mtime)
+                added += 1
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {full}: {e}")
+                failed += 1
+    index.commit()
+    return {"added": added, "skipped": skipped, "failed": failed}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    # preprocess_text logs every rule it applies; too chatty per page
+    logging.getLogger("pre_process").setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Full-text search over OCR output")
+    parser.add_argument("--db", default=SEARCH["db_path"], help="SQLite index file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Index bulk-mode JSON results (incremental)")
+    build.add_argument("results_dir")
+    build.add_argument("--optimize", action="store_true", help="Merge index segments afterwards")
+
+    query = sub.add_parser("query", help="Ranked doc+page hits")
+    query.add_argument("text")
+    query.add_argument("-n", "--limit", type=int, default=20)
+    query.add_argument("--fields", action="store_true", help="Search extracted fields instead of page text")
+    query.add_argument("--raw", action="store_true", help="Query is FTS5 syntax (\"a phrase\", OR, NEAR, pre*)")
+    query.add_argument("--json", action="store_true")
+
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    try:
+        if args.command == "build":
+            started = time.perf_counter()
+            summary = index_results_dir(index, args.results_dir)
+            if args.optimize:
+                index.optimize()
+            logger.info(f"Indexed in {time.perf_counter() - started:.1f}s: {json.dumps(summary)}")
+        elif args.command == "query":
+            started = time.perf_counter()
+            try:
+                hits = index.search(args.text, limit=args.limit, fields=args.fields, raw=args.raw)
+            except sqlite3.OperationalError as e:
+                print(f"Bad query: {e}", file=sys.stderr)
+                sys.exit(2)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if args.json:
+                print(json.dumps(hits, ensure_ascii=False, indent=2))
+            else:
+                for hit in hits:
+                    where = hit["path"] if hit["page"] is None else f"{hit['path']} p.{hit['page']}"
+                    print(f"{hit['score']:8.3f}  {where}\n          {hit['snippet']}")
+                print(f"{len(hits)} hits in {elapsed_ms:.1f} ms", file=sys.stderr)
+        else:
+            print(json.dumps(index.stats()))
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,132 +1,223 @@
 """
 Replace OpenAI API with self-hosted open-source LLM
 Options: Llama 3.1, Mistral, Qwen2.5
+
+LocalLLMClient talks to the server; the clean / extract entry points below are
+served by llm_backends with the local backend alone, so chunking, budgets and
+retries are the same as for every other route.
 """
 import json
 import logging
-from typing import Dict, Any
-import requests
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from concurrency import get_limiter
+from token_budget import TokenUsage, check_budget, estimate_tokens, ledger
 
 logger = logging.getLogger(__name__)
 
+class GenerationCancelled(RuntimeError):
+    """Raised when an in-flight generation is abandoned via its cancel event."""
+
+
+class CancelEvent(threading.Event):
+    """
+    A cancel flag that also aborts the request in flight: a backend registers
+    a closer for its open response, and set() calls it, so a losing hedge
+    stops right away rather than at its next streamed chunk.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._closers: List[Callable[[], None]] = []
+        self._closers_lock = threading.Lock()
+
+    def on_cancel(self, closer: Callable[[], None]) -> Callable[[], None]:
+        """Run closer on set() (now, if already set); returns a function that unregisters it."""
+        with self._closers_lock:
+            if not self.is_set():
+                self._closers.append(closer)
+                return lambda: self._discard(closer)
+        closer()
+        return lambda: None
+
+    def _discard(self, closer: Callable[[], None]) -> None:
+        with self._closers_lock:
+            if closer in self._closers:
+                self._closers.remove(closer)
+
+    def set(self) -> None:
+        with self._closers_lock:
+            super().set()
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            try:
+                closer()
+            except Exception as e:
+                logger.debug(f"Closing a cancelled request failed: {e}")
+
+
+@contextmanager
+def abort_on_cancel(cancel_event: Optional[threading.Event], close: Callable[[], None]):
+    """
+    with abort_on_cancel(event, response.close): ...read the response...
+
+    Closes the response when the event is set; the read that fails (or stops)
+    because of it is reported as GenerationCancelled.
+    """
+    register = getattr(cancel_event, "on_cancel", None)
+    unregister = register(close) if register else None
+    try:
+        yield
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled("generation cancelled")
+    except GenerationCancelled:
+        raise
+    except Exception as e:
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled("generation cancelled") from e
+        raise
+    finally:
+        if unregister:
+            unregister()
+
+
 class LocalLLMClient:
     """
     Client for self-hosted LLM via Ollama/vLLM/LocalAI
     Run locally: ollama run llama3.1:8b
     """
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(self, base_url: str = "http://localhost:11434", timeout: float = 120):
         self.base_url = base_url
         self.api_endpoint = f"{base_url}/api/generate"
+        self.timeout = timeout
 
     def generate(self, prompt: str, model: str = "llama3.1:8b",
-                 temperature: float = 0.2, format: str = "json") -> str:
-        """Generate response from local LLM"""
+                 temperature: float = 0.2, format: str = "json",
+                 system: Optional[str] = None, stage: str = "generate",
+                 cancel_event: Optional[threading.Event] = None,
+                 max_tokens: Optional[int] = None) -> str:
+        """
+        Generate response from local LLM.
+        A static `system` prompt is sent ahead of the prompt so the server can
+        reuse its KV cache for the shared prefix.
+        With a `cancel_event` the response is streamed, and setting the event
+        closes the connection, which makes the server stop generating.
+        max_tokens caps the completion (Ollama's num_predict).
+        """
+        options: Dict[str, Any] = {"temperature": temperature}
+        if max_tokens:
+            options["num_predict"] = max_tokens
         payload = {
             "model": model,
             "prompt": prompt,
-            "temperature": temperature,
-            "stream": False,
+            "options": options,
+            "stream": cancel_event is not None,
         }
+        if system:
+            payload["system"] = system
         if format == "json":
             payload["format"] = "json"
 
+        estimated = estimate_tokens(system or "") + estimate_tokens(prompt)
+        check_budget(estimated, model, max_tokens)
+
         try:
-            response = requests.post(self.api_endpoint, json=payload, timeout=120)
-            response.raise_for_status()
-            result = response.json()
-            return result.get("response", "")
+            with get_limiter("local").slot(tokens=estimated,
+                                           neutral=(GenerationCancelled,)) as permit:
+                if cancel_event is None:
+                    import requests
+
+                    response = requests.post(self.api_endpoint, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    result = response.json()
+                    text = result.get("response", "")
+                else:
+                    text, result = self._generate_streaming(payload, cancel_event)
+                permit.tokens_used = self._record_usage(result, stage, model, estimated)
+            return text
+        except GenerationCancelled:
+            logger.info(f"LLM generation cancelled ({stage})")
+            raise
         except Exception as e:
             logger.error(f"LLM generation failed: {e}")
             raise
 
+    def _generate_streaming(self, payload: Dict[str, Any], cancel_event: threading.Event):
+        import requests
+
+        pieces = []
+        result: Dict[str, Any] = {}
+        with requests.post(self.api_endpoint, json=payload, timeout=self.timeout,
+                           stream=True) as response:
+            response.raise_for_status()
+            with abort_on_cancel(cancel_event, response.close):
+                for line in response.iter_lines():
+                    if cancel_event.is_set():
+                        raise GenerationCancelled("generation cancelled")
+                    if not line:
+                        continue
+                    result = json.loads(line)
+                    pieces.append(result.get("response", ""))
+                    if result.get("done"):
+                        break
+        return "".join(pieces), result
+
+    @staticmethod
+    def _record_usage(result: Dict[str, Any], stage: str, model: str, estimated: int) -> int:
+        # Ollama's prompt_eval_count leaves out tokens reused from the KV cache,
+        # so the cached count is approximated from the pre-call estimate
+        evaluated = result.get("prompt_eval_count", 0) or 0
+        usage = TokenUsage(
+            stage=stage,
+            model=model,
+            prompt_tokens=max(evaluated, estimated),
+            completion_tokens=result.get("eval_count", 0) or 0,
+            cached_tokens=max(0, estimated - evaluated) if evaluated else 0,
+            estimated_prompt_tokens=estimated,
+        )
+        ledger.record(usage)
+        return usage.prompt_tokens + usage.completion_tokens
+
 def clean_ocr_text_local(
     text: str,
     preserve_case: bool = True,
     keep_hindi: bool = True,
     standardize_tokens: bool = True,
     model: str = "llama3.1:8b",
+    max_tokens: int = 2000,
 ) -> Dict[str, Any]:
     """
     Clean OCR text using self-hosted LLM (NO external APIs)
+    Same as llm_backends.clean_ocr_text with only the local backend.
     """
-    client = LocalLLMClient()
-
-    prompt = f"""You are an OCR text cleaner. Clean the following text with these requirements:
-- Preserve original meaning and wording
-- Fix spacing, broken words, and punctuation
-- Fix common OCR errors (0/O confusion, rn/m, broken quotes)
-- Merge soft-wrapped lines and hyphenated words
-- Remove recurring headers/footers if clearly identified
-- Keep Hindi Devanagari text as-is
-- Standardize dates to yyyy-mm-dd format where clear
-- Standardize currency to 'INR <amount>'
-- Normalize percent spacing (e.g., '50%')
-
-Return ONLY a JSON object with these keys:
-- cleaned_text: the cleaned text
-- notes: array of what was fixed
-- removed_lines: array of removed header/footer lines
-- stats: object with counts
-
-Input text:
-{text}
-
-Output JSON:"""
+    from llm_backends import clean_ocr_text, single_backend_router
 
-    try:
-        response = client.generate(prompt, model=model, temperature=0.1, format="json")
-        return json.loads(response)
-    except json.JSONDecodeError:
-        logger.warning("Model did not return valid JSON")
-        return {"cleaned_text": text, "notes": ["Parsing failed, returning original"]}
+    return clean_ocr_text(text, preserve_case, keep_hindi, standardize_tokens,
+                          max_tokens=max_tokens, router=single_backend_router("local", model))
 
 def extract_structured_fields_local(
     text: str,
     model: str = "llama3.1:8b",
+    on_overflow: str = "split",
+    use_retrieval: bool = True,
+    include_items: bool = True,
+    max_tokens: int = 2000,
+    skip_fields: Iterable[str] = (),
 ) -> Dict[str, Any]:
     """
     Extract structured tender fields using self-hosted LLM
+    Same as llm_backends.extract_structured_fields with only the local backend.
     """
-    client = LocalLLMClient()
-
-    schema_example = {
-        "document_type": "tender",
-        "title": "Supply of Laboratory Equipment",
-        "buyer": "AIIMS Delhi",
-        "tender_id": "AIIMS/PUR/2024/123",
-        "publication_date": "2024-01-15",
-        "submission_deadline": "2024-02-15",
-        "estimated_value_inr": 5000000.0,
-        "currency": "INR",
-        "contact": "Dr. Sharma (procurement@aiims.edu)",
-        "address": "AIIMS, Ansari Nagar, New Delhi",
-        "items": [
-            {
-                "description": "Laboratory Centrifuge",
-                "quantity": 5,
-                "unit": "pieces",
-                "specs": "Min 5000 RPM, refrigerated"
-            }
-        ],
-        "notes": "EMD: 2% of tender value",
-        "confidence": 0.9
-    }
-
-    prompt = f"""Extract tender information from the following OCR text.
-Only use facts present in the text - do not invent values.
-If uncertain, use null for that field.
-
-Expected JSON structure (example):
-{json.dumps(schema_example, indent=2)}
-
-Input text:
-{text}
-
-Extract and return ONLY valid JSON:"""
+    from llm_backends import AllBackendsFailed, extract_structured_fields, single_backend_router
 
     try:
-        response = client.generate(prompt, model=model, temperature=0.0, format="json")
-        return json.loads(response)
-    except json.JSONDecodeError:
+        return extract_structured_fields(text, max_tokens=max_tokens, on_overflow=on_overflow,
+                                         use_retrieval=use_retrieval, include_items=include_items,
+                                         router=single_backend_router("local", model),
+                                         skip_fields=skip_fields)
+    except AllBackendsFailed as e:
+        if e.invalid_reply() is None:
+            raise
         logger.warning("Failed to parse structured fields")
         return {"document_type": "unknown", "confidence": 0.0}
@@ -0,0 +1,255 @@
+"""
+HTTP OCR service: upload a document, get a job id, poll for per-stage results.
+
+Run:
+  uvicorn service:app --host 0.0.0.0 --port 8000
+
+Endpoints:
+  POST /jobs                 multipart upload (field "file"), 202 + job id, 429 when the queue is
+                             full, 413 when over max_upload_mb (both refused from the headers alone)
+  GET  /jobs/{job_id}        status, current stage, timings and partial results so far
+  GET  /jobs/{job_id}/result full result once done (409 while still running)
+  GET  /health               queue depth, worker count, LLM limiter state
+
+Workers are started once and warmed up (OpenCV, PyMuPDF, Tesseract, LLM router),
+so jobs don't pay process startup or client setup.
+"""
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from pipeline import run_pipeline, warm_up
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here (env vars override for deployments)
+SERVICE = {
+    "workers": int(os.getenv("OCR_WORKERS", os.cpu_count() or 2)),
+    "max_queue": int(os.getenv("OCR_MAX_QUEUE", 64)),       # Jobs waiting beyond this get 429
+    "upload_dir": os.getenv("OCR_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "ocr-uploads")),
+    "upload_chunk": 1024 * 1024,                            # Bytes per copy into upload_dir
+    "max_upload_mb": int(os.getenv("OCR_MAX_UPLOAD_MB", 200)),
+    "job_ttl": 3600,                                        # Finished jobs are forgotten after this
+    "use_llm": os.getenv("OCR_USE_LLM", "1") != "0",
+    "retry_after": 5,                                       # Seconds suggested to clients on 429
+}
+
+PARTIAL_KEYS = {
+    "ocr": "raw_text",
+    "preprocess": "text",
+    "clean": "cleaned_text",
+    "ner": "entities",
+    "tables": "items",
+    "extract": "fields",
+}
+
+
+class Job:
+    def __init__(self, job_id: str, filename: str, path: str):
+        self.id = job_id
+        self.filename = filename
+        self.path = path
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.partial: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+
+    def summary(self, with_partial: bool = True) -> Dict[str, Any]:
+        out = {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "timings": self.timings,
+            "error": self.error,
+        }
+        if with_partial:
+            out["partial"] = self.partial
+        return out
+
+
+class JobQueue:
+    def __init__(self, workers: int, max_queue: int, use_llm: bool):
+        self.jobs: Dict[str, Job] = {}
+        self.pending: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max_queue)
+        self.use_llm = use_llm
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._worker, name=f"ocr-worker-{i}", daemon=True)
+                         for i in range(workers)]
+
+    @property
+    def worker_count(self) -> int:
+        return len(self._threads)
+
+    def start(self) -> None:
+        warm_up(self.use_llm)
+        for t in self._threads:
+            t.start()
+        logger.info(f"Started {len(self._threads)} OCR workers")
+
+    def stop(self) -> None:
+        for _ in self._threads:
+            self.pending.put(None)
+        for t in self._threads:
+            t.join(timeout=5)
+
+    def submit(self, job: Job) -> None:
+        """Raises queue.Full when the backlog is at capacity."""
+        with self._lock:
+            self.pending.put_nowait(job)
+            self.jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _expire(self) -> None:
+        cutoff = time.time() - SERVICE["job_ttl"]
+        with self._lock:
+            for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+                del self.jobs[job_id]
+
+    def _worker(self) -> None:
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            job.status = "running"
+
+            def on_stage(name: str, result: Dict[str, Any]) -> None:
+                job.stage = name
+                job.timings = dict(result["timings"])
+                key = PARTIAL_KEYS.get(name)
+                if key in result:
+                    job.partial[key] = result[key]
+
+            try:
+                run_pipeline(job.path, use_llm=self.use_llm, on_stage=on_stage)
+                job.status = "done"
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+                self._expire()
+
+
+jobs = JobQueue(SERVICE["workers"], SERVICE["max_queue"], SERVICE["use_llm"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    os.makedirs(SERVICE["upload_dir"], exist_ok=True)
+    jobs.start()
+    yield
+    jobs.stop()
+
+
+app = FastAPI(title="TMS OCR service", lifespan=lifespan)
+
+
+def _busy() -> JSONResponse:
+    return JSONResponse(status_code=429, content={"detail": "OCR queue is full, retry later"},
+                        headers={"Retry-After": str(SERVICE["retry_after"])})
+
+
+@app.middleware("http")
+async def admit_uploads(request: Request, call_next):
+    """
+    Refuse an upload from its headers. Starlette spools the whole multipart
+    body to disk while parsing the form, before submit_job (or any dependency
+    of it) runs, so by then a refusal has already cost the full upload.
+    """
+    if request.method == "POST" and request.url.path == "/jobs":
+        length = request.headers.get("content-length")
+        if length is None:
+            return JSONResponse(status_code=411, content={"detail": "Content-Length required"})
+        if not length.isdigit():
+            return JSONResponse(status_code=400, content={"detail": "Invalid Content-Length"})
+        # The multipart framing counts too, so this errs on the side of refusing
+        if int(length) > SERVICE["max_upload_mb"] * 1024 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "Upload too large"})
+        if jobs.pending.full():
+            return _busy()
+    return await call_next(request)
+
+
+def _save_upload(src, dest: str) -> None:
+    with open(dest, "wb") as out:
+        shutil.copyfileobj(src, out, SERVICE["upload_chunk"])
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    job_id = uuid.uuid4().hex
+    suffix = Path(file.filename or "").suffix.lower()
+    dest = os.path.join(SERVICE["upload_dir"], f"{job_id}{suffix}")
+    # Blocking file I/O: keep it off the event loop
+    await file.seek(0)
+    await run_in_threadpool(_save_upload, file.file, dest)
+    await file.close()
+
+    job = Job(job_id, file.filename or "", dest)
+    try:
+        jobs.submit(job)
+    except queue.Full:
+        os.remove(dest)
+        return _busy()
+    return {"job_id": job_id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.summary()
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return {**job.summary(with_partial=False), **job.partial}
+
+
+@app.get("/health")
+def health():
+    from concurrency import limiter_snapshots
+    return {
+        "workers": jobs.worker_count,
+        "queued": jobs.pending.qsize(),
+        "max_queue": SERVICE["max_queue"],
+        "limiters": limiter_snapshots(),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
@@ -0,0 +1,262 @@
+"""
+BOQ / items table extraction without the LLM.
+
+Two paths:
+  - Digital PDFs: PyMuPDF's table finder on the page's vector text.
+  - Scans and images: OpenCV ruling-line detection rebuilds the cell grid and
+    each cell is OCR'd on its own.
+
+Header cells are matched against COLUMN_SYNONYMS to map columns onto the
+extraction schema's item rows (description, quantity, unit, specs).
+
+Grid OCR is the expensive path (a render and one Tesseract call per cell), so
+when the pipeline passes its page_info only scanned pages classified as
+"table" (page_classify.py) go through it.
+"""
+import logging
+import os
+import re
+from typing import Dict, Any, List, Optional
+
+from extract_text import resolve_path, render_page, _load_fitz, usable_text_layer, SUPPORTED_IMAGE_EXTS
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here (no signature changes needed)
+TABLES = {
+    "line_scale": 40,          # Kernel length = image size / line_scale for ruling lines
+    "min_cell_px": 12,         # Ignore grid gaps thinner than this
+    "cell_padding": 3,         # Pixels trimmed from each cell edge before OCR
+    "cell_psm": 6,             # Tesseract page segmentation mode for cells
+    "lang": "eng+hin",
+    "header_scan_rows": 3,     # Look for the header in the first N rows of a table
+    "enabled": os.getenv("OCR_TABLES", "1") == "1",
+    # Scanned pages without a page class (classification off) get grid OCR too
+    "scan_unclassified": os.getenv("OCR_TABLES_UNCLASSIFIED", "0") == "1",
+}
+
+COLUMN_SYNONYMS = {
+    "description": ["description", "item", "items", "particulars", "name of item", "nomenclature",
+                    "material", "name of the item", "item name", "details", "product"],
+    "quantity": ["qty", "quantity", "qnty", "no of units", "nos", "required quantity", "qty."],
+    "unit": ["unit", "uom", "units", "unit of measurement", "measure"],
+    "specs": ["specification", "specifications", "specs", "technical specification",
+              "make", "model", "brand", "remarks"],
+}
+
+# Serial number headers ("Item No.", "Sr. No", "S.No", "#") are never the description
+_SERIAL_RE = re.compile(r"\b(?:s\.?\s?no|sno|sr|sl|no|serial)\b|#")
+
+_NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+def _norm(cell: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", (cell or "")).strip()
+
+
+def _column_scores(header: str) -> Dict[str, int]:
+    """Per field, the length of the longest synonym in the header (longer = more specific)."""
+    h = header.lower().strip(" .:")
+    scores: Dict[str, int] = {}
+    for field, names in COLUMN_SYNONYMS.items():
+        for name in names:
+            if re.search(rf"\b{re.escape(name)}\b", h):
+                scores[field] = max(scores.get(field, 0), len(name))
+    if "description" in scores and _SERIAL_RE.search(h):
+        del scores["description"]
+    return scores
+
+
+def map_columns(rows: List[List[str]]) -> Optional[Dict[str, Any]]:
+    """
+    Find the header row and map column indexes to item fields. Every header
+    is scored against every field and each field gets its best-scoring column
+    (ties: the leftmost), one field per column.
+    """
+    for idx, row in enumerate(rows[:TABLES["header_scan_rows"]]):
+        candidates = sorted(((score, -col, field) for col, cell in enumerate(row)
+                             for field, score in _column_scores(_norm(cell)).items()), reverse=True)
+        mapping: Dict[str, int] = {}
+        for _, neg_col, field in candidates:
+            if field not in mapping and -neg_col not in mapping.values():
+                mapping[field] = -neg_col
+        if "description" in mapping and ("quantity" in mapping or "unit" in mapping):
+            return {"header_row": idx, "columns": mapping}
+    return None
+
+
+def _parse_quantity(value: str) -> Optional[float]:
+    m = _NUMBER_RE.search(value or "")
+    if not m:
+        return None
+    number = float(m.group(0).replace(",", ""))
+    return int(number) if number.is_integer() else number
+
+
+def rows_to_items(rows: List[List[str]], mapping: Dict[str, Any]) -> List[Dict[str, Any]]:
+    cols = mapping["columns"]
+    items = []
+    for row in rows[mapping["header_row"] + 1:]:
+        def cell(field):
+            i = cols.get(field)
+            return _norm(row[i]) if i is not None and i < len(row) else ""
+
+        description = cell("description")
+        if not description:
+            # Continuation rows (wrapped specs) belong to the previous item
+            if items and cell("specs"):
+                items[-1]["specs"] = f"{items[-1]['specs']} {cell('specs')}".strip()
+            continue
+        items.append({
+            "description": description,
+            "quantity": _parse_quantity(cell("quantity")),
+            "unit": cell("unit") or None,
+            "specs": cell("specs") or None,
+        })
+    return items
+
+
+def _tables_from_text_layer(page) -> List[List[List[str]]]:
+    try:
+        found = page.find_tables()
+    except AttributeError:
+        logger.warning("PyMuPDF is too old for find_tables (needs >= 1.23)")
+        return []
+    return [[[_norm(c) for c in row] for row in tab.extract()] for tab in found.tables]
+
+
+def _line_positions(mask, axis: int) -> List[int]:
+    """Centers of ruling lines along an axis from a binary line mask."""
+    import numpy as np
+
+    profile = mask.sum(axis=axis) > 0
+    positions, start = [], None
+    for i, on in enumerate(np.append(profile, False)):
+        if on and start is None:
+            start = i
+        elif not on and start is not None:
+            positions.append((start + i - 1) // 2)
+            start = None
+    merged: List[int] = []
+    for p in positions:
+        if merged and p - merged[-1] < TABLES["min_cell_px"]:
+            continue
+        merged.append(p)
+    return merged
+
+
+def tables_from_image(bgr_img) -> List[List[List[str]]]:
+    """Rebuild a ruled table grid with morphology and OCR each cell."""
+    import cv2
+    import pytesseract
+
+    gray = bgr_img if bgr_img.ndim == 2 else cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY)
+    binary = cv2.adaptiveThreshold(~gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, -2)
+    h, w = binary.shape
+    horiz_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(1, w // TABLES["line_scale"]), 1))
+    vert_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(1, h // TABLES["line_scale"])))
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, horiz_kernel)
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, vert_kernel)
+
+    grid = cv2.add(horizontal, vertical)
+    contours, _ = cv2.findContours(grid, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    tables = []
+    pad = TABLES["cell_padding"]
+    config = f"--psm {TABLES['cell_psm']}"
+    for contour in sorted(contours, key=lambda c: cv2.boundingRect(c)[1]):
+        x, y, cw, ch = cv2.boundingRect(contour)
+        if cw < w // 4 or ch < 3 * TABLES["min_cell_px"]:
+            continue
+        ys = _line_positions(horizontal[y:y + ch, x:x + cw], axis=1)
+        xs = _line_positions(vertical[y:y + ch, x:x + cw], axis=0)
+        if len(ys) < 2 or len(xs) < 2:
+            continue
+        rows = []
+        for top, bottom in zip(ys, ys[1:]):
+            row = []
+            for left, right in zip(xs, xs[1:]):
+                cell = gray[y + top + pad:y + bottom - pad, x + left + pad:x + right - pad]
+                if cell.size == 0 or (cell < 128).mean() < 0.002:
+                    row.append("")
+                    continue
+                row.append(_norm(pytesseract.image_to_string(cell, lang=TABLES["lang"], config=config)))
+            rows.append(row)
+        tables.append(rows)
+    return tables
+
+
+def _grid_ocr(info: Optional[Dict[str, Any]]) -> bool:
+    """Whether a scanned page gets grid OCR, given its page_info entry (None: no info, yes)."""
+    if info is None:
+        return True
+    page_class = info.get("page_class")
+    if page_class is None:
+        return TABLES["scan_unclassified"]
+    return page_class == "table"
+
+
+def extract_tables(path_str: str, page_info: Optional[List[Dict[str, Any]]] = None) -> List[List[List[str]]]:
+    """
+    All tables in a document as rows of cell strings, text layer first, OCR grid otherwise.
+    page_info: the OCR stage's per-page info (pipeline result). Pages it read
+    from the text layer use the table finder; scanned pages get grid OCR only
+    when classified as tables.
+    """
+    p = resolve_path(path_str)
+    if not p.exists():
+        raise FileNotFoundError(f"Input file not found: {p}")
+    ext = p.suffix.lower()
+
+    if ext in SUPPORTED_IMAGE_EXTS:
+        import cv2
+
+        if not _grid_ocr(page_info[0] if page_info else None):
+            return []
+        img = cv2.imread(str(p))
+        if img is None:
+            raise ValueError(f"Failed to read image file via OpenCV: {p}")
+        return tables_from_image(img)
+
+    if ext != '.pdf':
+        raise ValueError(f"Unsupported file extension: {ext}")
+
+    fitz = _load_fitz()
+    tables = []
+    doc = fitz.open(str(p))
+    try:
+        for page_num in range(doc.page_count):
+            page = doc.load_page(page_num)
+            info = page_info[page_num] if page_info and page_num < len(page_info) else None
+            if info is not None:
+                text_layer = info.get("source") == "text_layer"
+            else:
+                text_layer = usable_text_layer(page) is not None
+            if text_layer:
+                tables.extend(_tables_from_text_layer(page))
+            elif _grid_ocr(info):
+                tables.extend(tables_from_image(render_page(page)))
+    finally:
+        doc.close()
+    return tables
+
+
+def extract_items(path_str: str, page_info: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Item rows for the extraction schema from every BOQ-like table in the document.
+    Tables whose header can't be mapped are skipped. page_info: see extract_tables.
+    """
+    items: List[Dict[str, Any]] = []
+    pending_mapping = None
+    for rows in extract_tables(path_str, page_info):
+        if not rows:
+            continue
+        mapping = map_columns(rows)
+        if mapping is None and pending_mapping and len(rows[0]) == pending_mapping["width"]:
+            # Table continued on the next page without repeating its header
+            mapping = {"header_row": -1, "columns": pending_mapping["columns"]}
+        if mapping is None:
+            continue
+        items.extend(rows_to_items(rows, mapping))
+        pending_mapping = {"columns": mapping["columns"], "width": len(rows[0])}
+    logger.info(f"Table extractor found {len(items)} item rows")
+    return items
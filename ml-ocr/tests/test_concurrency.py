@@ -0,0 +1,131 @@
+import types
+
+import pytest
+
+import concurrency
+from concurrency import AIMD, AdaptiveLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(concurrency, "time", types.SimpleNamespace(monotonic=c.monotonic))
+    return c
+
+
+@pytest.fixture(autouse=True)
+def no_cooldown(monkeypatch):
+    monkeypatch.setitem(AIMD, "decrease_cooldown", 0.0)
+
+
+class Overloaded(Exception):
+    status_code = 429
+
+
+def _call(limiter, latency=0.1, tokens_used=None, outcome="ok"):
+    permit = limiter.acquire()
+    permit.tokens_used = tokens_used
+    limiter.release(permit, outcome, latency)
+
+
+def test_additive_increase_about_one_per_window():
+    limiter = AdaptiveLimiter("t", initial_limit=4, max_limit=8)
+    for _ in range(4):
+        _call(limiter)
+    assert limiter.limit == 4       # 4 + 1/4 + 1/4.25 + ... = 4.94
+    _call(limiter)
+    assert limiter.limit == 5
+
+
+def test_multiplicative_decrease_on_overload_and_floor():
+    limiter = AdaptiveLimiter("t", initial_limit=8, min_limit=2)
+    with pytest.raises(Overloaded):
+        with limiter.slot():
+            raise Overloaded()
+    assert limiter.limit == 4
+    for _ in range(3):
+        _call(limiter, outcome="error")
+    assert limiter.limit == 2
+
+
+def test_cancelled_calls_do_not_move_the_limit():
+    limiter = AdaptiveLimiter("t", initial_limit=4)
+    with pytest.raises(KeyError):
+        with limiter.slot(neutral=(KeyError,)):
+            raise KeyError()
+    assert limiter.limit == 4
+    assert limiter.snapshot()["in_flight"] == 0
+
+
+def test_latency_well_above_best_counts_as_congestion():
+    limiter = AdaptiveLimiter("t", initial_limit=8)
+    for _ in range(5):
+        _call(limiter, latency=0.1)
+    before = limiter.limit
+    _call(limiter, latency=0.1 * AIMD["latency_tolerance"] * 2)
+    assert limiter.limit == before // 2
+
+
+def test_latency_is_compared_per_thousand_tokens():
+    limiter = AdaptiveLimiter("t", initial_limit=8)
+    for _ in range(5):
+        _call(limiter, latency=1.0, tokens_used=1000)
+    before = limiter.limit
+    # 10x slower but for 10x the tokens: not congestion
+    _call(limiter, latency=10.0, tokens_used=10000)
+    assert limiter.limit >= before
+
+
+def test_acquire_waits_for_a_free_slot():
+    limiter = AdaptiveLimiter("t", initial_limit=1, max_limit=1)
+    permit = limiter.acquire()
+    with pytest.raises(TimeoutError):
+        limiter.acquire(timeout=0.05)
+    assert limiter.snapshot()["queued"] == 0
+    limiter.release(permit, "ok", 0.1)
+    limiter.release(limiter.acquire(timeout=0.05), "ok", 0.1)
+
+
+def test_token_bucket_refills_and_bursts_to_one_minute(clock):
+    bucket = TokenBucket(6000)      # 100 tokens/s
+    bucket.take(6000)
+    assert bucket.wait_time(500) == pytest.approx(5.0)
+    clock.now += 2.0
+    assert bucket.wait_time(500) == pytest.approx(3.0)
+    clock.now += 600
+    assert bucket.wait_time(0) == 0.0 and bucket.level == 6000
+    # Bigger than the bucket: goes through once it is full
+    assert bucket.wait_time(10 ** 6) == 0.0
+
+
+def test_unused_reservation_is_refunded(clock):
+    limiter = AdaptiveLimiter("t", tokens_per_minute=6000)
+    with limiter.slot(tokens=2500) as permit:
+        assert limiter.snapshot()["tokens_available"] == 3500
+        permit.tokens_used = 1000
+    assert limiter.snapshot()["tokens_available"] == 5000
+
+
+def test_unknown_usage_keeps_the_reservation(clock):
+    limiter = AdaptiveLimiter("t", tokens_per_minute=6000)
+    with limiter.slot(tokens=2500):
+        pass
+    assert limiter.snapshot()["tokens_available"] == 3500
+
+
+def test_token_budget_holds_requests_back(clock):
+    limiter = AdaptiveLimiter("t", initial_limit=4, tokens_per_minute=6000)
+    limiter.release(limiter.acquire(tokens=6000), "ok", 0.1)
+    # A free slot but no budget: the next caller waits for the refill
+    assert limiter._bucket.wait_time(100) == pytest.approx(1.0)
+    clock.now += 1.0
+    limiter.release(limiter.acquire(tokens=100, timeout=0.05), "ok", 0.1)
+    assert limiter.snapshot()["tokens_available"] == 0
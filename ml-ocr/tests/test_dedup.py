@@ -0,0 +1,175 @@
+import json
+import random
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+import dedup
+from dedup import DedupIndex, same_text
+
+BODY = ("We are pleased to confirm receipt of your quotation for the supply of "
+        "ductile iron pipes and fittings. Delivery is expected within six weeks "
+        "of the purchase order, subject to the terms agreed during the tender. ")
+
+
+def _letter(name, amount):
+    return (f"Dear {name},\n{BODY * 3}\nReference TQ-2291-{amount}\n"
+            f"Total amount: {amount} USD\nKind regards, Procurement")
+
+
+def _text_pdf(path, text):
+    doc = fitz.open()
+    doc.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=11)
+    doc.save(str(path))
+    doc.close()
+
+
+def _scan_pdf(path, text, noise=0):
+    """Image-only PDF of the text, like a scanner would produce."""
+    img = np.full((1100, 850), 255, dtype=np.uint8)
+    cv2.rectangle(img, (40, 40), (810, 140), 0, 4)          # Letterhead
+    for i, line in enumerate(text.split("\n")):
+        for j in range(0, len(line), 70):
+            y = 200 + (i * 3 + j // 70) * 22
+            cv2.putText(img, line[j:j + 70], (50, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 0, 1)
+    if noise:
+        rng = np.random.default_rng(1)
+        img = np.clip(img.astype(int) + rng.integers(-noise, noise, img.shape), 0, 255).astype(np.uint8)
+    ok, jpg = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 70 if noise else 95])
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(page.rect, stream=jpg.tobytes())
+    doc.save(str(path))
+    doc.close()
+
+
+def _result(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(json.dumps({"pages": [text]}), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = DedupIndex(str(tmp_path / "dedup.db"))
+    yield idx
+    idx.close()
+
+
+def _add(index, path, result_path):
+    index.add(str(path), result_path, index.signature(str(path)))
+
+
+def test_exact_copy_matches_on_bytes(tmp_path, index):
+    _text_pdf(tmp_path / "a.pdf", _letter("Ms Otieno", 4200))
+    (tmp_path / "a_id7.pdf").write_bytes((tmp_path / "a.pdf").read_bytes())
+    _add(index, tmp_path / "a.pdf", _result(tmp_path, "a.json", "x"))
+
+    match = index.lookup(str(tmp_path / "a_id7.pdf"))
+    assert match["match"] == "exact"
+    assert match["duplicate_of"] == str(tmp_path / "a.pdf")
+
+
+def test_text_layer_near_duplicate_and_same_template(tmp_path, index):
+    _text_pdf(tmp_path / "a.pdf", _letter("Ms Otieno", 4200))
+    _text_pdf(tmp_path / "re-export.pdf", _letter("Ms Otieno", 4200) + " ")
+    _text_pdf(tmp_path / "other.pdf", _letter("Mr Kamau", 9150))
+    _add(index, tmp_path / "a.pdf", _result(tmp_path, "a.json", "x"))
+
+    assert index.lookup(str(tmp_path / "re-export.pdf"))["match"] == "near"
+    assert index.lookup(str(tmp_path / "other.pdf"))["match"] is None
+
+
+
+def _tender_pdf(path, tender_id, date, qty, value):
+    """~2,000 words of the same tender template; only the numbers vary."""
+    words = ("bidder supply install commission equipment schedule requirements furnish documents "
+             "instructions performance security warranty delivery inspection acceptance payment "
+             "terms conditions contract purchaser consignee period liquidated damages clause "
+             "technical specification compliance certificate manufacturer authorisation").split()
+    doc = fitz.open()
+    for page_num in range(6):
+        rng = random.Random(page_num)
+        text = " ".join(rng.choice(words) for _ in range(330))
+        if page_num in (0, 3):
+            text = (f"Tender No. {tender_id} dated {date}\nQuantity: {qty} units\n"
+                    f"Estimated value: Rs {value}\n" + text)
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 570, 820), text, fontsize=9)
+    doc.save(str(path))
+    doc.close()
+
+
+def test_same_template_tenders_differing_in_numbers_are_not_near(tmp_path, index):
+    _tender_pdf(tmp_path / "a.pdf", "GEM/2024/B/4417", "12-03-2024", 40, "18,40,000")
+    _tender_pdf(tmp_path / "b.pdf", "GEM/2024/B/5120", "02-05-2024", 65, "29,90,000")
+    _tender_pdf(tmp_path / "a_again.pdf", "GEM/2024/B/4417", "12-03-2024", 40, "18,40,000")
+    _add(index, tmp_path / "a.pdf", _result(tmp_path, "a.json", "x"))
+
+    a, b = index.signature(str(tmp_path / "a.pdf")), index.signature(str(tmp_path / "b.pdf"))
+    # Text and thumbnails alone would call these the same document
+    assert dedup.text_similarity(a["minhash"], b["minhash"]) >= dedup.DEDUP["min_text_similarity"]
+    assert dedup.same_pages(a["page_hashes"], b["page_hashes"])
+    assert index.lookup(str(tmp_path / "b.pdf"))["match"] is None
+    assert index.lookup(str(tmp_path / "a_again.pdf"))["match"] in ("exact", "near")
+
+
+def test_text_match_also_needs_matching_thumbnails(tmp_path, index):
+    text = _letter("Ms Otieno", 4200)
+    _text_pdf(tmp_path / "a.pdf", text)
+    doc = fitz.open()
+    doc.new_page().insert_textbox(fitz.Rect(50, 400, 550, 800), text, fontsize=11)
+    doc.save(str(tmp_path / "moved.pdf"))
+    doc.close()
+    _add(index, tmp_path / "a.pdf", _result(tmp_path, "a.json", "x"))
+
+    assert index.lookup(str(tmp_path / "moved.pdf"))["match"] is None
+
+
+@pytest.fixture
+def scans(tmp_path, index):
+    original = _letter("Ms Otieno", 4200)
+    _scan_pdf(tmp_path / "a.pdf", original)
+    _scan_pdf(tmp_path / "rescan.pdf", original, noise=8)
+    _scan_pdf(tmp_path / "other.pdf", _letter("Mr Kamau", 9150))
+    _add(index, tmp_path / "a.pdf", _result(tmp_path, "a.json", original))
+    # The thumbnails alone can't tell any of these apart
+    sig = index.signature(str(tmp_path / "a.pdf"))
+    for name in ("rescan.pdf", "other.pdf"):
+        other = index.signature(str(tmp_path / name))
+        assert other["minhash"] is None
+        assert dedup.is_near_duplicate(sig, other)
+    return tmp_path
+
+
+def test_scan_rescan_is_reused_after_ocr_check(scans, index, monkeypatch):
+    ocr_calls = []
+    monkeypatch.setattr(dedup, "ocr_image", lambda img, engine=None: ocr_calls.append(img.shape)
+                        or _letter("Ms Otleno", 4200))
+
+    match = index.lookup(str(scans / "rescan.pdf"))
+    assert match["match"] == "near"
+    assert match["duplicate_of"] == str(scans / "a.pdf")
+    assert len(ocr_calls) == 1      # One page, not the document
+
+
+def test_same_template_scan_is_not_reused(scans, index, monkeypatch):
+    monkeypatch.setattr(dedup, "ocr_image", lambda img, engine=None: _letter("Mr Kamau", 9150))
+
+    assert index.lookup(str(scans / "other.pdf"))["match"] is None
+
+
+def test_scan_match_without_check_is_only_reported(scans, index, monkeypatch):
+    monkeypatch.setattr(dedup, "ocr_image", lambda img, engine=None: pytest.fail("OCR'd"))
+
+    match = index.lookup(str(scans / "other.pdf"), verify=False)
+    assert match["match"] == "near_unverified"
+
+
+def test_same_text_needs_identical_numbers():
+    a = _letter("Ms Otieno", 4200)
+    assert same_text(a, a.replace("Otieno", "Otleno"))
+    assert not same_text(a, a.replace("4200", "4800"))
+    assert not same_text(a, _letter("Mr Kamau", 4200))
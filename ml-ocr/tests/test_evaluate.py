@@ -0,0 +1,78 @@
+import pytest
+
+import llm_backends
+from evaluate import applied, edit_distance, field_matches, llm_backend, pareto_front
+
+
+def _levenshtein(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        cur = [i]
+        for j, cb in enumerate(b, start=1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+@pytest.mark.parametrize("a, b", [
+    ("", ""), ("", "abc"), ("abc", ""), ("kitten", "sitting"), ("flaw", "lawn"),
+    ("GEM/2024/B/123", "GEM/2O24/8/123"), ("abcdef", "fedcba"), ("aaaa", "aa"),
+])
+def test_edit_distance_matches_the_textbook_recurrence(a, b):
+    assert edit_distance(a, b) == _levenshtein(a, b)
+
+
+def test_edit_distance_on_words():
+    assert edit_distance("supply of centrifuge".split(), "supply of a centrifuge".split()) == 1
+
+
+@pytest.mark.parametrize("expected, actual, ok", [
+    ("AIIMS Delhi", "aiims, delhi", True),
+    ("AIIMS Delhi", "AIIMS Delhl", True),           # One OCR slip stays above the ratio
+    ("AIIMS Delhi", "PGIMER Chandigarh", False),
+    (125000, "1,25,000", True),
+    (125000, "125000.50", True),                     # Within the relative tolerance
+    (125000, "130000", False),
+    (125000, "about 1.25 lakh", False),
+    (None, None, True),
+    (None, "", True),
+    ("GEM/2024/B/123", None, False),
+    (True, "true", True),                            # Booleans compare as text, not numbers
+])
+def test_field_matches(expected, actual, ok):
+    assert field_matches(expected, actual) is ok
+
+
+def _summary(cer, field_accuracy, latency_mean, cost_per_doc):
+    return {"cer": cer, "field_accuracy": field_accuracy,
+            "latency_mean": latency_mean, "cost_per_doc": cost_per_doc}
+
+
+def test_pareto_front():
+    summaries = [
+        _summary(0.05, 0.90, 2.0, 0.001),   # Most accurate
+        _summary(0.08, 0.80, 1.0, 0.0),     # Fastest and free
+        _summary(0.09, 0.80, 1.5, 0.0),     # Dominated by 1
+        _summary(0.05, 0.90, 2.0, 0.001),   # Tie with 0: neither dominates
+        _summary(0.20, None, 0.5, 0.0),     # Fastest; no field labels, so compared on the rest
+    ]
+    assert pareto_front(summaries) == [0, 1, 3, 4]
+    assert pareto_front([]) == []
+
+
+def test_llm_model_selects_one_backend():
+    assert llm_backend("openai:gpt-4o-mini") == ("openai", "gpt-4o-mini")
+    assert llm_backend("local:llama3.1:8b") == ("local", "llama3.1:8b")
+    for bad in ("gpt-4o-mini", "local:", "azure:gpt-4o"):
+        with pytest.raises(ValueError):
+            llm_backend(bad)
+
+    saved = dict(llm_backends.ROUTER_CONFIG)
+    with applied({"llm_model": "local:qwen2.5"}) as use_llm:
+        cfg = llm_backends.ROUTER_CONFIG
+        assert use_llm
+        assert (cfg["mode"], cfg["order"], cfg["local_model"]) == ("single", ["local"], "qwen2.5")
+        assert cfg["openai_model"] == saved["openai_model"]
+    assert llm_backends.ROUTER_CONFIG == saved
+    with applied({"llm_model": None}) as use_llm:
+        assert not use_llm
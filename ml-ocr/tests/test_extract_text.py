@@ -0,0 +1,54 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from extract_text import usable_text_layer
+
+BODY = ("Supply and installation of laboratory equipment as per the attached "
+        "schedule of requirements, delivered to the central stores. ") * 12
+
+
+def _page(scan=False, overlay=None, hidden_text=None):
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    if scan:
+        img = np.full((1100, 850, 3), 255, dtype=np.uint8)
+        cv2.putText(img, "scanned body text", (80, 300), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        page.insert_image(page.rect, stream=cv2.imencode(".png", img)[1].tobytes())
+    else:
+        page.insert_textbox(fitz.Rect(50, 50, 560, 740), BODY, fontsize=11)
+    if overlay:
+        page.insert_text((300, 780), overlay, fontsize=8)
+    if hidden_text:
+        # An OCR'd ("searchable") scan: invisible text over the body
+        page.insert_textbox(fitz.Rect(50, 50, 560, 740), hidden_text, fontsize=11, render_mode=3)
+    return doc, page
+
+
+def test_born_digital_page_uses_text_layer():
+    doc, page = _page()
+    assert usable_text_layer(page) == page.get_text().strip()
+    doc.close()
+
+
+def test_scan_with_stamp_overlay_is_ocrd():
+    doc, page = _page(scan=True, overlay="ACME-000123 | Scanned 2024-03-01 by Records Office")
+    assert len(page.get_text().strip()) >= 50
+    assert usable_text_layer(page) is None
+    doc.close()
+
+
+def test_searchable_scan_uses_text_layer():
+    doc, page = _page(scan=True, hidden_text=BODY)
+    assert usable_text_layer(page)
+    doc.close()
+
+
+def test_short_text_layer_is_ocrd():
+    doc, page = _page(scan=False)
+    page = doc.new_page()
+    page.insert_text((50, 50), "Page 2")
+    assert usable_text_layer(page) is None
+    doc.close()
@@ -0,0 +1,171 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("requests")
+
+import llm_backends
+import llm_stub_server
+from concurrency import get_limiter
+from llm_backends import AllBackendsFailed, BackendRouter, LocalBackend, OpenAIBackend, clean_ocr_text
+from llm_postprocess import extract_structured_fields
+from llm_stub_server import StubHandler
+from self_hosted_llm import extract_structured_fields_local
+
+FAST = {"max_retries": 0, "retry_backoff": 0.0, "breaker_failures": 1, "breaker_reset": 60.0}
+
+
+class CountingHandler(StubHandler):
+    def do_POST(self):
+        self.server.requests += 1
+        super().do_POST()
+
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # Hedge losers hang up mid-stream; that is the point, not an error
+
+
+def _stub(delay=0.0, token_delay=0.0, fail_rate=0.0, fail_status=500):
+    server = QuietServer(("127.0.0.1", 0), CountingHandler)
+    server.daemon_threads = True
+    server.delay, server.jitter, server.token_delay = delay, 0.0, token_delay
+    server.fail_rate, server.fail_status, server.verbose = fail_rate, fail_status, False
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def make(**kwargs):
+        servers.append(_stub(**kwargs))
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _openai(server):
+    return OpenAIBackend("gpt-4o-mini", base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                         timeout=10, api_key="stub")
+
+
+def _local(server):
+    return LocalBackend("llama3.1:8b", base_url=f"http://127.0.0.1:{server.server_port}", timeout=10)
+
+
+def _ask(router):
+    return router.complete_json("Return JSON.", "OCR text:\nrefrigerated centrifuge", max_tokens=200)
+
+
+def test_fallback_uses_next_backend_and_opens_breaker(stubs):
+    down, up = stubs(fail_rate=1.0), stubs()
+    router = BackendRouter([_openai(down), _local(up)], mode="fallback", config=FAST)
+
+    assert _ask(router)["cleaned_text"] == "refrigerated centrifuge"
+    assert router.breakers["openai"].state == "open"
+    assert router.breakers["local"].state == "closed"
+
+    # An open breaker skips the backend without calling it
+    _ask(router)
+    assert (down.requests, up.requests) == (1, 2)
+
+
+def test_breaker_half_open_trial_closes_it(stubs):
+    server = stubs()
+    router = BackendRouter([_local(server)], mode="single", config={**FAST, "breaker_reset": 0.05})
+    router.breakers["local"].record_failure()
+    assert router.breakers["local"].state == "open"
+    with pytest.raises(AllBackendsFailed):
+        _ask(router)
+    assert server.requests == 0
+
+    time.sleep(0.06)
+    assert router.breakers["local"].state == "half_open"
+    _ask(router)
+    assert router.breakers["local"].state == "closed"
+
+
+def test_single_mode_does_not_fall_back(stubs):
+    down, up = stubs(fail_rate=1.0), stubs()
+    router = BackendRouter([_local(down), _openai(up)], mode="single", config=FAST)
+    with pytest.raises(AllBackendsFailed):
+        _ask(router)
+    assert up.requests == 0
+
+
+def test_all_backends_failing_raises_with_every_error(stubs):
+    router = BackendRouter([_openai(stubs(fail_rate=1.0)), _local(stubs(fail_rate=1.0))],
+                           mode="fallback", config=FAST)
+    with pytest.raises(AllBackendsFailed) as info:
+        _ask(router)
+    assert len(info.value.errors) == 2
+
+
+def test_hedge_wins_and_losing_stream_is_closed(stubs):
+    # The primary streams ~10 chunks 0.5s apart; the hedge answers at once
+    slow, fast = stubs(token_delay=0.5), stubs()
+    router = BackendRouter([_openai(slow), _local(fast)], mode="hedged",
+                           config={**FAST, "hedge_default_delay": 0.2})
+
+    started = time.monotonic()
+    assert _ask(router)["cleaned_text"] == "refrigerated centrifuge"
+    assert time.monotonic() - started < 1.5
+    assert fast.requests == 1
+
+    # Cancelled by closing its response, not after the rest of the stream
+    deadline = time.monotonic() + 1.0
+    while get_limiter("openai").snapshot()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert get_limiter("openai").snapshot()["in_flight"] == 0
+    assert router.breakers["openai"].state == "closed"     # Cancelling isn't a failure
+
+
+def test_hedge_not_started_when_primary_is_fast(stubs):
+    primary, backup = stubs(), stubs()
+    router = BackendRouter([_local(primary), _openai(backup)], mode="hedged",
+                           config={**FAST, "hedge_default_delay": 2.0})
+    _ask(router)
+    assert (primary.requests, backup.requests) == (1, 0)
+
+
+@pytest.fixture
+def non_json(stubs, monkeypatch):
+    """A stub whose replies are prose, wired up as both single-backend routes."""
+    server = stubs()
+    monkeypatch.setattr(llm_stub_server, "_answer", lambda user: "Sure! Here is the cleaned text.")
+    monkeypatch.setattr(llm_backends, "_single_routers", {})
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setitem(llm_backends.ROUTER_CONFIG, "openai_base_url",
+                        f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(llm_backends.ROUTER_CONFIG, "local_base_url",
+                        f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setitem(llm_backends.ROUTER_CONFIG, "max_retries", 1)
+    monkeypatch.setitem(llm_backends.ROUTER_CONFIG, "retry_backoff", 0.0)
+    return server
+
+
+def test_invalid_json_is_retried_then_clean_keeps_the_chunk(non_json):
+    router = BackendRouter([_local(non_json)], mode="single",
+                           config={**FAST, "max_retries": 1, "breaker_failures": 10})
+    text = "Tender No. GEM/2024/B/123\nrefrigerated centrifuge, qty 2"
+
+    result = clean_ocr_text(text, router=router)
+
+    assert result["cleaned_text"] == text
+    assert non_json.requests == 2  # The malformed reply was retried before giving up
+
+
+def test_legacy_extract_returns_placeholder_on_invalid_json(non_json):
+    text = "Tender No. GEM/2024/B/123\nrefrigerated centrifuge, qty 2"
+
+    assert extract_structured_fields_local(text) == {"document_type": "unknown", "confidence": 0.0}
+    assert extract_structured_fields(text) == {"cleaned_text": "Sure! Here is the cleaned text."}
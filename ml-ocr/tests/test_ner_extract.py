@@ -0,0 +1,21 @@
+from ner_extract import merge_into_fields
+
+ENTITIES = {
+    "buyer": {"value": "Ministry of Defence", "confidence": 0.9},
+    "contact": {"value": "+91 11 2301 1234", "confidence": 0.95},
+    "address": {"value": "Sena Bhawan, New Delhi", "confidence": 0.5},
+}
+
+
+def test_fills_only_empty_fields_by_default():
+    fields = {"buyer": "Defence Ministry", "contact": "", "address": None}
+    merge_into_fields(fields, ENTITIES)
+    assert fields == {"buyer": "Defence Ministry", "contact": "+91 11 2301 1234", "address": None}
+
+
+def test_skipped_fields_take_the_ner_value():
+    fields = {"buyer": "Some Vendor Pvt Ltd", "contact": "support@vendor.example", "address": "Mumbai"}
+    merge_into_fields(fields, ENTITIES, override={"buyer", "contact"})
+    assert fields["buyer"] == "Ministry of Defence"
+    assert fields["contact"] == "+91 11 2301 1234"
+    assert fields["address"] == "Mumbai"    # Not confident enough to override or fill
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from page_store import PageOCRPool, PageRing
+
+
+@pytest.fixture
+def ring():
+    ring = PageRing(slots=2, slot_bytes=100 * 100)
+    yield ring
+    ring.close()
+
+
+def _free(ring):
+    return ring._free.qsize()
+
+
+def test_put_releases_the_slot_when_the_copy_fails(ring):
+    with pytest.raises(TypeError):
+        ring.put(np.full((10, 10), None, dtype=object))  # Fails in the copy into the slot
+    assert _free(ring) == 2
+
+
+def test_ocr_pages_releases_the_slot_when_the_engine_choice_fails():
+    pool = PageOCRPool(processes=1, slots=2)
+    try:
+        ref = pool.ring.put(np.zeros((10, 10), dtype=np.uint8))
+
+        def pick(i, img):
+            raise RuntimeError("no engine")
+
+        with pytest.raises(RuntimeError):
+            pool.ocr_pages(iter([(0, ref)]), [{}], engine=pick)
+        assert _free(pool.ring) == 2
+    finally:
+        pool.close()
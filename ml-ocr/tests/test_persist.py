@@ -0,0 +1,92 @@
+import threading
+
+import bulk
+from persist import ResultWriter
+
+
+class FakeConn:
+    """Accepts COPY batches unless they contain a path listed in bad."""
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.committed = []
+        self._staged = []
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def copy_expert(self, sql, buf):
+                rows = buf.getvalue().splitlines()
+                if any(f'"{path}"' in row for row in rows for path in conn.bad):
+                    raise ValueError("value too long")
+                conn._staged.extend(rows)
+
+            def execute(self, sql):
+                pass
+
+        return Cursor()
+
+    def commit(self):
+        self.committed.extend(self._staged)
+        self._staged = []
+
+    def rollback(self):
+        self._staged = []
+
+    def close(self):
+        pass
+
+
+def make_writer(conn, batch_size):
+    writer = ResultWriter.__new__(ResultWriter)
+    writer.root, writer.batch_size, writer.conn, writer.written = None, batch_size, conn, 0
+    writer._rows, writer._callbacks, writer._lock = [], [], threading.Lock()
+    return writer
+
+
+def test_callbacks_run_only_after_commit():
+    conn = FakeConn()
+    writer = make_writer(conn, batch_size=3)
+    acks = []
+    for name in ("a.pdf", "b.pdf"):
+        writer.add({"path": name}, on_commit=lambda err, n=name: acks.append((n, err)))
+    assert acks == [] and conn.committed == []
+    writer.add({"path": "c.pdf"}, on_commit=lambda err: acks.append(("c.pdf", err)))
+    assert acks == [("a.pdf", None), ("b.pdf", None), ("c.pdf", None)]
+    assert len(conn.committed) == 3
+
+
+def test_failed_batch_blames_only_the_bad_row():
+    conn = FakeConn(bad={"b.pdf"})
+    writer = make_writer(conn, batch_size=10)
+    acks = {}
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        writer.add({"path": name}, on_commit=lambda err, n=name: acks.__setitem__(n, err))
+    writer.flush()
+    assert acks["a.pdf"] is None and acks["c.pdf"] is None
+    assert "value too long" in acks["b.pdf"]
+    assert len(conn.committed) == 2
+
+
+def test_bulk_records_documents_after_their_batch_commits(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, "run_pipeline", lambda path, **kw: {"path": path, "timings": {"ocr": 0.1}})
+    conn = FakeConn(bad={"bad.pdf"})
+    writer = make_writer(conn, batch_size=2)
+    recorded = []
+    docs = [{"path": str(tmp_path / n), "root": str(tmp_path), "size": 1, "mtime": 1.0}
+            for n in ("a.pdf", "bad.pdf", "c.pdf")]
+    for doc in docs:
+        bulk._process(doc, str(tmp_path / "out"), False, writer=writer, done=recorded.append)
+    # a and bad went out in one batch; c still sits in the buffer
+    assert [r["path"].rsplit("/", 1)[1] for r in recorded] == ["a.pdf", "bad.pdf"]
+    assert recorded[0]["status"] == "done"
+    assert recorded[1]["status"] == "failed" and "value too long" in recorded[1]["error"]
+    writer.flush()
+    assert recorded[2]["path"].endswith("c.pdf") and recorded[2]["status"] == "done"
@@ -0,0 +1,44 @@
+import json
+import os
+
+from search_index import SearchIndex, index_results_dir
+
+
+def _write_result(results, source, text):
+    out = results / (os.path.basename(source) + ".json")
+    out.write_text(json.dumps({"path": str(source), "pages": [text]}), encoding="utf-8")
+    return out
+
+
+def test_build_is_incremental_on_the_source_document(tmp_path):
+    source = tmp_path / "tender.pdf"
+    source.write_bytes(b"%PDF v1")
+    results = tmp_path / "results"
+    results.mkdir()
+    result_file = _write_result(results, source, "refrigerated centrifuge")
+    index = SearchIndex(str(tmp_path / "index.db"))
+
+    assert index_results_dir(index, str(results)) == {"added": 1, "skipped": 0, "failed": 0}
+    # The result JSON being rewritten doesn't matter, only its source
+    os.utime(result_file, (1, 1))
+    assert index_results_dir(index, str(results)) == {"added": 0, "skipped": 1, "failed": 0}
+
+    source.write_bytes(b"%PDF v2, rescanned")
+    _write_result(results, source, "micropipette")
+    assert index_results_dir(index, str(results))["added"] == 1
+    assert [h["path"] for h in index.search("micropipette")] == [str(source)]
+    index.close()
+
+
+def test_build_skips_documents_indexed_by_bulk(tmp_path):
+    source = tmp_path / "tender.pdf"
+    source.write_bytes(b"%PDF")
+    results = tmp_path / "results"
+    results.mkdir()
+    _write_result(results, source, "ductile iron pipes")
+    index = SearchIndex(str(tmp_path / "index.db"))
+    st = os.stat(source)
+    index.add({"path": str(source), "pages": ["ductile iron pipes"]}, size=st.st_size, mtime=st.st_mtime)
+
+    assert index_results_dir(index, str(results))["skipped"] == 1
+    index.close()
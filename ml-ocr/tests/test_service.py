@@ -0,0 +1,44 @@
+import queue
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+
+import service
+from service import SERVICE, JobQueue
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(SERVICE, "upload_dir", str(tmp_path))
+    # Not started: jobs stay queued
+    monkeypatch.setattr(service, "jobs", JobQueue(workers=1, max_queue=1, use_llm=False))
+    return TestClient(service.app)
+
+
+def test_upload_is_saved_and_queued(client, tmp_path):
+    resp = client.post("/jobs", files={"file": ("scan.pdf", b"%PDF-1.4 test", "application/pdf")})
+    assert resp.status_code == 202
+    job = service.jobs.get(resp.json()["job_id"])
+    assert job.status == "queued"
+    assert open(job.path, "rb").read() == b"%PDF-1.4 test"
+
+
+def test_full_queue_refused_from_headers(client, monkeypatch):
+    service.jobs.pending.put_nowait(None)
+    monkeypatch.setattr(service, "_save_upload", lambda *a: pytest.fail("body was read"))
+    resp = client.post("/jobs", files={"file": ("scan.pdf", b"x" * 1000, "application/pdf")})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == str(SERVICE["retry_after"])
+
+
+def test_oversized_upload_refused_from_headers(client, monkeypatch):
+    monkeypatch.setitem(SERVICE, "max_upload_mb", 0)
+    monkeypatch.setattr(service, "_save_upload", lambda *a: pytest.fail("body was read"))
+    resp = client.post("/jobs", files={"file": ("scan.pdf", b"x" * 1000, "application/pdf")})
+    assert resp.status_code == 413
+    with pytest.raises(queue.Empty):
+        service.jobs.pending.get_nowait()
+
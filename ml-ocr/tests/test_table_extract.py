@@ -0,0 +1,43 @@
+from table_extract import TABLES, _grid_ocr, map_columns, rows_to_items
+
+
+def test_serial_column_is_not_the_description():
+    rows = [["Item No.", "Description of Item", "Qty", "Unit"],
+            ["1", "Refrigerated centrifuge", "5", "Nos"],
+            ["2", "Micropipette 10-100 ul", "12", "Pcs"]]
+    mapping = map_columns(rows)
+    assert mapping == {"header_row": 0, "columns": {"description": 1, "quantity": 2, "unit": 3}}
+    assert rows_to_items(rows, mapping) == [
+        {"description": "Refrigerated centrifuge", "quantity": 5, "unit": "Nos", "specs": None},
+        {"description": "Micropipette 10-100 ul", "quantity": 12, "unit": "Pcs", "specs": None},
+    ]
+
+
+def test_best_column_wins_regardless_of_order():
+    mapping = map_columns([["Item Code", "Item Description", "Quantity", "UOM", "Make / Model"]])
+    assert mapping["columns"] == {"description": 1, "quantity": 2, "unit": 3, "specs": 4}
+
+
+def test_other_serial_headers():
+    for serial in ("Sl. No.", "Sr. No", "S.No", "#"):
+        mapping = map_columns([[serial, "Item", "Qty"]])
+        assert mapping["columns"]["description"] == 1, serial
+
+
+def test_header_found_below_title_rows():
+    rows = [["Schedule of requirements", "", ""], ["Particulars", "Quantity", "Unit"], ["Chair", "4", "Nos"]]
+    assert map_columns(rows)["header_row"] == 1
+
+
+def test_no_header_no_mapping():
+    assert map_columns([["Name", "Designation"], ["A", "B"]]) is None
+
+
+def test_grid_ocr_only_for_table_pages(monkeypatch):
+    assert _grid_ocr(None)
+    assert _grid_ocr({"source": "ocr", "page_class": "table"})
+    assert not _grid_ocr({"source": "ocr", "page_class": "text"})
+    monkeypatch.setitem(TABLES, "scan_unclassified", False)
+    assert not _grid_ocr({"source": "ocr"})
+    monkeypatch.setitem(TABLES, "scan_unclassified", True)
+    assert _grid_ocr({"source": "ocr"})
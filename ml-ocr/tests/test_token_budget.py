@@ -0,0 +1,87 @@
+import pytest
+
+from llm_backends import _chunk_limit, clean_ocr_text, extract_structured_fields
+from llm_prompts import (CLEAN_SYSTEM_PROMPT, build_clean_user, build_extract_user,
+                         extract_system_prompt)
+from token_budget import PromptBudgetError, estimate_tokens, split_to_budget
+
+
+class RecordingRouter:
+    """Stands in for BackendRouter: a fixed prompt budget, and every request kept."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.requests = []
+
+    def min_prompt_budget(self, max_tokens):
+        return self.budget
+
+    def complete_json(self, system, user, stage="chat", temperature=0.0, max_tokens=2000):
+        self.requests.append((system, user))
+        if stage == "clean":
+            return {"cleaned_text": user.split("OCR text:\n", 1)[1], "notes": []}
+        return {"tender_id": "GEM/2024/B/123", "items": [], "confidence": 0.8}
+
+
+def _document(paragraphs=40):
+    return "\n\n".join(f"Clause {i}: the bidder shall supply item {i} as per the specification "
+                       f"and deliver it within {i + 10} days of the purchase order."
+                       for i in range(paragraphs))
+
+
+def test_split_to_budget_keeps_paragraphs_within_the_limit():
+    text = _document()
+    chunks = split_to_budget(text, 100)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 100 for c in chunks)
+    assert "\n\n".join(chunks) == text
+    assert split_to_budget("short", 100) == ["short"]
+    with pytest.raises(PromptBudgetError):
+        split_to_budget(text, 0)
+
+
+def test_chunk_limit_counts_the_stages_own_user_prompt():
+    router = RecordingRouter(budget=1000)
+    system = extract_system_prompt()
+    assert (_chunk_limit(router, system, build_extract_user, 2000)
+            == 1000 - estimate_tokens(system) - estimate_tokens(build_extract_user("")) - 8)
+    assert (_chunk_limit(router, CLEAN_SYSTEM_PROMPT, build_clean_user, 2000)
+            == 1000 - estimate_tokens(CLEAN_SYSTEM_PROMPT) - estimate_tokens(build_clean_user("")) - 8)
+
+
+def test_extract_refuses_or_splits_an_oversized_document():
+    system = extract_system_prompt()
+    router = RecordingRouter(budget=estimate_tokens(system) + 150)
+    text = _document()
+
+    with pytest.raises(PromptBudgetError):
+        extract_structured_fields(text, on_overflow="refuse", use_retrieval=False, router=router)
+    assert router.requests == []
+
+    result = extract_structured_fields(text, on_overflow="split", use_retrieval=False, router=router)
+    assert len(router.requests) > 1
+    for sent_system, user in router.requests:
+        assert estimate_tokens(sent_system) + estimate_tokens(user) + 8 <= router.budget
+    assert result["tender_id"] == "GEM/2024/B/123"
+
+    small = RecordingRouter(budget=router.budget)
+    extract_structured_fields("Tender No. GEM/2024/B/123", on_overflow="refuse",
+                              use_retrieval=False, router=small)
+    assert len(small.requests) == 1
+
+
+def test_static_prefix_is_byte_identical_across_calls():
+    router = RecordingRouter(budget=estimate_tokens(extract_system_prompt()) + 150)
+    clean_ocr_text(_document(), router=router)
+    clean_ocr_text("Tender No. GEM/2024/B/123", router=router)
+    extract_structured_fields("Tender No. GEM/2024/B/123", use_retrieval=False, router=router)
+    extract_structured_fields(_document(3), use_retrieval=False, router=router)
+
+    cleans = [r for r in router.requests if r[0] == CLEAN_SYSTEM_PROMPT]
+    extracts = [r for r in router.requests if r[0] != CLEAN_SYSTEM_PROMPT]
+    assert len(cleans) > 2 and len(extracts) == 2
+    for requests, build_user in ((cleans, build_clean_user), (extracts, build_extract_user)):
+        prefix = build_user("")
+        assert len({system.encode() for system, _ in requests}) == 1
+        assert all(user.startswith(prefix) for _, user in requests)
+    assert extracts[0][0].encode() == extract_system_prompt().encode()
@@ -0,0 +1,157 @@
+import time
+
+import pytest
+
+import bulk
+import watch
+from watch import EventQueue, Watcher
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = EventQueue(str(tmp_path / "watch.db"))
+    yield q
+    q.close()
+
+
+def status(q, path):
+    return q.conn.execute("SELECT status, generation, attempts FROM events WHERE path = ?",
+                          (path,)).fetchone()
+
+
+def test_event_is_due_only_after_settling(queue):
+    queue.touch("/up/a.pdf", "/up", delay=0.2)
+    assert queue.due(10) == []
+    time.sleep(0.25)
+    assert [e["path"] for e in queue.due(10)] == ["/up/a.pdf"]
+
+
+def test_new_event_during_a_run_keeps_the_file_pending(queue):
+    queue.touch("/up/a.pdf", "/up", delay=0)
+    entry = queue.due(10)[0]
+    assert queue.claim(entry)
+    queue.touch("/up/a.pdf", "/up", delay=0)      # Overwritten while being processed
+    queue.finish(entry, ok=True)                    # The stale run ends
+    assert status(queue, "/up/a.pdf") == ("pending", 2, 0)
+    newer = queue.due(10)[0]
+    assert newer["generation"] == 2
+    assert not queue.claim(entry)                   # The old generation can't be claimed again
+    assert queue.claim(newer)
+    queue.finish(newer, ok=True)
+    assert status(queue, "/up/a.pdf") == ("done", 2, 0)
+
+
+def test_failures_retry_then_give_up(queue):
+    queue.touch("/up/a.pdf", "/up", delay=0)
+    for attempt in range(1, 4):
+        entry = queue.due(10)[0]
+        assert queue.claim(entry)
+        queue.finish(entry, ok=False, error="boom", max_attempts=3, retry_delay=0)
+        expected = "pending" if attempt < 3 else "failed"
+        assert status(queue, "/up/a.pdf") == (expected, 1, attempt)
+    assert queue.due(10) == []
+
+
+def test_retry_waits_for_the_delay(queue):
+    queue.touch("/up/a.pdf", "/up", delay=0)
+    entry = queue.due(10)[0]
+    queue.claim(entry)
+    queue.finish(entry, ok=False, error="boom", max_attempts=3, retry_delay=60)
+    assert queue.due(10) == []
+
+
+def test_recover_requeues_in_flight_entries(queue):
+    queue.touch("/up/a.pdf", "/up", delay=0)
+    queue.claim(queue.due(10)[0])
+    assert queue.recover() == 1
+    assert status(queue, "/up/a.pdf")[0] == "pending"
+
+
+def test_remove_leaves_running_entries(queue):
+    queue.touch("/up/a.pdf", "/up", delay=0)
+    queue.touch("/up/b.pdf", "/up", delay=0)
+    queue.claim(queue.due(10)[0])
+    queue.remove("/up/a.pdf")
+    queue.remove("/up/b.pdf")
+    assert status(queue, "/up/a.pdf")[0] == "running"
+    assert status(queue, "/up/b.pdf") is None
+
+
+class FakeStore:
+    """Batched sink: acks only on flush; fails the flush when asked to."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.callbacks = []
+
+    def add(self, result, error=None, on_commit=None):
+        self.callbacks.append(on_commit)
+
+    def flush(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback("result store: disk full" if self.fail else None)
+
+    def close(self):
+        self.flush()
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_event_done_only_after_the_store_flush(tmp_path, monkeypatch, fail):
+    monkeypatch.setattr(bulk, "run_pipeline", lambda path, **kw: {"path": path, "timings": {}})
+    monkeypatch.setitem(watch.WATCH_CONFIG, "retry_delay", 0)
+    monkeypatch.setitem(watch.WATCH_CONFIG, "flush_documents", 1)
+    up = tmp_path / "up"
+    up.mkdir()
+    (up / "a.pdf").write_bytes(b"%PDF")
+    watcher = Watcher([str(up)], str(tmp_path / "out"), workers=1, use_llm=False)
+    watcher.store = FakeStore(fail=fail)
+    path = str(up / "a.pdf")
+    watcher.queue.touch(path, str(up), delay=0)
+    entry = watcher.queue.due(10)[0]
+    watcher.queue.claim(entry)
+
+    seen = []
+    real_flush = watcher.store.flush
+
+    def flush():
+        seen.append(status(watcher.queue, path)[0])     # Still running before the flush commits
+        real_flush()
+
+    watcher.store.flush = flush
+    watcher._work(entry)
+    assert seen == ["running"]
+    assert status(watcher.queue, path)[0] == ("pending" if fail else "done")
+    assert watcher.manifest.is_done({"path": path, "size": 4,
+                                     "mtime": (up / "a.pdf").stat().st_mtime}) is not fail
+    watcher.close()
+
+
+def test_documents_share_a_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, "run_pipeline", lambda path, **kw: {"path": path, "timings": {}})
+    monkeypatch.setitem(watch.WATCH_CONFIG, "flush_documents", 3)
+    monkeypatch.setitem(watch.WATCH_CONFIG, "flush_seconds", 3600.0)
+    up = tmp_path / "up"
+    up.mkdir()
+    watcher = Watcher([str(up)], str(tmp_path / "out"), workers=1, use_llm=False)
+    watcher.store = FakeStore()
+    flushes = []
+    real_flush = watcher.store.flush
+    watcher.store.flush = lambda: (flushes.append(len(watcher.store.callbacks)), real_flush())
+
+    paths = []
+    for name in ("a.pdf", "b.pdf", "c.pdf", "d.pdf"):
+        (up / name).write_bytes(b"%PDF")
+        paths.append(str(up / name))
+        watcher.queue.touch(paths[-1], str(up), delay=0)
+    for entry in watcher.queue.due(10):
+        watcher.queue.claim(entry)
+        watcher._work(entry)
+
+    assert flushes == [3]   # One flush for the first three documents
+    assert [status(watcher.queue, p)[0] for p in paths] == ["done", "done", "done", "running"]
+    assert not watcher._flush_due()
+    monkeypatch.setitem(watch.WATCH_CONFIG, "flush_seconds", 0.0)
+    assert watcher._flush_due()
+    watcher.close()         # Flushes the rest before closing the manifest
+    assert [n for n in flushes if n] == [3, 1]
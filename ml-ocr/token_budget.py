@@ -0,0 +1,207 @@
+"""
+Token estimation, prompt budgeting and per-call usage accounting for LLM stages.
+"""
+import logging
+import math
+import re
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here (no signature changes needed)
+BUDGET = {
+    "default_context_tokens": 8192,
+    "reserve_completion_tokens": 2000,  # Kept free for the model's answer
+    "safety_margin": 0.9,               # Estimates are approximate; stay below the limit
+}
+
+CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "llama3.1:8b": 8192,
+    "mistral": 8192,
+    "qwen2.5": 32768,
+}
+
+
+class PromptBudgetError(ValueError):
+    """Raised when a prompt cannot fit into the model's token budget."""
+
+
+@dataclass
+class TokenUsage:
+    stage: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    estimated_prompt_tokens: int = 0
+
+
+class UsageLedger:
+    """Thread-safe running totals of token usage, per stage and overall."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[TokenUsage] = []
+
+    def record(self, usage: TokenUsage) -> None:
+        with self._lock:
+            self.calls.append(usage)
+        logger.info(
+            f"[{usage.stage}] {usage.model}: prompt={usage.prompt_tokens} "
+            f"(cached={usage.cached_tokens}, est={usage.estimated_prompt_tokens}) "
+            f"completion={usage.completion_tokens}"
+        )
+
+    def totals(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+        out: Dict[str, Any] = {"calls": len(calls), "prompt_tokens": 0,
+                               "completion_tokens": 0, "cached_tokens": 0, "by_stage": {}}
+        for u in calls:
+            out["prompt_tokens"] += u.prompt_tokens
+            out["completion_tokens"] += u.completion_tokens
+            out["cached_tokens"] += u.cached_tokens
+            stage = out["by_stage"].setdefault(
+                u.stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+            stage["calls"] += 1
+            stage["prompt_tokens"] += u.prompt_tokens
+            stage["completion_tokens"] += u.completion_tokens
+            stage["cached_tokens"] += u.cached_tokens
+        return out
+
+    def as_records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [asdict(u) for u in self.calls]
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = []
+
+
+ledger = UsageLedger()
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    # tiktoken is optional and slow to import, so load it on the first estimate
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            pass
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, using heuristic estimate: {e}")
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a string.
+    Uses tiktoken when installed; otherwise ~4 chars/token for ASCII and
+    ~1 token per non-ASCII char (Devanagari tokenizes poorly).
+    """
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 4) + non_ascii
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    # ~4 tokens of chat-format overhead per message
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
+
+
+def prompt_budget(model: str, max_completion_tokens: Optional[int] = None) -> int:
+    """Tokens available for the prompt once the completion reserve is taken out."""
+    window = CONTEXT_WINDOWS.get(model, BUDGET["default_context_tokens"])
+    reserve = max_completion_tokens or BUDGET["reserve_completion_tokens"]
+    return int((window - reserve) * BUDGET["safety_margin"])
+
+
+def check_budget(prompt_tokens: int, model: str, max_completion_tokens: Optional[int] = None) -> None:
+    budget = prompt_budget(model, max_completion_tokens)
+    if prompt_tokens > budget:
+        raise PromptBudgetError(
+            f"Prompt of ~{prompt_tokens} tokens exceeds budget of {budget} for {model}")
+
+
+def split_to_budget(text: str, max_tokens: int) -> List[str]:
+    """
+    Split text into chunks of at most ~max_tokens, preferring paragraph,
+    then line, then hard character boundaries.
+    """
+    if max_tokens <= 0:
+        raise PromptBudgetError("No token budget left for the input text")
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks: List[str] = []
+    buf: List[str] = []
+    buf_tokens = 0
+
+    def flush():
+        nonlocal buf, buf_tokens
+        if buf:
+            chunks.append("\n\n".join(buf))
+        buf, buf_tokens = [], 0
+
+    for para in re.split(r"\n\s*\n", text):
+        para_tokens = estimate_tokens(para)
+        if para_tokens > max_tokens:
+            flush()
+            chunks.extend(_split_lines(para.split("\n"), max_tokens))
+            continue
+        if buf_tokens + para_tokens > max_tokens:
+            flush()
+        buf.append(para)
+        buf_tokens += para_tokens
+    flush()
+    return chunks
+
+
+def _split_lines(lines: List[str], max_tokens: int) -> List[str]:
+    chunks: List[str] = []
+    buf: List[str] = []
+    buf_tokens = 0
+    for ln in lines:
+        ln_tokens = estimate_tokens(ln)
+        if ln_tokens > max_tokens:
+            if buf:
+                chunks.append("\n".join(buf))
+                buf, buf_tokens = [], 0
+            chunks.extend(_split_hard(ln, max_tokens))
+            continue
+        if buf_tokens + ln_tokens > max_tokens and buf:
+            chunks.append("\n".join(buf))
+            buf, buf_tokens = [], 0
+        buf.append(ln)
+        buf_tokens += ln_tokens
+    if buf:
+        chunks.append("\n".join(buf))
+    return chunks
+
+
+def _split_hard(text: str, max_tokens: int) -> List[str]:
+    # Shrink the window until each piece fits; only hit for giant unbroken lines
+    size = max(1, max_tokens * 4)
+    chunks: List[str] = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        while end - start > 1 and estimate_tokens(text[start:end]) > max_tokens:
+            end = start + (end - start) // 2
+        chunks.append(text[start:end])
+        start = end
+    return chunks
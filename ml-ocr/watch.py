@@ -0,0 +1,420 @@
+"""
+Ingestion daemon: watch upload directories and run the pipeline on new
+documents as soon as they have finished arriving.
+
+- File events come from the OS (inotify on Linux, via watchdog); nothing is
+  rescanned periodically. One scan at startup picks up files that arrived
+  while the daemon was down (skipping those the manifest has as done).
+- Every event is written to a SQLite queue (<out>/watch.db) before anything
+  else happens, so a restart or crash loses nothing: pending and in-flight
+  entries are simply picked up again.
+- Partial writes are debounced: a file is only processed once it has had no
+  events for settle_seconds and its size and mtime are unchanged between two
+  checks. Uploads written under a temporary name and renamed are seen at the
+  rename. A file changed again while being processed is processed again.
+- Documents are processed by the same worker as bulk mode (bulk._process):
+  one JSON result per document under --out, the same manifest, and optionally
+  Postgres, the search index, the Parquet result store and dedup.
+  Unlike bulk mode the sinks are flushed every flush_seconds or
+  flush_documents, whichever comes first, so results show up within seconds
+  without writing a Parquet file per document. An event is only marked done
+  (and the document recorded in the manifest) once its flush has committed;
+  documents not yet flushed at a crash are still "running" in the queue and
+  are processed again on restart.
+
+  python watch.py /srv/uploads/rfq /srv/uploads/responses --out results --workers 4
+"""
+import argparse
+import logging
+import os
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from bulk import DOC_EXTS, Manifest, _process, discover
+
+logger = logging.getLogger(__name__)
+
+# Configure behavior here
+WATCH_CONFIG = {
+    "settle_seconds": float(os.getenv("OCR_WATCH_SETTLE", "2.0")),  # Quiet time before a file counts as written
+    "poll_interval": 0.5,       # Seconds between checks of the queue for settled files
+    "max_attempts": 3,          # Failed documents are retried this many times in total
+    "retry_delay": 60.0,        # Seconds before a failed document is retried
+    "max_in_flight": None,      # Documents handed to the workers at once (None: 2 per worker)
+    "flush_seconds": float(os.getenv("OCR_WATCH_FLUSH", "10.0")),  # Flush the sinks at least this often...
+    "flush_documents": 200,     # ...or once this many documents are buffered
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    status TEXT NOT NULL,           -- pending, running, done, failed
+    generation INTEGER NOT NULL,    -- bumped by every event; a stale run can't mark a newer version done
+    due_at REAL NOT NULL,           -- don't look at the file before this time
+    size INTEGER,                   -- size / mtime at the last check, for the stability test
+    mtime REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS events_due_idx ON events (status, due_at);
+"""
+
+
+class EventQueue:
+    """Persistent queue of file events (one row per path, SQLite)."""
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def touch(self, path: str, root: str, delay: float) -> None:
+        """Record an event for path; it becomes due once no event has come for delay seconds."""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO events (path, root, status, generation, due_at, updated_at) "
+                "VALUES (?, ?, 'pending', 1, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET status = 'pending', generation = generation + 1, "
+                "due_at = excluded.due_at, attempts = 0, error = NULL, updated_at = excluded.updated_at",
+                (path, root, now + delay, now))
+            self.conn.commit()
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM events WHERE path = ? AND status != 'running'", (path,))
+            self.conn.commit()
+
+    def known(self, path: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM events WHERE path = ?", (path,)).fetchone() is not None
+
+    def recover(self) -> int:
+        """After a restart, documents that were being processed are pending again."""
+        with self._lock:
+            n = self.conn.execute("UPDATE events SET status = 'pending' WHERE status = 'running'").rowcount
+            self.conn.commit()
+        return n
+
+    def due(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, root, generation, size, mtime FROM events "
+                "WHERE status = 'pending' AND due_at <= ? ORDER BY due_at LIMIT ?",
+                (time.time(), limit)).fetchall()
+        return [dict(zip(("path", "root", "generation", "size", "mtime"), r)) for r in rows]
+
+    def recheck(self, entry: Dict[str, Any], size: int, mtime: float, delay: float) -> None:
+        """Still changing (or first check): remember size/mtime and look again after delay."""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE events SET size = ?, mtime = ?, due_at = ?, updated_at = ? "
+                "WHERE path = ? AND generation = ?",
+                (size, mtime, time.time() + delay, time.time(), entry["path"], entry["generation"]))
+            self.conn.commit()
+
+    def claim(self, entry: Dict[str, Any]) -> bool:
+        with self._lock:
+            n = self.conn.execute(
+                "UPDATE events SET status = 'running', updated_at = ? "
+                "WHERE path = ? AND generation = ? AND status = 'pending'",
+                (time.time(), entry["path"], entry["generation"])).rowcount
+            self.conn.commit()
+        return n == 1
+
+    def finish(self, entry: Dict[str, Any], ok: bool, error: Optional[str] = None,
+               max_attempts: int = 1, retry_delay: float = 0.0) -> None:
+        """Mark a run's outcome, unless the file changed meanwhile (it is then pending already)."""
+        now = time.time()
+        with self._lock:
+            if ok:
+                self.conn.execute(
+                    "UPDATE events SET status = 'done', error = NULL, updated_at = ? "
+                    "WHERE path = ? AND generation = ?", (now, entry["path"], entry["generation"]))
+            else:
+                self.conn.execute(
+                    "UPDATE events SET attempts = attempts + 1, error = ?, updated_at = ?, "
+                    "status = CASE WHEN attempts + 1 < ? THEN 'pending' ELSE 'failed' END, due_at = ? "
+                    "WHERE path = ? AND generation = ?",
+                    (error, now, max_attempts, now + retry_delay, entry["path"], entry["generation"]))
+            self.conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM events GROUP BY status").fetchall())
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def _make_handler(queue: EventQueue, root: str, settle: float):
+    from watchdog.events import FileSystemEventHandler
+
+    def wanted(path: str) -> bool:
+        name = os.path.basename(path)
+        return not name.startswith(".") and Path(name).suffix.lower() in DOC_EXTS
+
+    class Handler(FileSystemEventHandler):
+        def _file(self, path: str) -> None:
+            if wanted(path):
+                queue.touch(os.path.abspath(path), root, settle)
+
+        def _tree(self, path: str) -> None:
+            # A directory moved in arrives as one event; its files don't get their own
+            for doc in discover([path]):
+                queue.touch(doc["path"], root, settle)
+
+        def on_created(self, event):
+            self._tree(event.src_path) if event.is_directory else self._file(event.src_path)
+
+        def on_modified(self, event):
+            if not event.is_directory:
+                self._file(event.src_path)
+
+        def on_closed(self, event):
+            if not event.is_directory:
+                self._file(event.src_path)
+
+        def on_moved(self, event):
+            if event.is_directory:
+                self._tree(event.dest_path)
+                return
+            if wanted(event.src_path):
+                queue.remove(os.path.abspath(event.src_path))
+            self._file(event.dest_path)
+
+        def on_deleted(self, event):
+            if not event.is_directory:
+                queue.remove(os.path.abspath(event.src_path))
+
+    return Handler()
+
+
+class Watcher:
+    """
+    watcher = Watcher(["/srv/uploads"], "results", workers=4)
+    watcher.run()          # until stop() (SIGINT/SIGTERM from the CLI)
+
+    Keyword arguments after out_dir are passed through as in bulk.run_bulk.
+    """
+
+    def __init__(
+        self,
+        roots: List[str],
+        out_dir: str,
+        workers: int = 4,
+        queue_path: Optional[str] = None,
+        manifest_path: Optional[str] = None,
+        use_llm: bool = True,
+        persist: bool = False,
+        persist_root: Optional[str] = None,
+        index_path: Optional[str] = None,
+        dedup: bool = False,
+        ocr_engine: Optional[str] = None,
+        initial_scan: bool = True,
+        store_path: Optional[str] = None,
+    ):
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.out_dir = out_dir
+        self.workers = workers
+        self.use_llm = use_llm
+        self.ocr_engine = ocr_engine
+        self.initial_scan = initial_scan
+        os.makedirs(out_dir, exist_ok=True)
+        self.queue = EventQueue(queue_path or os.path.join(out_dir, "watch.db"))
+        self.manifest = Manifest(manifest_path or os.path.join(out_dir, "manifest.jsonl"))
+        self.writer = None
+        if persist:
+            from persist import ResultWriter
+            self.writer = ResultWriter(root=persist_root)
+        self.index = None
+        if index_path:
+            from search_index import SearchIndex
+            self.index = SearchIndex(index_path)
+        self.dedup = None
+        if dedup:
+            from dedup import DedupIndex
+            self.dedup = DedupIndex(os.path.join(out_dir, "dedup.db"), ocr_engine=ocr_engine)
+        self.store = None
+        if store_path:
+            from ocr_engines import OCR_CONFIG
+            from result_store import ResultStore
+            self.store = ResultStore(store_path)
+            OCR_CONFIG["word_boxes"] = True
+        self._stop = threading.Event()
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def scan(self) -> int:
+        """Queue documents under the roots that the manifest doesn't have as done."""
+        n = 0
+        for doc in discover(self.roots):
+            if not self.manifest.is_done(doc) and not self.queue.known(doc["path"]):
+                self.queue.touch(doc["path"], doc["root"], 0.0)
+                n += 1
+        return n
+
+    def _finish(self, entry: Dict[str, Any], rec: Dict[str, Any]) -> None:
+        """The document's result is committed everywhere (bulk._process done callback)."""
+        cfg = WATCH_CONFIG
+        if self.index is not None:
+            self.index.commit()
+        self.manifest.record(rec)
+        ok = rec["status"] == "done"
+        self.queue.finish(entry, ok, rec.get("error"), cfg["max_attempts"], cfg["retry_delay"])
+        if ok:
+            logger.info(f"Processed {entry['path']} ({rec['elapsed']:.1f}s)")
+
+    def _work(self, entry: Dict[str, Any]) -> None:
+        cfg = WATCH_CONFIG
+        try:
+            st = os.stat(entry["path"])
+            doc = {"path": entry["path"], "root": entry["root"], "size": st.st_size, "mtime": st.st_mtime}
+            _process(doc, self.out_dir, self.use_llm, self.writer, self.index, self.dedup,
+                     self.ocr_engine, store=self.store, done=lambda rec: self._finish(entry, rec))
+            with self._lock:
+                self._unflushed += 1
+                full = self._unflushed >= cfg["flush_documents"]
+            if full:
+                self.flush()
+        except Exception as e:
+            logger.exception(f"Failed: {entry['path']}")
+            self.queue.finish(entry, False, f"{type(e).__name__}: {e}", cfg["max_attempts"], cfg["retry_delay"])
+        finally:
+            with self._lock:
+                self._in_flight.pop(entry["path"], None)
+
+    def flush(self) -> None:
+        """Commit the buffered sink rows; _finish runs for each document from these flushes."""
+        with self._lock:
+            self._unflushed = 0
+            self._flushed_at = time.monotonic()
+        if self.writer is not None:
+            self.writer.flush()
+        if self.store is not None:
+            self.store.flush()
+
+    def _flush_due(self) -> bool:
+        with self._lock:
+            return (self._unflushed > 0
+                    and time.monotonic() - self._flushed_at >= WATCH_CONFIG["flush_seconds"])
+
+    def _dispatch(self, pool: ThreadPoolExecutor) -> None:
+        cfg = WATCH_CONFIG
+        limit = cfg["max_in_flight"] or 2 * self.workers
+        with self._lock:
+            room = limit - len(self._in_flight)
+        if room <= 0:
+            return
+        # Extra rows: some may be skipped as still in flight or not yet settled
+        for entry in self.queue.due(room + len(self._in_flight)):
+            if entry["path"] in self._in_flight:
+                continue  # Changed while being processed: run again once this run is done
+            try:
+                st = os.stat(entry["path"])
+            except FileNotFoundError:
+                self.queue.remove(entry["path"])
+                continue
+            if (st.st_size, st.st_mtime) != (entry["size"], entry["mtime"]) or st.st_size == 0:
+                self.queue.recheck(entry, st.st_size, st.st_mtime, cfg["settle_seconds"])
+                continue
+            if not self.queue.claim(entry):
+                continue  # A new event arrived since due(); it will settle again
+            with self._lock:
+                self._in_flight[entry["path"]] = entry["generation"]
+            pool.submit(self._work, entry)
+            room -= 1
+            if room == 0:
+                break
+
+    def run(self) -> None:
+        from watchdog.observers import Observer
+
+        settle = WATCH_CONFIG["settle_seconds"]
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info(f"Resuming {recovered} documents that were in flight at the last shutdown")
+        observer = Observer()
+        for root in self.roots:
+            observer.schedule(_make_handler(self.queue, root, settle), root, recursive=True)
+        # Watch first, then scan: a file arriving in between is seen by at least one of them
+        observer.start()
+        if self.initial_scan:
+            logger.info(f"Startup scan queued {self.scan()} documents")
+        logger.info(f"Watching {', '.join(self.roots)} with {self.workers} workers "
+                    f"(queue: {self.queue.counts()})")
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="watch") as pool:
+                while not self._stop.wait(WATCH_CONFIG["poll_interval"]):
+                    self._dispatch(pool)
+                    if self._flush_due():
+                        self.flush()
+                logger.info("Stopping: finishing documents in flight")
+        finally:
+            observer.stop()
+            observer.join()
+            self.close()
+
+    def close(self) -> None:
+        self.flush()  # Before the manifest closes: the flush records what it commits
+        self.manifest.close()
+        if self.writer is not None:
+            self.writer.close()
+        if self.index is not None:
+            self.index.close()
+        if self.dedup is not None:
+            self.dedup.close()
+        if self.store is not None:
+            self.store.close()
+        self.queue.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    from ocr_engines import ENGINES
+
+    parser = argparse.ArgumentParser(description="Watch upload directories and process new documents")
+    parser.add_argument("paths", nargs="+", help="Directories to watch (recursively)")
+    parser.add_argument("--out", default="results", help="Directory for per-document JSON results")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue", help="Event queue database (default: <out>/watch.db)")
+    parser.add_argument("--manifest", help="Progress manifest (default: <out>/manifest.jsonl)")
+    parser.add_argument("--no-llm", action="store_true", help="Skip the LLM cleanup/extraction stages")
+    parser.add_argument("--ocr-engine", choices=sorted(ENGINES),
+                        help="OCR engine (default: OCR_ENGINE env var, else tesseract)")
+    parser.add_argument("--persist", action="store_true", help="Upsert results into Postgres")
+    parser.add_argument("--persist-root", help="Store paths relative to this directory")
+    parser.add_argument("--index", metavar="DB", help="Also add results to this full-text search index")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Reuse results of identical or rescanned documents instead of re-running OCR")
+    parser.add_argument("--store", metavar="DIR",
+                        help="Also write pages, word boxes, timings and fields to this Parquet store")
+    parser.add_argument("--no-initial-scan", action="store_true",
+                        help="Only process files that arrive from now on")
+    args = parser.parse_args()
+
+    watcher = Watcher(args.paths, args.out, workers=args.workers, queue_path=args.queue,
+                      manifest_path=args.manifest, use_llm=not args.no_llm, persist=args.persist,
+                      persist_root=args.persist_root, index_path=args.index, dedup=args.dedup,
+                      ocr_engine=args.ocr_engine, initial_scan=not args.no_initial_scan,
+                      store_path=args.store)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: watcher.stop())
+    watcher.run()
+
+
+if __name__ == "__main__":
+    main()